@@ -1,8 +1,25 @@
 from abc import ABC, abstractmethod
 import re
+import json
 from log import Log
 from ai.line_comment import LineComment
-from ai.prompts import CHAT_GPT_ASK_LONG, PROBLEMS, NO_RESPONSE
+from ai.prompts import CHAT_GPT_ASK_LONG, PROBLEMS, NO_RESPONSE, SUMMARY_BATCH_PROMPT, SUMMARY_BATCH_FILE, \
+    REVIEW_DIFFS_SECTION, REVIEW_CODE_SECTION, REVIEW_MULTI_FILE_NOTE, REVIEW_FOCUS_SECTION, PROMPT_VARIANTS, \
+    TRIAGE_PROMPT, TRIAGE_HUNK, CHAT_GPT_ASK_STRUCTURED, REVIEW_LINES_SECTION
+from ai.finding import Finding
+from ai.tokens import TokenCounter
+
+# Header của một finding theo CHAT_GPT_ASK_LONG: `**[ERROR] - [Warning] - [Type] - description**`
+# (chấp nhận cả dạng có emoji như `[:x:ERROR] - [:warning:Warning]`).
+FINDING_HEADER_PATTERN = re.compile(
+    r"^[\s*]*\[\s*(?::x:\s*)?ERROR\s*\]\s*-\s*\[\s*(?::\w+:\s*)?(Warning|Error|Critical)\s*\]\s*-\s*\[(.*?)\]\s*-\s*(.*)$",
+    re.IGNORECASE | re.MULTILINE)
+# Block `**Lines:**` (hoặc `Lines:`) ngay trước code fence.
+FINDING_LINES_PATTERN = re.compile(r"Lines:\**\s*```[^\n]*\n([\s\S]*?)```")
+FINDING_FIX_PATTERN = re.compile(r"Suggested Fix[^\n]*\n\s*```diff[^\n]*\n([\s\S]*?)```")
+
+# Budget cho code của file được làm tròn theo bước này để các hunk cùng file dùng chung một context.
+CONTEXT_BUDGET_STEP = 512
 
 
 class AiBot(ABC):
@@ -12,48 +29,220 @@ class AiBot(ABC):
     __chat_gpt_ask_long = CHAT_GPT_ASK_LONG 
 
     @abstractmethod
-    def ai_request_diffs(self, code, diffs) -> str:
+    def ai_request_diffs(self, code, diffs, settings=None) -> str:
         pass
 
     @staticmethod
-    def build_ask_text(code, diffs) -> str:
-        """Xây dựng prompt cho AI, bao gồm code và diff."""
+    def review_instructions(prompt_variant=None, structured=False) -> str:
+        """Phần hướng dẫn của prompt review, dùng làm system message.
+
+        Không chứa gì thay đổi theo file hay hunk nên giống hệt nhau từng byte
+        giữa các request cùng variant, nhờ vậy prompt caching của provider áp
+        dụng được cho phần prefix này.
+        """
+        if structured:
+            text = CHAT_GPT_ASK_STRUCTURED.format(problems=AiBot.__problems)
+        else:
+            text = AiBot.__chat_gpt_ask_long.format(
+                problems=AiBot.__problems,
+                no_response=AiBot.__no_response,
+                severity="Warning",
+                type="General",
+                issue_description="Potential issue",
+                line_numbers="<line number>",
+                changed_lines="<changed line>",
+                explanation="",
+                suggested_fix=""
+            )
+        focus = PROMPT_VARIANTS.get(prompt_variant or "default")
+        if focus is None:
+            Log.print_yellow(f"Unknown prompt variant '{prompt_variant}', using default")
+        if focus:
+            text += REVIEW_FOCUS_SECTION.format(focus=focus)
+        return text
+
+    @staticmethod
+    def build_review_messages(code, diffs, max_tokens=None, token_counter=None, prompt_variant=None,
+                              structured=False) -> list[dict]:
+        """Xây dựng các message của request review theo thứ tự ổn định nhất trước:
 
+        1. system: hướng dẫn review (xem `review_instructions`), giống nhau giữa mọi request;
+        2. user: nội dung file, giống nhau giữa các hunk của cùng file;
+        3. user: diff và các vùng dòng thay đổi, khác nhau theo từng request.
+
+        Nếu có `max_tokens`, code của file bị cắt trước (giữ các dòng quanh mọi
+        vùng thay đổi của file, budget làm tròn xuống theo CONTEXT_BUDGET_STEP để
+        các hunk cùng file vẫn nhận cùng một context), sau đó mới tới chính diff.
+        """
         if not diffs:
-            return ""
+            return []
 
         if isinstance(diffs, str):
-            code_to_review = diffs
-            severity = "Warning"
-            issue_type = "General Issue"
-            issue_description = "Potential issue in the changed code."
-            line_numbers = "N/A"
-            changed_lines = "N/A"
-            explanation = ""
-            suggested_fix = ""
-        else:
-            code_to_review = diffs[0].get("code", "") if isinstance(diffs, list) else diffs.get("code", "")
-            severity = diffs[0].get("severity", "Warning") if isinstance(diffs, list) else diffs.get("severity", "Warning")
-            issue_type = diffs[0].get("type", "General Issue") if isinstance(diffs, list) else diffs.get("type", "General Issue")
-            issue_description = diffs[0].get("issue_description", "No description") if isinstance(diffs, list) else diffs.get("issue_description", "No description")
-            line_numbers = diffs[0].get("line_numbers", "N/A") if isinstance(diffs, list) else diffs.get("line_numbers", "N/A")
-            changed_lines = diffs[0].get("changed_lines", "N/A") if isinstance(diffs, list) else diffs.get("changed_lines", "N/A")
-            explanation = diffs[0].get("explanation", "") if isinstance(diffs, list) else diffs.get("explanation", "")
-            suggested_fix = diffs[0].get("suggested_fix", "") if isinstance(diffs, list) else diffs.get("suggested_fix", "")
-
-        return AiBot.__chat_gpt_ask_long.format(
-            problems=AiBot.__problems,
-            no_response=AiBot.__no_response,
-            diffs=code_to_review,
-            code=code,
-            severity=severity,
-            type=issue_type,  
-            issue_description=issue_description,
-            line_numbers=line_numbers,
-            changed_lines=changed_lines,
-            explanation=explanation,
-            suggested_fix=suggested_fix
+            diffs = {"code": diffs}
+        elif isinstance(diffs, list):
+            diffs = diffs[0]
+        code_to_review = diffs.get("code", "")
+        line_numbers = diffs.get("line_numbers", "N/A")
+        context_line_numbers = diffs.get("context_line_numbers") or line_numbers
+        files = diffs.get("files", [])
+
+        instructions = AiBot.review_instructions(prompt_variant, structured)
+
+        def render_hunk(code_to_review):
+            text = REVIEW_DIFFS_SECTION.format(diffs=code_to_review)
+            if line_numbers and line_numbers != "N/A":
+                text += REVIEW_LINES_SECTION.format(line_numbers=line_numbers)
+            if len(files) > 1 and not structured:
+                text += REVIEW_MULTI_FILE_NOTE
+            return text
+
+        def render(code, code_to_review):
+            messages = [{"role": "system", "content": instructions}]
+            if code:
+                messages.append({"role": "user", "content": REVIEW_CODE_SECTION.format(code=code)})
+            messages.append({"role": "user", "content": render_hunk(code_to_review)})
+            return messages
+
+        messages = render(code, code_to_review)
+        if not max_tokens:
+            return messages
+
+        counter = token_counter or TokenCounter()
+        if AiBot.count_message_tokens(messages, counter) <= max_tokens:
+            return messages
+
+        fixed_tokens = AiBot.count_message_tokens(render("", code_to_review), counter)
+        code_budget = (max_tokens - fixed_tokens) // CONTEXT_BUDGET_STEP * CONTEXT_BUDGET_STEP
+        code = AiBot.trim_code(code, context_line_numbers, code_budget, counter)
+        messages = render(code, code_to_review)
+        if AiBot.count_message_tokens(messages, counter) <= max_tokens:
+            return messages
+
+        fixed_tokens = AiBot.count_message_tokens(render("", ""), counter)
+        code_to_review = counter.truncate(code_to_review, max_tokens - fixed_tokens)
+        return render("", code_to_review)
+
+    @staticmethod
+    def count_message_tokens(messages, counter: TokenCounter) -> int:
+        return sum(counter.count(message["content"]) for message in messages)
+
+    @staticmethod
+    def build_ask_text(code, diffs, max_tokens=None, token_counter=None, prompt_variant=None, structured=False) -> str:
+        """Prompt review dạng một đoạn text (nội dung các message của `build_review_messages` nối lại)."""
+        messages = AiBot.build_review_messages(code, diffs, max_tokens=max_tokens, token_counter=token_counter,
+                                               prompt_variant=prompt_variant, structured=structured)
+        return "".join(message["content"] for message in messages)
+
+    @staticmethod
+    def trim_code(code: str, line_numbers: str, max_tokens: int, counter: TokenCounter) -> str:
+        """Giữ các dòng quanh vùng thay đổi (ví dụ "12-18, 40-42") sao cho vừa max_tokens."""
+        if not code or max_tokens <= 0:
+            return ""
+        if counter.count(code) <= max_tokens:
+            return code
+
+        ranges = [(int(start), int(end)) for start, end in re.findall(r"(\d+)-(\d+)", str(line_numbers))]
+        if not ranges:
+            return counter.truncate(code, max_tokens)
+
+        lines = code.splitlines()
+        for context in (200, 100, 50, 20, 5, 0):
+            keep = set()
+            for start, end in ranges:
+                keep.update(range(max(1, start - context), min(len(lines), end + context) + 1))
+
+            trimmed = []
+            previous = 0
+            for number in sorted(keep):
+                if number != previous + 1:
+                    trimmed.append("...")
+                trimmed.append(lines[number - 1])
+                previous = number
+            if previous < len(lines):
+                trimmed.append("...")
+
+            text = "\n".join(trimmed)
+            if counter.count(text) <= max_tokens:
+                return text
+        return ""
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        return TokenCounter().count(text)
+
+    @staticmethod
+    def pack_summary_batches(file_changes: dict, max_tokens: int) -> list[dict]:
+        """Gom nhiều file vào các batch sao cho mỗi batch không vượt quá max_tokens."""
+        batches = []
+        current = {}
+        current_tokens = AiBot.estimate_tokens(SUMMARY_BATCH_PROMPT)
+        for file_name, file_content in file_changes.items():
+            file_tokens = AiBot.estimate_tokens(SUMMARY_BATCH_FILE.format(file_name=file_name, file_content=file_content))
+            if current and current_tokens + file_tokens > max_tokens:
+                batches.append(current)
+                current = {}
+                current_tokens = AiBot.estimate_tokens(SUMMARY_BATCH_PROMPT)
+            current[file_name] = file_content
+            current_tokens += file_tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    @staticmethod
+    def build_summary_batch_text(file_changes: dict) -> str:
+        files = "".join(
+            SUMMARY_BATCH_FILE.format(file_name=file_name, file_content=file_content)
+            for file_name, file_content in file_changes.items()
         )
+        return SUMMARY_BATCH_PROMPT.format(files=files)
+
+    @staticmethod
+    def parse_summary_batch(source: str, file_names) -> dict:
+        """Lấy các summary hợp lệ từ JSON response, bỏ qua key lạ hoặc bị gộp."""
+        if not source:
+            return {}
+        text = source.strip()
+        if text.startswith("```"):
+            text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text)
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        return {
+            file_name: str(data[file_name]).strip()
+            for file_name in file_names
+            if isinstance(data.get(file_name), str) and data[file_name].strip()
+        }
+
+    @staticmethod
+    def build_triage_text(hunks) -> str:
+        """Prompt phân loại nhanh cho danh sách (path, diff) của các hunk, đánh số từ 1."""
+        text = "".join(
+            TRIAGE_HUNK.format(number=number, path=path, diff=diff)
+            for number, (path, diff) in enumerate(hunks, start=1)
+        )
+        return TRIAGE_PROMPT.format(problems=AiBot.__problems, hunks=text)
+
+    @staticmethod
+    def parse_triage(source: str, count: int) -> list[int]:
+        """Trả về chỉ số (từ 0) của các hunk cần review kỹ; response không hợp lệ thì giữ tất cả."""
+        everything = list(range(count))
+        if not source:
+            return everything
+        text = source.strip()
+        if text.startswith("```"):
+            text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text)
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            return everything
+        numbers = data.get("suspicious") if isinstance(data, dict) else None
+        if not isinstance(numbers, list):
+            return everything
+        return sorted({int(number) - 1 for number in numbers
+                       if isinstance(number, (int, float)) and 1 <= int(number) <= count})
 
     @staticmethod
     def is_no_issues_text(source: str) -> bool:
@@ -62,44 +251,103 @@ class AiBot(ABC):
         return source_no_spaces.startswith(target)
 
     @staticmethod
-    def split_ai_response(input, diffs, file_path="") -> list[LineComment]:
+    def is_error_text(source: str) -> bool:
+        """Phản hồi lỗi/rỗng mà ChatGPT trả về thay vì kết quả review."""
+        return source.strip().startswith(("❌", "⚠️"))
+
+    @staticmethod
+    def first_line_number(lines_info: str):
+        """Lấy số dòng đầu tiên trong block `Lines:` (ví dụ "42: foo()", "Line 42-45" hoặc "src/a.ts:42"), hoặc ""."""
+        match = (re.match(r"\s*(?:lines?\s*)?(\d+)", lines_info, re.IGNORECASE)
+                 or re.match(r"\s*[^\s:]+:(?:lines?\s*)?(\d+)", lines_info, re.IGNORECASE))
+        return int(match.group(1)) if match else ""
+
+    @staticmethod
+    def split_ai_response(input, diffs, file_path="", resolve_path=None) -> list[LineComment]:
+        """Tách response thành các LineComment.
+
+        `resolve_path(entry, line)` (tùy chọn) trả về file của từng finding khi
+        một request chứa hunk của nhiều file.
+        """
         if not input:
             return []
 
         comments = []
         entries = re.split(r"###", input.strip())
-        separator = "---\n"
 
         for i, entry in enumerate(entries):
-            entry = entry.strip()
-            if not entry:
+            comment = AiBot.parse_entry(entry, i, file_path=file_path, resolve_path=resolve_path)
+            if comment:
+                comments.append(comment)
+
+        return comments
+
+    @staticmethod
+    def parse_findings(source: str, file_path="", resolve_path=None) -> list[LineComment]:
+        """Chuyển response JSON (structured output) thành các LineComment trong một bước."""
+        if not source:
+            return []
+        try:
+            data = json.loads(source)
+        except json.JSONDecodeError:
+            Log.print_red("Structured review response is not valid JSON, skipping")
+            return []
+        items = data.get("findings") if isinstance(data, dict) else None
+        if not isinstance(items, list):
+            return []
+
+        comments = []
+        for item in items:
+            finding = Finding.from_dict(item)
+            if finding is None:
                 continue
+            path = resolve_path(finding.path, finding.end_line or "") if resolve_path else (finding.path or file_path)
+            comments.append(finding.to_line_comment(len(comments), path))
+        return comments
 
-            comment_text = f"**File:** {file_path}\n\n"
+    @staticmethod
+    def parse_entry(entry, index, file_path="", resolve_path=None):
+        """Chuyển một entry (phần giữa hai dấu `###`) thành LineComment, hoặc None nếu rỗng."""
+        separator = "---\n"
+        entry = entry.strip()
+        if not entry:
+            return None
+
+        comment_text = ""
+        line = ""
+        severity = issue_type = suggested_fix = ""
+        finding_description = entry
 
-            match = re.match(r"\s*\[:x:ERROR\]\s*-\s*\[(:warning:Warning|:x:Error|:bangbang:Critical)\]\s*-\s*\[(.*?)\]\s*-\s*(.*)", entry)
-            if match:
-                severity, issue_type, description = match.groups()
+        match = FINDING_HEADER_PATTERN.search(entry)
+        if match:
+            severity, issue_type, description = match.groups()
+            severity = severity.capitalize()
+            issue_type = issue_type.strip()
+            description = description.strip().rstrip("*").strip()
+            finding_description = description
 
-                lines_match = re.search(r"Lines:\s*```\s*([\s\S]*?)\s*```", entry)
-                lines_info = lines_match.group(1).strip() if lines_match else ""
+            lines_match = FINDING_LINES_PATTERN.search(entry)
+            lines_info = lines_match.group(1).strip() if lines_match else ""
+            line = AiBot.first_line_number(lines_info)
 
-                fix_match = re.search(r":white_check_mark: Suggested Fix \(if applicable\):\s*```diff\s*(.*?)\s*```", entry, re.DOTALL)
-                suggested_fix = fix_match.group(1).strip() if fix_match else ""
+            fix_match = FINDING_FIX_PATTERN.search(entry)
+            suggested_fix = fix_match.group(1).strip() if fix_match else ""
 
-                comment_text += f"**[ERROR] - [{severity}] - [{issue_type}] - {description.strip()}**\n\n"
-                if lines_info:
-                    comment_text += f"**:point_right:Lines:**\n```\n{lines_info}\n```\n\n"
+            comment_text += f"**[ERROR] - [{severity}] - [{issue_type}] - {description}**\n\n"
+            if lines_info:
+                comment_text += f"**:point_right:Lines:**\n```\n{lines_info}\n```\n\n"
 
-                if suggested_fix:
-                    comment_text += f"**Suggested Fix:**\n```diff\n{suggested_fix}\n```\n"
+            if suggested_fix:
+                comment_text += f"**Suggested Fix:**\n```diff\n{suggested_fix}\n```\n"
 
-            else:
-                comment_text += entry
+        else:
+            comment_text += entry
 
-            if i > 0:
-                comment_text = separator + comment_text
+        entry_path = resolve_path(entry, line) if resolve_path else file_path
+        comment_text = f"**File:** {entry_path}\n\n" + comment_text
 
-            comments.append(LineComment(line="", text=comment_text))
+        if index > 0:
+            comment_text = separator + comment_text
 
-        return comments
\ No newline at end of file
+        return LineComment(line=line, text=comment_text, path=entry_path, issue_type=issue_type,
+                           severity=severity, description=finding_description, suggested_fix=suggested_fix)
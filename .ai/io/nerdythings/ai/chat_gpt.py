@@ -1,51 +1,162 @@
 import os
+import time
+import tempfile
+from types import SimpleNamespace
+import openai
 from openai import OpenAI
-import traceback
 import json
 from ai.ai_bot import AiBot
+from ai.prompts import SUMMARY_PROMPT
+from ai.finding import FINDINGS_SCHEMA
+from ai.tokens import TokenCounter
+from log import Log
+from rate_limiter import RateLimiter, RetryableError
+from metrics import Metrics
 
 class ChatGPT(AiBot):
 
-    def __init__(self, token, model):
+    def __init__(self, token, model, prompt_token_budget=None, rate_limiter=None, metrics=None, client=None):
+        """`client` (tùy chọn) là OpenAI client dùng chung giữa các lần review (chế độ server)."""
         self.__chat_gpt_model = model
-        self.__client = OpenAI(api_key=token)
+        self.metrics = metrics or Metrics()
+        # Retry do RateLimiter đảm nhận (dùng chung với GitHub), tắt retry nội bộ của SDK.
+        self.__client = client or ChatGPT.create_client(token)
+        self.__rate_limiter = rate_limiter or RateLimiter("OpenAI", rate=5.0, burst=5)
+        self.__prompt_token_budget = prompt_token_budget
+        self.__token_counter = TokenCounter(model)
+        self.__token_counters = {}
+        self.prompt_token_counts = []
 
-    def ai_request_diffs(self, code, diffs):
-        try:
-            response = self.__client.chat.completions.create(
-                messages=[{
-                    "role": "user",
-                    "content": AiBot.build_ask_text(code=code, diffs=diffs)
-                }],
-                model=self.__chat_gpt_model,
-                stream=False,
-                max_tokens=4096
-            )
+    @staticmethod
+    def create_client(token):
+        return OpenAI(api_key=token, max_retries=0)
 
-            print("🔍 Raw response:", response)
+    def __call_openai(self, name, request, **attributes):
+        """Gọi một API của OpenAI qua rate limiter, thử lại 429/5xx/lỗi kết nối."""
+        def send():
+            self.metrics.count_call("openai")
+            try:
+                with self.metrics.span(name, "openai", **attributes):
+                    return request()
+            except openai.RateLimitError as e:
+                if getattr(e, "code", None) == "insufficient_quota":
+                    raise
+                raise RetryableError(f"OpenAI rate limited: {e}",
+                                     retry_after=RateLimiter.retry_after_seconds(e.response.headers),
+                                     headers=e.response.headers)
+            except openai.InternalServerError as e:
+                raise RetryableError(f"OpenAI server error: {e}", headers=e.response.headers)
+            except openai.APIConnectionError as e:
+                raise RetryableError(f"OpenAI connection error: {e}")
 
-            if response and hasattr(response, "choices") and len(response.choices) > 0:
-                ai_message = response.choices[0].message
-                print("🔍 AI message:", ai_message)
+        return self.__rate_limiter.call(send, on_response=lambda result: getattr(result, "headers", None))
 
-                if hasattr(ai_message, "content") and ai_message.content:
-                    return ai_message.content.strip()
-                else:
-                    return "⚠️ AI không cung cấp phản hồi hợp lệ."
-            return "⚠️ Không nhận được phản hồi từ AI."
-        except Exception as e:
-            import traceback
-            print(f"🚨 API Error: {e}")
-            print(traceback.format_exc())
-            return f"❌ Error occurred: {str(e)}"
+    def __create_completion(self, **kwargs):
+        raw_response = self.__call_openai(
+            "chat.completions",
+            lambda: self.__client.chat.completions.with_raw_response.create(**kwargs),
+            model=kwargs.get("model"), stream=kwargs.get("stream", False)
+        )
+        response = raw_response.parse()
+        if not kwargs.get("stream"):
+            self.metrics.record_usage(getattr(response, "usage", None))
+        return response
 
+    def __token_counter_for(self, model):
+        if model == self.__chat_gpt_model:
+            return self.__token_counter
+        return self.__token_counters.setdefault(model, TokenCounter(model))
 
-    def ai_request_summary(self, file_changes, summary_prompt=None):  # Đổi tên prompt thành summary_prompt để rõ ràng hơn
+    def __review_options(self, settings):
+        """Model, max output tokens và prompt budget của một request theo ReviewSettings (nếu có)."""
+        if settings is None:
+            return self.__chat_gpt_model, 4096, self.__prompt_token_budget, None
+        return (settings.model or self.__chat_gpt_model, settings.max_tokens,
+                settings.context_budget or self.__prompt_token_budget, settings.prompt)
+
+    def __build_review_messages(self, code, diffs, model, prompt_token_budget, prompt_variant, structured=False):
+        token_counter = self.__token_counter_for(model)
+        messages = AiBot.build_review_messages(code=code, diffs=diffs, max_tokens=prompt_token_budget,
+                                               token_counter=token_counter, prompt_variant=prompt_variant,
+                                               structured=structured)
+        prompt_tokens = AiBot.count_message_tokens(messages, token_counter)
+        self.prompt_token_counts.append(prompt_tokens)
+        Log.print_yellow(f"Review prompt: {prompt_tokens} tokens (budget {prompt_token_budget}, model {model})")
+        return messages
+
+    def review_request(self, code, diffs, settings=None, structured=False) -> dict:
+        """Tham số chat.completions của một request review (dùng chung cho gọi trực tiếp và batch)."""
+        model, max_tokens, prompt_token_budget, prompt_variant = self.__review_options(settings)
+        request = {
+            "messages": self.__build_review_messages(code, diffs, model, prompt_token_budget, prompt_variant,
+                                                     structured),
+            "model": model,
+            "max_tokens": max_tokens
+        }
+        if structured:
+            request["response_format"] = {"type": "json_schema", "json_schema": FINDINGS_SCHEMA}
+        return request
+
+    def summary_batch_request(self, batch) -> dict:
+        return {
+            "messages": [{"role": "user", "content": AiBot.build_summary_batch_text(batch)}],
+            "model": self.__chat_gpt_model,
+            "response_format": {"type": "json_object"},
+            "max_tokens": min(4096, 150 * len(batch) + 256)
+        }
+
+    def ai_request_diffs(self, code, diffs, settings=None):
+        """Trả về nội dung review; raise khi request thất bại để lỗi không bị đăng như một finding."""
+        response = self.__create_completion(stream=False, **self.review_request(code, diffs, settings))
+
+        if response and hasattr(response, "choices") and len(response.choices) > 0:
+            ai_message = response.choices[0].message
+
+            if hasattr(ai_message, "content") and ai_message.content:
+                return ai_message.content.strip()
+            raise ValueError("⚠️ AI không cung cấp phản hồi hợp lệ.")
+        raise ValueError("⚠️ Không nhận được phản hồi từ AI.")
+
+    def ai_request_findings(self, code, diffs, settings=None):
+        """Review ở chế độ structured output: trả về JSON `{"findings": [...]}` theo FINDINGS_SCHEMA."""
+        response = self.__create_completion(stream=False, **self.review_request(code, diffs, settings, structured=True))
+        if response and response.choices and response.choices[0].message.content:
+            return response.choices[0].message.content.strip()
+        raise ValueError("⚠️ Không nhận được phản hồi từ AI.")
+
+    def ai_request_diffs_stream(self, code, diffs, settings=None):
+        """Giống ai_request_diffs nhưng trả về từng đoạn text ngay khi model sinh ra."""
+        stream = self.__create_completion(stream=True, stream_options={"include_usage": True},
+                                          **self.review_request(code, diffs, settings))
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                self.metrics.record_usage(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+    def ai_triage(self, hunks, model):
+        """Phân loại nhanh các hunk bằng model nhỏ; trả về chỉ số các hunk đáng ngờ.
+
+        Lỗi request không làm mất review: mọi hunk đều được chuyển lên model chính.
+        """
+        hunks = list(hunks)
         try:
-            print(f"🔍 Debug: type(file_changes) = {type(file_changes)}")
-            print(f"🔍 Debug: file_changes keys = {list(file_changes.keys())}")
-            print(f"🔍 Debug: file_changes (type: {type(file_changes)}): {str(file_changes)[:200]}")
+            response = self.__create_completion(
+                messages=[{"role": "user", "content": AiBot.build_triage_text(hunks)}],
+                model=model,
+                stream=False,
+                response_format={"type": "json_object"},
+                max_tokens=min(1024, 8 * len(hunks) + 32)
+            )
+            content = response.choices[0].message.content if response and response.choices else ""
+        except (RetryableError, openai.OpenAIError) as e:
+            Log.print_red(f"Triage failed, escalating all {len(hunks)} hunks: {e}")
+            return list(range(len(hunks)))
+        return AiBot.parse_triage(content, len(hunks))
 
+    def ai_request_summary(self, file_changes, summary_prompt=None):  # Đổi tên prompt thành summary_prompt để rõ ràng hơn
+        try:
             if isinstance(file_changes, str):
                 try:
                     file_changes = json.loads(file_changes)
@@ -63,10 +174,10 @@ class ChatGPT(AiBot):
                     try:
                         summary_request = summary_prompt.format(file_name=file_name, file_content=file_content)
                     except KeyError as e:
-                        print(f"❌ KeyError: {e}.  Check your summary_prompt for correct variable names.")
+                        Log.print_red(f"KeyError: {e}. Check your summary_prompt for correct variable names.")
                         summary_request = f"Tóm tắt những thay đổi trong file {file_name}:\n{file_content}"  # Fallback
                     except Exception as e:
-                        print(f"❌ Error formatting summary_prompt: {e}")
+                        Log.print_red(f"Error formatting summary_prompt: {e}")
                         summary_request = f"Tóm tắt những thay đổi trong file {file_name}:\n{file_content}"  # Fallback
                 else:
                     summary_request = f"Tóm tắt những thay đổi trong file {file_name}:\n{file_content}"
@@ -74,7 +185,7 @@ class ChatGPT(AiBot):
                 messages.append({"role": "user", "content": summary_request})
 
 
-            response = self.__client.chat.completions.create(
+            response = self.__create_completion(
                 messages=messages,  # Use the list of messages we created.
                 model=self.__chat_gpt_model,
                 stream=False,
@@ -90,6 +201,92 @@ class ChatGPT(AiBot):
             return "⚠️ Không nhận được phản hồi từ AI."
 
         except Exception as e:
-            print(f"🚨 API Error: {e}")
-            print(traceback.format_exc())
-            return f"❌ Error occurred: {str(e)}"
\ No newline at end of file
+            Log.print_red(f"Summary request failed: {e}")
+            return f"❌ Error occurred: {str(e)}"
+
+    def ai_request_summaries(self, file_changes, max_batch_tokens=12000):
+        """Tóm tắt nhiều file trong ít request nhất có thể, trả về dict file -> summary."""
+        summaries = {}
+        batches = AiBot.pack_summary_batches(file_changes, max_batch_tokens)
+        Log.print_green(f"Summarizing {len(file_changes)} files in {len(batches)} batch(es)")
+        for batch in batches:
+            summaries.update(self.__request_summary_batch(batch))
+        return summaries
+
+    def __request_summary_batch(self, batch):
+        if len(batch) == 1:
+            file_name, file_content = next(iter(batch.items()))
+            return {file_name: self.ai_request_summary({file_name: file_content}, summary_prompt=SUMMARY_PROMPT)}
+
+        try:
+            response = self.__create_completion(stream=False, **self.summary_batch_request(batch))
+            content = response.choices[0].message.content if response and response.choices else ""
+        except (RetryableError, openai.OpenAIError) as e:
+            # Chỉ các file của batch này bị đánh dấu lỗi, summary của các batch khác vẫn được giữ.
+            Log.print_red(f"Summary batch of {len(batch)} files failed: {e}")
+            return {file_name: f"❌ Error occurred: {e}" for file_name in batch}
+
+        summaries = AiBot.parse_summary_batch(content, batch.keys())
+        missing = [file_name for file_name in batch if file_name not in summaries]
+        if missing:
+            # Model bỏ sót hoặc gộp file: chia đôi phần còn thiếu và thử lại.
+            Log.print_yellow(f"Summary batch missing {len(missing)}/{len(batch)} files, splitting and retrying")
+            middle = len(missing) // 2 or 1
+            for part in (missing[:middle], missing[middle:]):
+                if part:
+                    summaries.update(self.__request_summary_batch({file_name: batch[file_name] for file_name in part}))
+        return summaries
+
+    def run_batch(self, requests, timeout=3600.0, poll_interval=30.0) -> dict:
+        """Gửi các request qua Batch API của OpenAI và chờ kết quả.
+
+        `requests` là danh sách (custom_id, tham số chat.completions). Trả về dict
+        custom_id -> nội dung response; request lỗi không có trong kết quả.
+        Raise TimeoutError (sau khi hủy batch) nếu quá `timeout` giây.
+        """
+        if not requests:
+            return {}
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", encoding="utf-8", delete=False) as f:
+            for custom_id, body in requests:
+                f.write(json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions",
+                                    "body": body}) + "\n")
+            batch_path = f.name
+
+        try:
+            with open(batch_path, "rb") as f:
+                input_file = self.__call_openai("files.create", lambda: self.__client.files.create(file=f, purpose="batch"))
+        finally:
+            os.remove(batch_path)
+        batch = self.__call_openai("batches.create", lambda: self.__client.batches.create(
+            input_file_id=input_file.id, endpoint="/v1/chat/completions", completion_window="24h"))
+        Log.print_green(f"Submitted batch {batch.id} with {len(requests)} requests")
+
+        started = time.monotonic()
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            if time.monotonic() - started > timeout:
+                Log.print_red(f"Batch {batch.id} did not finish in {timeout:.0f}s, cancelling")
+                self.__call_openai("batches.cancel", lambda: self.__client.batches.cancel(batch.id))
+                raise TimeoutError(f"Batch {batch.id} timed out")
+            time.sleep(poll_interval)
+            batch = self.__call_openai("batches.retrieve", lambda: self.__client.batches.retrieve(batch.id))
+
+        Log.print_green(f"Batch {batch.id} {batch.status} after {time.monotonic() - started:.0f}s")
+        if not batch.output_file_id:
+            raise ValueError(f"Batch {batch.id} {batch.status} without output")
+
+        output = self.__call_openai("files.content", lambda: self.__client.files.content(batch.output_file_id))
+        results = {}
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            response = entry.get("response") or {}
+            body = response.get("body") or {}
+            if entry.get("error") or response.get("status_code") != 200 or not body.get("choices"):
+                Log.print_red(f"Batch request {entry.get('custom_id')} failed: {entry.get('error') or response.get('status_code')}")
+                continue
+            self.metrics.record_usage(SimpleNamespace(**(body.get("usage") or {})))
+            content = body["choices"][0].get("message", {}).get("content")
+            if content:
+                results[entry["custom_id"]] = content.strip()
+        return results
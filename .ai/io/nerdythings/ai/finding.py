@@ -0,0 +1,97 @@
+from typing import Optional
+from ai.line_comment import LineComment
+
+SEVERITY_LABELS = {
+    "Warning": ":warning:Warning",
+    "Error": ":x:Error",
+    "Critical": ":bangbang:Critical",
+}
+
+FINDINGS_SCHEMA = {
+    "name": "review_findings",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "additionalProperties": False,
+        "required": ["findings"],
+        "properties": {
+            "findings": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "additionalProperties": False,
+                    "required": ["path", "start_line", "end_line", "severity", "type", "description", "suggested_fix"],
+                    "properties": {
+                        "path": {"type": "string"},
+                        "start_line": {"type": "integer"},
+                        "end_line": {"type": "integer"},
+                        "severity": {"type": "string", "enum": list(SEVERITY_LABELS)},
+                        "type": {"type": "string"},
+                        "description": {"type": "string"},
+                        "suggested_fix": {"type": "string"},
+                    },
+                },
+            },
+        },
+    },
+}
+
+
+class Finding:
+    """Một finding trả về ở dạng JSON (structured output), được render sang Markdown tại local."""
+
+    def __init__(self, path: str, start_line: int, end_line: int, severity: str, type: str, description: str,
+                 suggested_fix: str = ""):
+        self.path = path
+        self.start_line = start_line
+        self.end_line = max(end_line, start_line) if end_line else start_line
+        self.severity = severity if severity in SEVERITY_LABELS else "Warning"
+        self.type = type
+        self.description = description
+        self.suggested_fix = suggested_fix
+
+    @staticmethod
+    def from_dict(data: dict) -> Optional["Finding"]:
+        if not isinstance(data, dict) or not str(data.get("description") or "").strip():
+            return None
+        try:
+            start_line = int(data.get("start_line") or 0)
+            end_line = int(data.get("end_line") or 0)
+        except (TypeError, ValueError):
+            start_line = end_line = 0
+        return Finding(
+            path=str(data.get("path") or ""),
+            start_line=start_line,
+            end_line=end_line,
+            severity=str(data.get("severity") or "Warning"),
+            type=str(data.get("type") or "General"),
+            description=str(data["description"]).strip(),
+            suggested_fix=str(data.get("suggested_fix") or "").strip(),
+        )
+
+    @property
+    def lines(self) -> str:
+        if not self.start_line:
+            return ""
+        if self.end_line > self.start_line:
+            return f"{self.start_line}-{self.end_line}"
+        return str(self.start_line)
+
+    def to_markdown(self, path: str) -> str:
+        """Render theo cùng định dạng với comment dựng từ response Markdown."""
+        text = f"**File:** {path}\n\n"
+        text += f"**[ERROR] - [{SEVERITY_LABELS[self.severity]}] - [{self.type}] - {self.description}**\n\n"
+        if self.lines:
+            text += f"**:point_right:Lines:**\n```\n{self.lines}\n```\n\n"
+        if self.suggested_fix:
+            text += f"**Suggested Fix:**\n```diff\n{self.suggested_fix}\n```\n"
+        return text
+
+    def to_line_comment(self, index: int, path: str) -> LineComment:
+        text = self.to_markdown(path)
+        if index > 0:
+            text = "---\n" + text
+        return LineComment(line=self.end_line or "", text=text, path=path,
+                           start_line=self.start_line if self.end_line > self.start_line else None,
+                           issue_type=self.type, severity=self.severity, description=self.description,
+                           suggested_fix=self.suggested_fix)
@@ -1,6 +1,13 @@
-
 class LineComment:
 
-    def __init__(self, line: int, text: str):
+    def __init__(self, line: int, text: str, path: str = "", start_line: int = None, issue_type: str = "",
+                 severity: str = "", description: str = "", suggested_fix: str = ""):
         self.line = line
         self.text = text
+        self.path = path
+        self.start_line = start_line
+        # Các trường của finding, dùng để tính fingerprint khi đối chiếu với comment cũ.
+        self.issue_type = issue_type
+        self.severity = severity
+        self.description = description
+        self.suggested_fix = suggested_fix
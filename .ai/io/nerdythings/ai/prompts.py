@@ -16,8 +16,9 @@ CHAT_GPT_ASK_LONG = """
     - **IMPORTANT: Ignore cosmetic changes like whitespace, line breaks, or variable renaming unless they directly impact readability or correctness.  If the diff solely corrects an obvious error (e.g., typo, incorrect variable name) and does not introduce any new potential issues, respond with "{no_response}".**
 
     **Output Format:**
-    Each issue should follow the following Markdown format, resembling a commit log:
+    Start every issue with a line containing only `###`, followed by the issue in the following Markdown format, resembling a commit log:
 
+    ###
     **[ERROR] - [{severity}] - [{type}] - {issue_description}**
 
     **Lines:**
@@ -55,4 +56,88 @@ SUMMARY_PROMPT = """
     File: {file_name}
     Nội dung thay đổi:
     {file_content}
-    """
\ No newline at end of file
+    """
+SUMMARY_BATCH_PROMPT = """
+    Bạn là một chuyên gia tạo mô tả ngắn gọn cho bảng tóm tắt thay đổi code.
+    Với **mỗi file** bên dưới, hãy tóm tắt **ngắn gọn** (tối đa 2 câu) các thay đổi chính.
+    Tập trung vào việc mô tả **những thay đổi** nào đã được thực hiện, thay vì lý do kinh doanh.
+    Sử dụng giọng văn rõ ràng, không kỹ thuật và dễ hiểu cho người không phải là lập trình viên.
+
+    Chỉ trả về một JSON object, mỗi key là **đúng nguyên văn** đường dẫn file, value là bản tóm tắt của file đó.
+    Mỗi file phải có đúng một key riêng, không gộp nhiều file vào một key.
+    Ví dụ: {{"src/a.py": "Thêm hàm xử lý lỗi mới.", "src/b.ts": "Chỉnh sửa giao diện người dùng."}}
+    {files}
+    """
+
+SUMMARY_BATCH_FILE = """
+    ===== File: {file_name} =====
+    {file_content}
+    """
+
+REVIEW_DIFFS_SECTION = """
+    **Diffs:**
+    ```diff
+    {diffs}
+    ```
+"""
+
+REVIEW_LINES_SECTION = """
+    **Changed lines (new file):** {line_numbers}
+"""
+
+REVIEW_CODE_SECTION = """
+    **File context (for reference only, do not review unchanged lines):**
+    ```
+    {code}
+    ```
+"""
+
+REVIEW_MULTI_FILE_NOTE = """
+    **The diffs above contain hunks from several files.** In the `Lines` block of every issue, write the file path
+    and the new line number as `path:line: changed line` so each issue can be mapped back to its file.
+"""
+
+REVIEW_FOCUS_SECTION = """
+    **Review Focus:**
+    {focus}
+"""
+
+PROMPT_VARIANTS = {
+    "default": "",
+    "security": "This code is security sensitive. Look first for injection, unsafe deserialization, missing authorization or input validation, leaked secrets or tokens, and insecure storage or transport of user data.",
+    "ui": "This is user-interface code. Look first for rendering errors, unnecessary re-renders, state and effect bugs, missing loading/error states and accessibility problems. Ignore purely visual styling changes.",
+    "performance": "This code is on a hot path. Look first for unnecessary allocations, repeated work inside loops, blocking I/O and missing caching.",
+}
+
+TRIAGE_PROMPT = """
+    You are triaging code changes before a detailed review.
+    For each numbered hunk below, decide whether it may contain {problems}.
+    Mark a hunk as suspicious when in doubt. Cosmetic changes (formatting, renames, comments, imports, copy text) are clean.
+
+    Respond with a JSON object only: {{"suspicious": [<numbers of the suspicious hunks>]}}
+    Use an empty list when every hunk is clean.
+    {hunks}
+    """
+
+TRIAGE_HUNK = """
+    ===== Hunk {number}: {path} =====
+    {diff}
+    """
+
+CHAT_GPT_ASK_STRUCTURED = """
+    You are an AI code reviewer with expertise in multiple programming languages.
+    Analyze the Git diffs below and report issues **only** in the changed lines: {problems}.
+
+    **Review Guidelines:**
+    - **Syntax Errors**: compilation/runtime failures introduced by the change, including typos and missing operators.
+    - **Logical Errors**: incorrect conditions, infinite loops, unexpected behavior caused by the change.
+    - Ignore cosmetic changes (whitespace, line breaks, renames, comments) and subjective style preferences.
+    - Prioritize security vulnerabilities and performance bottlenecks.
+
+    **Output:** a JSON object matching the provided schema. For each issue:
+    - `path`: the file path from the diff header; `start_line`/`end_line`: the range in the **new** file.
+    - `severity`: Warning, Error or Critical; `type`: a short category (e.g. Security, Performance, Logic).
+    - `description`: one or two sentences explaining the problem and its impact.
+    - `suggested_fix`: the corrected line(s) prefixed with `+`, or an empty string.
+    Return `{{"findings": []}}` when the changed lines have no issues.
+"""
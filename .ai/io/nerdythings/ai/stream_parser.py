@@ -0,0 +1,37 @@
+ENTRY_SEPARATOR = "###"
+
+
+class ReviewStreamParser:
+    """Tách response dạng stream thành các entry `###` ngay khi entry hoàn chỉnh.
+
+    Một entry chỉ được trả về khi đã nhận được dấu `###` kế tiếp, nên các
+    entry (hoặc chính dấu `###`) bị cắt ngang giữa các chunk vẫn được ghép đúng.
+    """
+
+    def __init__(self):
+        self.__buffer = ""
+        self.__index = 0
+
+    def feed(self, delta: str):
+        """Nhận thêm text, trả về danh sách (index, entry) đã hoàn chỉnh."""
+        if not delta:
+            return []
+        self.__buffer += delta
+
+        entries = []
+        while True:
+            position = self.__buffer.find(ENTRY_SEPARATOR)
+            if position < 0:
+                break
+            entry = self.__buffer[:position]
+            self.__buffer = self.__buffer[position + len(ENTRY_SEPARATOR):]
+            entries.append((self.__index, entry))
+            self.__index += 1
+        return entries
+
+    def finish(self):
+        """Trả về entry cuối cùng khi stream kết thúc."""
+        entries = [(self.__index, self.__buffer)] if self.__buffer else []
+        self.__buffer = ""
+        self.__index += 1
+        return entries
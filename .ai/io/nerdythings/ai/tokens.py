@@ -0,0 +1,59 @@
+from log import Log
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken là tùy chọn, fallback sang ước lượng ~4 ký tự/token
+    tiktoken = None
+
+
+class TokenCounter:
+    """Đếm token bằng tokenizer local (tiktoken) nếu có, nếu không thì ước lượng."""
+
+    __encodings = {}
+
+    def __init__(self, model: str = None):
+        self.__encoding = TokenCounter.__load_encoding(model)
+
+    @staticmethod
+    def __load_encoding(model):
+        if tiktoken is None:
+            return None
+        key = model or ""
+        if key not in TokenCounter.__encodings:
+            try:
+                try:
+                    encoding = tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+                except (KeyError, ValueError):
+                    encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                # tiktoken tải file encoding qua mạng ở lần dùng đầu tiên; runner không có mạng thì ước lượng.
+                Log.print_yellow(f"Could not load tiktoken encoding, estimating token counts: {e}")
+                encoding = None
+            TokenCounter.__encodings[key] = encoding
+        return TokenCounter.__encodings[key]
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.__encoding is None:
+            return len(text) // 4 + 1
+        return len(self.__encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cắt text theo dòng sao cho không vượt quá max_tokens."""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+
+        marker = "\n... (truncated)"
+        budget = max_tokens - self.count(marker)
+        kept = []
+        used = 0
+        for line in text.splitlines():
+            line_tokens = self.count(line) + 1
+            if used + line_tokens > budget:
+                break
+            kept.append(line)
+            used += line_tokens
+        return "\n".join(kept) + marker if kept else ""
@@ -0,0 +1,410 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+NO_RESPONSE = "No critical issues found"
+ID_PATTERN = re.compile(r"/(?:file-|batch-)?(?:[0-9a-f]{6,}|\d+)(?=/|$)")
+# Theo đúng "Output Format" của CHAT_GPT_ASK_LONG (ai/prompts.py).
+FINDING_TEMPLATE = """###
+**[ERROR] - [Warning] - [Performance] - Call to compute_fast may be slower than expected**
+
+**Lines:**
+```
+{location}: value = compute_fast(...)
+```
+
+**:interrobang: Explanation:**
+The new call bypasses the cached path.
+
+** :white_check_mark: Suggested Fix (if applicable):**
+```diff
++value = compute_cached(...)
+```
+"""
+MULTI_FILE_MARKER = "contain hunks from several files"
+
+
+class FakeServer:
+    """HTTP server chạy trong thread riêng, đếm request và giả lập latency/429."""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = defaultdict(int)
+        self.bytes_received = 0
+        self.injected_errors = 0
+        self.lock = threading.Lock()
+        self.__random = random.Random(seed)
+        self.__server = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                owner.dispatch(self, "GET")
+
+            def do_POST(self):
+                owner.dispatch(self, "POST")
+
+            def do_PATCH(self):
+                owner.dispatch(self, "PATCH")
+
+            def do_PUT(self):
+                owner.dispatch(self, "PUT")
+
+            def do_DELETE(self):
+                owner.dispatch(self, "DELETE")
+
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.__server.daemon_threads = True
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.__server:
+            self.__server.shutdown()
+            self.__server.server_close()
+
+    def dispatch(self, request, method):
+        length = int(request.headers.get("Content-Length") or 0)
+        raw_body = request.rfile.read(length) if length else b""
+        parsed = urlparse(request.path)
+        route = self.route_name(method, parsed.path)
+        with self.lock:
+            self.calls[route] += 1
+            self.bytes_received += len(raw_body)
+            inject_error = self.__random.random() < self.error_rate
+
+        if self.latency:
+            time.sleep(self.latency)
+        if inject_error:
+            with self.lock:
+                self.injected_errors += 1
+            self.send_json(request, 429, {"message": "rate limited (injected)"}, headers={"Retry-After": "0.2"})
+            return
+
+        content_type = request.headers.get("Content-Type") or ""
+        if raw_body and content_type.startswith("multipart/form-data"):
+            body = FakeServer.multipart_file(raw_body, content_type)
+        else:
+            body = json.loads(raw_body) if raw_body else None
+        self.handle(request, method, parsed.path, parse_qs(parsed.query), body)
+
+    @staticmethod
+    def multipart_file(raw_body: bytes, content_type: str) -> dict:
+        """Parse tối giản multipart/form-data: {field: bytes} (đủ cho `files.create` của SDK)."""
+        boundary = content_type.split("boundary=", 1)[1].strip('"').encode("utf-8")
+        fields = {}
+        for part in raw_body.split(b"--" + boundary):
+            headers, _, content = part.partition(b"\r\n\r\n")
+            name = re.search(rb'name="([^"]+)"', headers)
+            if name:
+                fields[name.group(1).decode("utf-8")] = content[:-2] if content.endswith(b"\r\n") else content
+        return fields
+
+    def route_name(self, method, path) -> str:
+        return f"{method} {ID_PATTERN.sub('/:id', path)}"
+
+    def handle(self, request, method, path, query, body):
+        self.send_json(request, 404, {"message": "not found"})
+
+    @staticmethod
+    def send_json(request, status, data, headers=None):
+        payload = json.dumps(data).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            request.send_header(key, value)
+        request.end_headers()
+        request.wfile.write(payload)
+
+
+class FakeOpenAI(FakeServer):
+    """Giả lập /v1/chat/completions (thường và stream) với response xác định."""
+
+    def __init__(self, finding_rate: float = 0.2, **kwargs):
+        super().__init__(**kwargs)
+        self.finding_rate = finding_rate
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.prompt_prefixes = set()
+        self.files = {}
+        self.batches = {}
+
+    def handle(self, request, method, path, query, body):
+        if method == "POST" and path.endswith("/chat/completions"):
+            self.__chat_completion(request, body)
+        elif method == "POST" and path.endswith("/files"):
+            file_id = self.__add_file(body.get("file", b"").decode("utf-8"))
+            self.send_json(request, 200, {"id": file_id, "object": "file", "bytes": len(self.files[file_id]),
+                                          "created_at": int(time.time()), "filename": "batch.jsonl",
+                                          "purpose": "batch", "status": "processed"})
+        elif method == "GET" and re.search(r"/files/[^/]+/content$", path):
+            self.__send_text(request, self.files.get(path.split("/")[-2], ""))
+        elif method == "POST" and path.endswith("/batches"):
+            batch = self.__create_batch(body)
+            self.send_json(request, 200, batch)
+        elif re.search(r"/batches/[^/]+(/cancel)?$", path):
+            self.__batch_status(request, path)
+        else:
+            super().handle(request, method, path, query, body)
+
+    def __add_file(self, text: str) -> str:
+        with self.lock:
+            file_id = f"file-{len(self.files) + 1}"
+            self.files[file_id] = text
+        return file_id
+
+    @staticmethod
+    def __send_text(request, text):
+        payload = text.encode("utf-8")
+        request.send_response(200)
+        request.send_header("Content-Type", "application/octet-stream")
+        request.send_header("Content-Length", str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+    def __create_batch(self, body) -> dict:
+        """Xử lý ngay toàn bộ batch; trạng thái chuyển sang completed ở lần GET thứ hai."""
+        output = []
+        for line in self.files.get(body["input_file_id"], "").splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            completion = self.__completion_body(entry["body"])
+            output.append(json.dumps({"id": f"batch-req-{len(output)}", "custom_id": entry["custom_id"], "error": None,
+                                      "response": {"status_code": 200, "request_id": "fake", "body": completion}}))
+        output_file_id = self.__add_file("\n".join(output) + "\n")
+        with self.lock:
+            batch_id = f"batch-{len(self.batches) + 1}"
+            batch = {"id": batch_id, "object": "batch", "endpoint": body.get("endpoint"), "errors": None,
+                     "input_file_id": body["input_file_id"], "completion_window": body.get("completion_window"),
+                     "status": "in_progress", "output_file_id": None, "error_file_id": None,
+                     "created_at": int(time.time()), "request_counts": {"total": len(output), "completed": 0, "failed": 0},
+                     "polls": 0, "result_file_id": output_file_id}
+            self.batches[batch_id] = batch
+        return self.__public_batch(batch)
+
+    @staticmethod
+    def __public_batch(batch) -> dict:
+        return {key: value for key, value in batch.items() if key not in ("polls", "result_file_id")}
+
+    def __batch_status(self, request, path):
+        cancel = path.endswith("/cancel")
+        batch_id = path.split("/")[-2] if cancel else path.split("/")[-1]
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                self.send_json(request, 404, {"error": {"message": "batch not found"}})
+                return
+            batch["polls"] += 1
+            if cancel:
+                batch["status"] = "cancelled"
+            elif batch["status"] == "in_progress" and batch["polls"] >= 2:
+                batch["status"] = "completed"
+                batch["output_file_id"] = batch["result_file_id"]
+                batch["request_counts"]["completed"] = batch["request_counts"]["total"]
+            self.send_json(request, 200, self.__public_batch(batch))
+
+    def __is_finding(self, text) -> bool:
+        digest = int(hashlib.sha256(text.strip().encode("utf-8")).hexdigest()[:8], 16)
+        return (digest % 1000) / 1000 < self.finding_rate
+
+    def __response_text(self, body) -> str:
+        prompt = "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            hunks = re.findall(r"===== Hunk (\d+): .+? =====\n([\s\S]*?)(?======|$)", prompt)
+            if hunks:
+                return json.dumps({"suspicious": [int(number) for number, diff in hunks
+                                                  if self.__is_finding(diff)]})
+            files = re.findall(r"===== File: (.+?) =====", prompt)
+            return json.dumps({path: f"Updates computations in {path}." for path in files})
+
+        structured = (body.get("response_format") or {}).get("type") == "json_schema"
+        if not self.__is_finding(prompt):
+            return json.dumps({"findings": []}) if structured else NO_RESPONSE
+        ranges = re.findall(r"@@ -\d+(?:,\d+)? \+(\d+)", prompt)
+        line = int(ranges[0]) + 3 if ranges else 1
+        if structured:
+            paths = re.findall(r"^\+\+\+ b/(.+)$", prompt, re.MULTILINE)
+            return json.dumps({"findings": [{
+                "path": paths[0] if paths else "", "start_line": line, "end_line": line + 1,
+                "severity": "Warning", "type": "Performance",
+                "description": "Call to compute_fast bypasses the cached path.", "suggested_fix": "",
+            }]})
+        if MULTI_FILE_MARKER in prompt:
+            # Request nhiều file: prompt yêu cầu `path:line: changed line`.
+            paths = re.findall(r"^\+\+\+ b/(.+)$", prompt, re.MULTILINE)
+            return FINDING_TEMPLATE.format(location=f"{paths[0]}:{line}" if paths else line)
+        return FINDING_TEMPLATE.format(location=line)
+
+    def __usage(self, body, text) -> dict:
+        """Usage giả lập, kể cả prompt cache: các message đầu trùng với một request trước
+        được tính là cached (như OpenAI: tối thiểu 1024 token, tăng theo bước 128)."""
+        contents = [str(message.get("content", "")) for message in body.get("messages", [])]
+        prompt_tokens = sum(len(content) for content in contents) // 4
+        completion_tokens = len(text) // 4
+        prefix = hashlib.sha256()
+        prefix_chars = cached_chars = 0
+        with self.lock:
+            for content in contents:
+                prefix.update(content.encode("utf-8") + b"\0")
+                prefix_chars += len(content)
+                key = prefix.hexdigest()
+                if key in self.prompt_prefixes:
+                    cached_chars = prefix_chars
+                self.prompt_prefixes.add(key)
+            cached_tokens = cached_chars // 4 // 128 * 128 if cached_chars // 4 >= 1024 else 0
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+            self.completion_tokens += completion_tokens
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens}}
+
+    def __completion_body(self, body) -> dict:
+        text = self.__response_text(body)
+        return {"id": "chatcmpl-benchmark", "object": "chat.completion", "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "usage": self.__usage(body, text),
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}]}
+
+    def __chat_completion(self, request, body):
+        text = self.__response_text(body)
+        usage = self.__usage(body, text)
+        headers = {"x-ratelimit-remaining-requests": "1000", "x-ratelimit-reset-requests": "60ms"}
+        base = {"id": "chatcmpl-benchmark", "created": int(time.time()), "model": body.get("model", "fake")}
+
+        if not body.get("stream"):
+            self.send_json(request, 200, dict(base, object="chat.completion", usage=usage, choices=[{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": text},
+            }]), headers=headers)
+            return
+
+        request.send_response(200)
+        request.send_header("Content-Type", "text/event-stream")
+        request.send_header("Connection", "close")
+        for key, value in headers.items():
+            request.send_header(key, value)
+        request.end_headers()
+        for offset in range(0, len(text), 40):
+            chunk = dict(base, object="chat.completion.chunk", choices=[{
+                "index": 0, "finish_reason": None, "delta": {"content": text[offset:offset + 40]},
+            }])
+            request.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        final = dict(base, object="chat.completion.chunk", choices=[], usage=usage)
+        request.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        request.wfile.flush()
+        request.close_connection = True
+
+
+class FakeGitHub(FakeServer):
+    """Giả lập các endpoint REST của GitHub mà reviewer sử dụng (PR, comment, review)."""
+
+    def __init__(self, owner="bench", repo="repo", pull_number=1, existing_comments=0, **kwargs):
+        super().__init__(**kwargs)
+        self.prefix = f"/repos/{owner}/{repo}"
+        self.pull_number = pull_number
+        self.pull_body = "Benchmark pull request."
+        self.issue_comments = []
+        self.review_comments = []
+        self.reviews = []
+        self.next_id = 1
+        for number in range(existing_comments):
+            self.__add_comment(self.issue_comments, f"Existing comment {number}")
+
+    def __add_comment(self, target, body, **extra):
+        comment = {"id": self.next_id, "body": body, **extra}
+        self.next_id += 1
+        target.append(comment)
+        return comment
+
+    def __send_conditional(self, request, data):
+        etag = '"' + hashlib.sha1(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest() + '"'
+        if request.headers.get("If-None-Match") == etag:
+            request.send_response(304)
+            request.send_header("ETag", etag)
+            request.send_header("Content-Length", "0")
+            request.end_headers()
+            return
+        self.send_json(request, 200, data, headers={"ETag": etag, "X-RateLimit-Remaining": "4999",
+                                                    "X-RateLimit-Reset": str(int(time.time()) + 3600)})
+
+    def __send_page(self, request, path, query, items):
+        per_page = int((query.get("per_page") or ["30"])[0])
+        page = int((query.get("page") or ["1"])[0])
+        data = items[(page - 1) * per_page:page * per_page]
+        if page * per_page < len(items):
+            next_url = f"{self.url}{path}?per_page={per_page}&page={page + 1}"
+            etag = '"' + hashlib.sha1(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest() + '"'
+            self.send_json(request, 200, data, headers={"Link": f'<{next_url}>; rel="next"', "ETag": etag})
+        else:
+            self.__send_conditional(request, data)
+
+    def handle(self, request, method, path, query, body):
+        pull = f"{self.prefix}/pulls/{self.pull_number}"
+        issue_comments = f"{self.prefix}/issues/{self.pull_number}/comments"
+        with self.lock:
+            if path == pull and method == "GET":
+                self.__send_conditional(request, {"number": self.pull_number, "body": self.pull_body})
+            elif path == pull and method == "PATCH":
+                self.pull_body = body.get("body", "")
+                self.send_json(request, 200, {"number": self.pull_number, "body": self.pull_body})
+            elif path == issue_comments and method == "GET":
+                self.__send_page(request, path, query, self.issue_comments)
+            elif path == issue_comments and method == "POST":
+                self.send_json(request, 201, self.__add_comment(self.issue_comments, body["body"]))
+            elif path == f"{pull}/comments" and method == "GET":
+                self.__send_page(request, path, query, self.review_comments)
+            elif path == f"{pull}/reviews" and method == "GET":
+                self.__send_page(request, path, query, self.reviews)
+            elif path == f"{pull}/reviews" and method == "POST":
+                review = {"id": self.next_id, "body": body.get("body", "")}
+                self.next_id += 1
+                self.reviews.append(review)
+                for comment in body.get("comments", []):
+                    self.__add_comment(self.review_comments, comment["body"], path=comment.get("path"),
+                                       line=comment.get("line"))
+                self.send_json(request, 200, review)
+            elif path.startswith(f"{pull}/reviews/") and method == "PUT":
+                self.__update_or_delete(request, "PATCH", self.reviews, path, body)
+            elif path.startswith(f"{self.prefix}/issues/comments/") and method in ("PATCH", "DELETE"):
+                self.__update_or_delete(request, method, self.issue_comments, path, body)
+            elif path.startswith(f"{self.prefix}/pulls/comments/") and method in ("PATCH", "DELETE"):
+                self.__update_or_delete(request, method, self.review_comments, path, body)
+            else:
+                super().handle(request, method, path, query, body)
+
+    def __update_or_delete(self, request, method, comments, path, body):
+        comment_id = int(path.rsplit("/", 1)[-1])
+        comment = next((c for c in comments if c["id"] == comment_id), None)
+        if comment is None:
+            self.send_json(request, 404, {"message": "not found"})
+        elif method == "DELETE":
+            comments.remove(comment)
+            request.send_response(204)
+            request.send_header("Content-Length", "0")
+            request.end_headers()
+        else:
+            comment["body"] = body.get("body", "")
+            self.send_json(request, 200, comment)
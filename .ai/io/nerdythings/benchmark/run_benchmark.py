@@ -0,0 +1,189 @@
+"""Benchmark offline cho github_reviewer.main().
+
+Tạo một repo git tổng hợp, chạy toàn bộ pipeline của reviewer trong một
+process con, trỏ vào các server giả lập OpenAI và GitHub chạy local, rồi in
+ra (và tùy chọn ghi thêm vào file JSONL) wall time, số API call, số token
+gửi đi và peak memory để so sánh giữa các commit.
+
+Ví dụ:
+    python .ai/io/nerdythings/benchmark/run_benchmark.py --files 100 --hunks 4 \\
+        --latency 0.3 --error-rate 0.05 --output bench.jsonl
+    python .ai/io/nerdythings/benchmark/run_benchmark.py --files 500 \\
+        --env REVIEW_BATCH=true --env REVIEW_BATCH_POLL_SECONDS=0.2
+    python .ai/io/nerdythings/benchmark/run_benchmark.py --files 50 --server
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REVIEWER_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+from fake_servers import FakeGitHub, FakeOpenAI
+from synthetic_repo import create_repository
+
+OWNER = "bench"
+REPO = "repo"
+PULL_NUMBER = 1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for the AI PR reviewer.")
+    parser.add_argument("--files", type=int, default=20, help="number of changed files")
+    parser.add_argument("--hunks", type=int, default=3, help="hunks per changed file")
+    parser.add_argument("--file-lines", type=int, default=200, help="lines per file")
+    parser.add_argument("--existing-comments", type=int, default=0, help="comments already on the PR")
+    parser.add_argument("--latency", type=float, default=0.0, help="latency in seconds added to every fake API call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake API calls answered with 429")
+    parser.add_argument("--finding-rate", type=float, default=0.2, help="fraction of review requests that return a finding")
+    parser.add_argument("--repeat", type=int, default=1, help="number of runs; the report uses the median wall time")
+    parser.add_argument("--env", action="append", default=[], help="extra KEY=VALUE passed to the reviewer")
+    parser.add_argument("--output", help="append the JSON result to this JSONL file")
+    parser.add_argument("--server", action="store_true",
+                        help="run through review_server.py --replay (git mirror and worktree) instead of github_reviewer.py")
+    parser.add_argument("--verbose", action="store_true", help="show the reviewer's output")
+    return parser.parse_args(argv)
+
+
+def event_payload(base_sha, head_sha):
+    return {
+        "action": "synchronize",
+        "number": PULL_NUMBER,
+        "before": base_sha,
+        "after": head_sha,
+        "pull_request": {
+            "number": PULL_NUMBER,
+            "base": {"ref": "main", "repo": {"name": REPO, "owner": {"login": OWNER}}},
+            "head": {"sha": head_sha},
+        },
+    }
+
+
+def reviewer_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REVIEWER_DIR, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def run_once(args, work_dir, run_number):
+    repo_path = os.path.join(work_dir, f"repo-{run_number}")
+    base_sha, head_sha, _ = create_repository(repo_path, files=args.files, hunks=args.hunks,
+                                              file_lines=args.file_lines)
+
+    event_path = os.path.join(work_dir, f"event-{run_number}.json")
+    with open(event_path, "w", encoding="utf-8") as f:
+        json.dump(event_payload(base_sha, head_sha), f)
+
+    openai_server = FakeOpenAI(finding_rate=args.finding_rate, latency=args.latency, error_rate=args.error_rate).start()
+    github_server = FakeGitHub(OWNER, REPO, PULL_NUMBER, existing_comments=args.existing_comments,
+                               latency=args.latency, error_rate=args.error_rate).start()
+    report_path = os.path.join(work_dir, f"report-{run_number}.json")
+
+    env = dict(os.environ)
+    env.pop("GITHUB_STEP_SUMMARY", None)
+    env.update({
+        "GITHUB_EVENT_NAME": "pull_request",
+        "GITHUB_EVENT_PATH": event_path,
+        "GITHUB_WORKSPACE": repo_path,
+        "GITHUB_TOKEN": "benchmark-token",
+        "GITHUB_API_URL": github_server.url,
+        "CHATGPT_KEY": "benchmark-key",
+        "CHATGPT_MODEL": "gpt-4o-mini",
+        "OPENAI_BASE_URL": f"{openai_server.url}/v1",
+        "REVIEW_REPORT_PATH": report_path,
+        "REVIEW_CACHE_DIR": os.path.join(work_dir, f"cache-{run_number}"),
+    })
+    server_dir = os.path.join(work_dir, f"server-{run_number}")
+    if args.server:
+        env["REVIEW_SERVER_DIR"] = server_dir
+        # Server clone từ GITHUB_SERVER_URL/<owner>/<repo>.git: trỏ vào repo tổng hợp qua một symlink local.
+        git_server = os.path.join(work_dir, f"git-server-{run_number}")
+        os.makedirs(os.path.join(git_server, OWNER))
+        os.symlink(repo_path, os.path.join(git_server, OWNER, f"{REPO}.git"))
+        env["GITHUB_SERVER_URL"] = f"file://{git_server}"
+        command = [sys.executable, os.path.join(REVIEWER_DIR, "review_server.py"), "--replay", event_path]
+    else:
+        command = [sys.executable, os.path.join(REVIEWER_DIR, "github_reviewer.py")]
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=repo_path,
+                            env=env, stdout=None if args.verbose else subprocess.DEVNULL,
+                            stderr=None if args.verbose else subprocess.PIPE, text=True)
+    wall_seconds = time.perf_counter() - started
+
+    openai_server.stop()
+    github_server.stop()
+
+    if args.server:
+        # Server ghi báo cáo của từng lần review vào thư mục reports của nó.
+        reports_dir = os.path.join(server_dir, "reports")
+        reports = sorted(os.listdir(reports_dir)) if os.path.isdir(reports_dir) else []
+        report_path = os.path.join(reports_dir, reports[0]) if reports else report_path
+    report = {}
+    if os.path.exists(report_path):
+        with open(report_path, "r", encoding="utf-8") as f:
+            report = json.load(f)
+
+    return {
+        "exit_code": result.returncode,
+        "stderr_tail": (result.stderr or "")[-2000:] if result.returncode else "",
+        "wall_seconds": round(wall_seconds, 3),
+        "openai": {
+            "calls": sum(openai_server.calls.values()),
+            "routes": dict(openai_server.calls),
+            "injected_429": openai_server.injected_errors,
+            "prompt_tokens": openai_server.prompt_tokens,
+            "cached_prompt_tokens": openai_server.cached_tokens,
+            "completion_tokens": openai_server.completion_tokens,
+            "bytes_sent": openai_server.bytes_received,
+        },
+        "github": {
+            "calls": sum(github_server.calls.values()),
+            "routes": dict(github_server.calls),
+            "injected_429": github_server.injected_errors,
+            "comments_on_pr": len(github_server.issue_comments) + len(github_server.review_comments),
+        },
+        "report_stages": report.get("stages", {}),
+        "report_counters": report.get("counters", {}),
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="ai-review-bench-") as work_dir:
+        for run_number in range(args.repeat):
+            runs.append(run_once(args, work_dir, run_number))
+
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    median_run = sorted(runs, key=lambda run: run["wall_seconds"])[len(runs) // 2]
+    result = {
+        "commit": reviewer_commit(),
+        "timestamp": int(time.time()),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "verbose")},
+        "wall_seconds": median_run["wall_seconds"],
+        "wall_seconds_all": [run["wall_seconds"] for run in runs],
+        "peak_rss_mb": round(peak_rss_kb / 1024, 1),
+        **{key: value for key, value in median_run.items() if key != "wall_seconds"},
+    }
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+    return 0 if all(run["exit_code"] == 0 for run in runs) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
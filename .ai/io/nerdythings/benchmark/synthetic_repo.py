@@ -0,0 +1,61 @@
+import os
+import random
+import subprocess
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "benchmark",
+    "GIT_AUTHOR_EMAIL": "benchmark@example.com",
+    "GIT_COMMITTER_NAME": "benchmark",
+    "GIT_COMMITTER_EMAIL": "benchmark@example.com",
+}
+
+
+def git(repo_path, *args) -> str:
+    env = dict(os.environ, **GIT_ENV)
+    result = subprocess.run(["git", *args], cwd=repo_path, env=env, check=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    return result.stdout.strip()
+
+
+def file_line(file_number: int, line_number: int) -> str:
+    return f"    value_{file_number}_{line_number} = compute({line_number}, factor={file_number})"
+
+
+def create_repository(repo_path: str, files: int = 20, hunks: int = 3, file_lines: int = 200, seed: int = 1):
+    """Tạo một repo git có commit base và head, trả về (base_sha, head_sha, changed_paths).
+
+    Mỗi file có `file_lines` dòng; head sửa `hunks` vị trí cách xa nhau trong
+    mỗi file để git tạo ra đúng `hunks` hunk riêng biệt.
+    """
+    rng = random.Random(seed)
+    os.makedirs(repo_path, exist_ok=True)
+    git(repo_path, "init", "-q", "-b", "main")
+
+    paths = []
+    for file_number in range(files):
+        path = os.path.join(f"src/module_{file_number % 10}", f"file_{file_number}.py")
+        paths.append(path)
+        full_path = os.path.join(repo_path, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w", encoding="utf-8") as f:
+            f.write(f"def function_{file_number}():\n")
+            f.write("\n".join(file_line(file_number, line) for line in range(1, file_lines)) + "\n")
+
+    git(repo_path, "add", "-A")
+    git(repo_path, "commit", "-q", "-m", "base")
+    base_sha = git(repo_path, "rev-parse", "HEAD")
+
+    spacing = max(1, file_lines // max(1, hunks))
+    for file_number, path in enumerate(paths):
+        full_path = os.path.join(repo_path, path)
+        with open(full_path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        for hunk in range(hunks):
+            start = min(len(lines) - 1, hunk * spacing + rng.randint(1, max(1, spacing // 2)))
+            lines[start] = lines[start].replace("compute(", "compute_fast(") + "  # changed"
+        with open(full_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    git(repo_path, "commit", "-q", "-am", "head")
+    head_sha = git(repo_path, "rev-parse", "HEAD")
+    return base_sha, head_sha, paths
@@ -0,0 +1,99 @@
+import fnmatch
+import posixpath
+from typing import Dict, Iterable, Optional
+from log import Log
+from git_utils import GitUtils
+
+GIT_ATTRIBUTES = ["linguist-generated", "linguist-vendored", "diff", "binary"]
+
+DEFAULT_SKIP_PATTERNS = {
+    "lockfile": [
+        "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "bun.lockb", "npm-shrinkwrap.json",
+        "Podfile.lock", "Gemfile.lock", "poetry.lock", "Pipfile.lock", "Cargo.lock",
+        "composer.lock", "go.sum", "gradle.lockfile",
+    ],
+    "minified": ["*.min.js", "*.min.css", "*.bundle.js", "*.map"],
+    "vendored": ["vendor/**", "node_modules/**", "third_party/**", "Pods/**"],
+    "generated": ["*.pb.go", "*_pb2.py", "*.g.dart", "*.generated.*", "*.snap"],
+    "asset": [
+        "assets/**", "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.ico", "*.svg",
+        "*.ttf", "*.otf", "*.woff", "*.woff2", "*.mp3", "*.mp4", "*.pdf", "*.zip",
+    ],
+}
+
+
+class ChangeClassifier:
+    """Phân loại file thay đổi không cần AI review (lockfile, binary, generated, vendored...).
+
+    Dựa trên cờ binary của `git diff --numstat`, thuộc tính `.gitattributes`
+    (`linguist-generated`, `linguist-vendored`, `-diff`, `binary`) và các glob
+    pattern có thể cấu hình. File bị phân loại chỉ nhận summary thống kê.
+    """
+
+    def __init__(self, patterns: Dict[str, Iterable[str]] = None, extra_patterns: Iterable[str] = (),
+                 use_git_attributes: bool = True):
+        self.patterns = {category: list(values) for category, values in (patterns or DEFAULT_SKIP_PATTERNS).items()}
+        extra_patterns = [pattern.strip() for pattern in extra_patterns if pattern.strip()]
+        if extra_patterns:
+            self.patterns.setdefault("excluded", []).extend(extra_patterns)
+        self.use_git_attributes = use_git_attributes
+
+    @staticmethod
+    def matches(path: str, pattern: str) -> bool:
+        """Glob theo kiểu `.gitignore`: `dir/**` khớp thư mục ở mọi cấp, pattern không có `/` khớp tên file."""
+        if pattern.endswith("/**"):
+            directory = pattern[:-3].strip("/")
+            return path.startswith(directory + "/") or f"/{directory}/" in path
+        if "/" in pattern:
+            return fnmatch.fnmatchcase(path, pattern.lstrip("/"))
+        return fnmatch.fnmatchcase(posixpath.basename(path), pattern)
+
+    @staticmethod
+    def __attribute_category(attributes: dict) -> Optional[str]:
+        if attributes.get("binary") == "set" or attributes.get("diff") == "unset":
+            return "binary"
+        if attributes.get("linguist-generated") in ("set", "true"):
+            return "generated"
+        if attributes.get("linguist-vendored") in ("set", "true"):
+            return "vendored"
+        return None
+
+    def classify(self, path: str, file_diff=None, attributes: dict = None) -> Optional[str]:
+        """Trả về loại của file cần bỏ qua, hoặc None nếu file cần được review."""
+        if file_diff is not None and file_diff.binary:
+            return "binary"
+        category = ChangeClassifier.__attribute_category(attributes or {})
+        if category:
+            return category
+        for category, patterns in self.patterns.items():
+            if any(ChangeClassifier.matches(path, pattern) for pattern in patterns):
+                return category
+        return None
+
+    def classify_all(self, paths, diff_index) -> Dict[str, str]:
+        """Phân loại tất cả file trong một lần `git check-attr`: {path: category} của các file bị bỏ qua."""
+        paths = list(paths)
+        attributes = {}
+        if self.use_git_attributes and paths:
+            try:
+                attributes = GitUtils.get_attributes(paths, GIT_ATTRIBUTES)
+            except Exception as e:
+                Log.print_yellow(f"Could not read .gitattributes, using patterns only: {e}")
+
+        skipped = {}
+        for path in paths:
+            category = self.classify(path, diff_index.get(path), attributes.get(path))
+            if category:
+                skipped[path] = category
+        if skipped:
+            Log.print_yellow(f"Skipping AI review for {len(skipped)} files: {skipped}")
+        return skipped
+
+    @staticmethod
+    def stats_summary(category: str, file_diff) -> str:
+        """Summary thống kê (không gọi AI) cho file bị bỏ qua."""
+        if file_diff is None:
+            return f"Skipped ({category})."
+        if file_diff.binary:
+            return f"Skipped ({category}): binary file {'added' if file_diff.is_new else 'deleted' if file_diff.is_deleted else 'changed'}."
+        return f"Skipped ({category}): +{file_diff.added} / -{file_diff.deleted} lines."
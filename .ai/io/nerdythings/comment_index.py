@@ -0,0 +1,183 @@
+import hashlib
+from typing import List, Optional
+from log import Log
+from finding_fingerprint import FindingFingerprint
+from review_body import ReviewBody
+
+
+class CommentIndex:
+    """Chỉ mục comment của PR trong một lần chạy.
+
+    Tải tất cả các trang comment một lần duy nhất, đánh chỉ mục theo hash của
+    body, theo các identifier ẩn (ví dụ OWNER_COMMENT_IDENTIFIER) và theo
+    fingerprint của finding, và được cập nhật tại chỗ khi post, sửa hoặc xóa
+    comment để không cần gọi lại API.
+
+    Comment có fingerprint được tham chiếu bằng `(kind, id)` với kind là
+    "issue" (comment chung) hoặc "review" (comment gắn vào dòng); finding nằm
+    trong body của một review được tham chiếu bằng `("body", review_id, section_id)`.
+    """
+
+    def __init__(self, github, identifiers=(), include_review_comments=False):
+        self.__github = github
+        self.__identifiers = tuple(identifiers)
+        self.__include_review_comments = include_review_comments
+        self.__review_body_hashes = set()
+        self.__reviews = {}
+        self.__comments = {}
+        self.__by_body_hash = {}
+        self.__by_identifier = {}
+        self.__fingerprints = {}
+        self.__loaded = False
+
+    @staticmethod
+    def body_hash(body: str) -> str:
+        """Hash của body, không tính marker fingerprint (khớp cả comment cũ chưa có fingerprint)."""
+        return hashlib.sha256(FindingFingerprint.strip(body).strip().encode("utf-8")).hexdigest()
+
+    def __ensure_loaded(self):
+        if self.__loaded:
+            return
+        comments = self.__github.get_comments()
+        Log.print_green(f"Loaded {len(comments)} existing comments")
+        for comment in comments:
+            self.__add(comment)
+        if self.__include_review_comments:
+            review_comments = self.__github.get_review_comments()
+            Log.print_green(f"Loaded {len(review_comments)} existing review comments")
+            self.__review_body_hashes.update(CommentIndex.body_hash(c.get("body")) for c in review_comments)
+            for comment in review_comments:
+                self.__index_fingerprint(("review", comment["id"]), comment)
+            # Finding không gắn được vào dòng nằm trong body của review.
+            for review in self.__github.get_reviews():
+                self.__add_review(review)
+        self.__loaded = True
+
+    def __index_fingerprint(self, ref, comment: dict):
+        fingerprint = FindingFingerprint.parse(comment.get("body"))
+        if fingerprint:
+            self.__fingerprints[ref] = (fingerprint, comment)
+        else:
+            self.__fingerprints.pop(ref, None)
+
+    def __add_review(self, review: dict):
+        review_id = review["id"]
+        self.__reviews[review_id] = review
+        for ref in [ref for ref in self.__fingerprints if ref[0] == "body" and ref[1] == review_id]:
+            del self.__fingerprints[ref]
+        body = ReviewBody.parse(review.get("body"))
+        for section in body.sections if body else ():
+            self.__index_fingerprint(("body", review_id, ReviewBody.section_id(section)), {"id": review_id, "body": section})
+
+    def __rewrite_review(self, review_id, section_id: str, text: Optional[str]) -> dict:
+        """Sửa (hoặc xóa khi `text` là None) một finding trong body của review và gửi lại cả body."""
+        review = self.__reviews.get(review_id, {"id": review_id})
+        body = ReviewBody.parse(review.get("body"))
+        if body is None or not body.replace(section_id, text):
+            return review
+        new_body = body.render()
+        updated = self.__github.update_review(review_id, new_body)
+        if not updated or "id" not in updated:
+            updated = dict(review, body=new_body)
+        self.__add_review(updated)
+        return updated
+
+    def __add(self, comment: dict):
+        comment_id = comment["id"]
+        previous = self.__comments.get(comment_id)
+        if previous is not None:
+            self.__remove_keys(previous)
+
+        self.__comments[comment_id] = comment
+        body = comment.get("body") or ""
+        self.__by_body_hash[CommentIndex.body_hash(body)] = comment
+        for identifier in self.__identifiers:
+            if identifier in body:
+                self.__by_identifier.setdefault(identifier, comment)
+        self.__index_fingerprint(("issue", comment_id), comment)
+
+    def __remove_keys(self, comment: dict):
+        body = comment.get("body") or ""
+        body_hash = CommentIndex.body_hash(body)
+        if self.__by_body_hash.get(body_hash) is comment:
+            del self.__by_body_hash[body_hash]
+        for identifier in self.__identifiers:
+            if self.__by_identifier.get(identifier) is comment:
+                del self.__by_identifier[identifier]
+
+    def contains_body(self, body: str) -> bool:
+        self.__ensure_loaded()
+        body_hash = CommentIndex.body_hash(body)
+        if body_hash in self.__by_body_hash or body_hash in self.__review_body_hashes:
+            return True
+        text = FindingFingerprint.strip(body).strip()
+        return bool(text) and any(text in (review.get("body") or "") for review in self.__reviews.values())
+
+    def add_review(self, review: dict, comment_bodies):
+        """Ghi nhận review vừa được gửi: body của nó và các inline comment đi kèm."""
+        self.__ensure_loaded()
+        self.__review_body_hashes.update(CommentIndex.body_hash(body) for body in comment_bodies)
+        if review and "id" in review:
+            self.__add_review(review)
+
+    def find_by_identifier(self, identifier: str) -> Optional[dict]:
+        self.__ensure_loaded()
+        return self.__by_identifier.get(identifier)
+
+    def post(self, text: str) -> dict:
+        self.__ensure_loaded()
+        comment = self.__github.post_comment_general(text)
+        if not comment or "id" not in comment:
+            comment = {"id": f"local-{len(self.__comments)}", "body": text}
+        self.__add(comment)
+        return comment
+
+    def update(self, comment_id, text: str) -> dict:
+        self.__ensure_loaded()
+        comment = self.__github.update_comment(comment_id, text)
+        if not comment or "id" not in comment:
+            comment = dict(self.__comments.get(comment_id, {"id": comment_id}), body=text)
+        self.__add(comment)
+        return comment
+
+    def fingerprinted(self) -> List[tuple]:
+        """Tất cả comment có fingerprint: danh sách (ref, fingerprint, comment)."""
+        self.__ensure_loaded()
+        return [(ref, fingerprint, comment) for ref, (fingerprint, comment) in self.__fingerprints.items()]
+
+    def match_fingerprint(self, fingerprint: FindingFingerprint, exclude=()) -> Optional[tuple]:
+        """Comment có fingerprint khớp gần nhất (xem FindingFingerprint.matches), bỏ qua các ref trong `exclude`."""
+        candidates = [(existing.distance(fingerprint), ref, existing, comment)
+                      for ref, existing, comment in self.fingerprinted()
+                      if ref not in exclude and existing.matches(fingerprint)]
+        if not candidates:
+            return None
+        _, ref, existing, comment = min(candidates, key=lambda candidate: candidate[0])
+        return ref, existing, comment
+
+    def update_fingerprinted(self, ref, text: str) -> dict:
+        kind, comment_id = ref[:2]
+        if kind == "issue":
+            return self.update(comment_id, text)
+        if kind == "body":
+            return self.__rewrite_review(comment_id, ref[2], text)
+        comment = self.__github.update_review_comment(comment_id, text)
+        if not comment or "id" not in comment:
+            comment = dict(self.__fingerprints.get(ref, (None, {"id": comment_id}))[1], body=text)
+        self.__review_body_hashes.add(CommentIndex.body_hash(text))
+        self.__index_fingerprint(ref, comment)
+        return comment
+
+    def delete_fingerprinted(self, ref):
+        kind, comment_id = ref[:2]
+        if kind == "issue":
+            self.__github.delete_comment(comment_id)
+            comment = self.__comments.pop(comment_id, None)
+            if comment is not None:
+                self.__remove_keys(comment)
+        elif kind == "body":
+            # Review đã gửi không xóa được: gỡ finding khỏi body của nó.
+            self.__rewrite_review(comment_id, ref[2], None)
+        else:
+            self.__github.delete_review_comment(comment_id)
+        self.__fingerprints.pop(ref, None)
@@ -0,0 +1,124 @@
+import os
+from typing import List, Optional
+from diff_index import DiffHunk, DiffIndex
+
+
+class HunkPiece:
+    """Một hunk (hoặc một phần của hunk quá lớn) thuộc về một file."""
+
+    def __init__(self, path: str, hunk: DiffHunk, tokens: int):
+        self.path = path
+        self.hunk = hunk
+        self.tokens = tokens
+
+
+class ReviewChunk:
+    """Nhóm các hunk được gửi chung trong một request review."""
+
+    def __init__(self):
+        self.pieces: List[HunkPiece] = []
+        self.tokens = 0
+
+    def add(self, piece: HunkPiece):
+        self.pieces.append(piece)
+        self.tokens += piece.tokens
+
+    @property
+    def files(self) -> List[str]:
+        return list(dict.fromkeys(piece.path for piece in self.pieces))
+
+    @property
+    def text(self) -> str:
+        lines = []
+        current_path = None
+        for piece in self.pieces:
+            if piece.path != current_path:
+                current_path = piece.path
+                lines.extend([f"diff --git a/{current_path} b/{current_path}", f"--- a/{current_path}", f"+++ b/{current_path}"])
+            lines.append(piece.hunk.text)
+        return "\n".join(lines) + "\n"
+
+    def subset(self, indices) -> "ReviewChunk":
+        """Chunk mới chỉ gồm các piece ở vị trí `indices` (giữ nguyên thứ tự)."""
+        chunk = ReviewChunk()
+        for index in sorted(indices):
+            chunk.add(self.pieces[index])
+        return chunk
+
+    def line_numbers(self, path: str = None) -> str:
+        return ", ".join(
+            f"{piece.hunk.new_start}-{piece.hunk.new_end}"
+            for piece in self.pieces
+            if path is None or piece.path == path
+        )
+
+    def locate(self, line, text: str = "") -> Optional[HunkPiece]:
+        """Tìm hunk nguồn của một finding theo đường dẫn được nhắc tới và số dòng."""
+        files = self.files
+        mentioned = [path for path in files if path in text]
+        candidates = mentioned or files
+        if isinstance(line, int):
+            for piece in self.pieces:
+                if piece.path in candidates and piece.hunk.contains_new_line(line):
+                    return piece
+        for piece in self.pieces:
+            if piece.path in candidates:
+                return piece
+        return None
+
+
+class DiffChunker:
+    """Chia diff theo ranh giới hunk, cắt hunk quá dài theo số dòng và
+    gom các hunk nhỏ của cùng file/thư mục vào chung một request.
+    """
+
+    def __init__(self, token_counter, target_tokens: int = 1500, max_hunk_lines: int = 150):
+        self.token_counter = token_counter
+        self.target_tokens = target_tokens
+        self.max_hunk_lines = max(1, max_hunk_lines)
+
+    def split_hunk(self, hunk: DiffHunk) -> List[DiffHunk]:
+        """Cắt một hunk dài thành nhiều hunk hợp lệ, mỗi hunk tối đa max_hunk_lines dòng."""
+        if len(hunk.lines) <= self.max_hunk_lines:
+            return [hunk]
+
+        pieces = []
+        old_line = hunk.old_start
+        new_line = hunk.new_start
+        for offset in range(0, len(hunk.lines), self.max_hunk_lines):
+            lines = hunk.lines[offset:offset + self.max_hunk_lines]
+            old_count = sum(1 for line in lines if not line.startswith(("+", "\\")))
+            new_count = sum(1 for line in lines if not line.startswith(("-", "\\")))
+            header = f"@@ -{old_line},{old_count} +{new_line},{new_count} @@"
+            piece = DiffHunk(header, old_line, old_count, new_line, new_count)
+            piece.lines = lines
+            pieces.append(piece)
+            old_line += old_count
+            new_line += new_count
+        return pieces
+
+    def chunk(self, diff_index: DiffIndex, files: List[str], group_key=None) -> List[ReviewChunk]:
+        """`group_key(path)` (tùy chọn) ngăn gom các file có cấu hình review khác nhau vào một request."""
+        chunks = []
+        current = ReviewChunk()
+        current_group = None
+
+        for path in files:
+            file_diff = diff_index.get(path)
+            if not file_diff or file_diff.is_deleted:
+                continue
+            group = (os.path.dirname(path), group_key(path) if group_key else None)
+
+            for hunk in file_diff.hunks:
+                for piece_hunk in self.split_hunk(hunk):
+                    piece = HunkPiece(path, piece_hunk, self.token_counter.count(piece_hunk.text))
+                    fits = current.tokens + piece.tokens <= self.target_tokens
+                    if current.pieces and (group != current_group or not fits):
+                        chunks.append(current)
+                        current = ReviewChunk()
+                    current_group = group
+                    current.add(piece)
+
+        if current.pieces:
+            chunks.append(current)
+        return chunks
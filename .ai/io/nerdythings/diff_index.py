@@ -0,0 +1,155 @@
+import re
+from typing import Dict, List, Optional
+
+HUNK_HEADER_PATTERN = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+INDEX_LINE_PATTERN = re.compile(r"^index ([0-9a-f]+)\.\.([0-9a-f]+)")
+NULL_SHA = "0" * 40
+
+
+class DiffHunk:
+
+    def __init__(self, header: str, old_start: int, old_count: int, new_start: int, new_count: int):
+        self.header = header
+        self.old_start = old_start
+        self.old_count = old_count
+        self.new_start = new_start
+        self.new_count = new_count
+        self.lines: List[str] = []
+
+    @property
+    def new_end(self) -> int:
+        return self.new_start + max(self.new_count, 1) - 1
+
+    @property
+    def text(self) -> str:
+        return "\n".join([self.header] + self.lines)
+
+    def contains_new_line(self, line: int) -> bool:
+        return self.new_count > 0 and self.new_start <= line <= self.new_end
+
+    def added_lines(self):
+        """Trả về danh sách (số dòng mới, nội dung) của các dòng được thêm."""
+        result = []
+        current = self.new_start
+        for line in self.lines:
+            if line.startswith("+"):
+                result.append((current, line[1:]))
+                current += 1
+            elif line.startswith(" "):
+                current += 1
+        return result
+
+
+class FileDiff:
+
+    def __init__(self, path: str):
+        self.path = path
+        self.header_lines: List[str] = []
+        self.hunks: List[DiffHunk] = []
+        self.added = 0
+        self.deleted = 0
+        self.binary = False
+        self.old_blob: Optional[str] = None
+        self.new_blob: Optional[str] = None
+
+    @property
+    def is_deleted(self) -> bool:
+        return self.new_blob == NULL_SHA
+
+    @property
+    def is_new(self) -> bool:
+        return self.old_blob == NULL_SHA
+
+    @property
+    def text(self) -> str:
+        """Diff đầy đủ của file, giống output của `git diff -- <file>`."""
+        lines = list(self.header_lines)
+        for hunk in self.hunks:
+            lines.append(hunk.header)
+            lines.extend(hunk.lines)
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def find_hunk(self, line: int) -> Optional[DiffHunk]:
+        for hunk in self.hunks:
+            if hunk.contains_new_line(line):
+                return hunk
+        return None
+
+
+class DiffIndex:
+    """Chỉ mục trong bộ nhớ: file -> hunks -> khoảng dòng, dựng từ một lần `git diff`."""
+
+    def __init__(self, base: str, head: str):
+        self.base = base
+        self.head = head
+        self.files: Dict[str, FileDiff] = {}
+
+    def paths(self) -> List[str]:
+        return list(self.files.keys())
+
+    def get(self, path: str) -> Optional[FileDiff]:
+        return self.files.get(path)
+
+    def diff_text(self, path: str) -> str:
+        file_diff = self.files.get(path)
+        return file_diff.text if file_diff else ""
+
+    @staticmethod
+    def parse(output: str, base: str, head: str) -> "DiffIndex":
+        """Parse output của `git diff --numstat --patch --full-index --no-renames`."""
+        index = DiffIndex(base, head)
+        lines = output.splitlines()
+
+        stats = []
+        position = 0
+        while position < len(lines) and not lines[position].startswith("diff --git "):
+            line = lines[position]
+            position += 1
+            if not line.strip():
+                continue
+            added, deleted, path = line.split("\t", 2)
+            stats.append((path, added, deleted))
+
+        file_diff = None
+        hunk = None
+        file_number = 0
+        for line in lines[position:]:
+            if line.startswith("diff --git "):
+                path, added, deleted = stats[file_number]
+                file_number += 1
+                file_diff = FileDiff(path)
+                file_diff.binary = added == "-" and deleted == "-"
+                file_diff.added = 0 if file_diff.binary else int(added)
+                file_diff.deleted = 0 if file_diff.binary else int(deleted)
+                file_diff.header_lines.append(line)
+                index.files[path] = file_diff
+                hunk = None
+                continue
+
+            match = HUNK_HEADER_PATTERN.match(line)
+            if match:
+                old_start, old_count, new_start, new_count = match.groups()
+                hunk = DiffHunk(
+                    header=line,
+                    old_start=int(old_start),
+                    old_count=int(old_count) if old_count is not None else 1,
+                    new_start=int(new_start),
+                    new_count=int(new_count) if new_count is not None else 1,
+                )
+                file_diff.hunks.append(hunk)
+                continue
+
+            if hunk is not None:
+                hunk.lines.append(line)
+                continue
+
+            index_match = INDEX_LINE_PATTERN.match(line)
+            if index_match:
+                file_diff.old_blob, file_diff.new_blob = index_match.groups()
+            elif line.startswith("new file mode"):
+                file_diff.old_blob = NULL_SHA
+            elif line.startswith("deleted file mode"):
+                file_diff.new_blob = NULL_SHA
+            file_diff.header_lines.append(line)
+
+        return index
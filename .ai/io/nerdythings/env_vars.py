@@ -8,18 +8,22 @@ dotenv_path = os.path.join(os.path.dirname(__file__), ".env")
 load_dotenv(dotenv_path=dotenv_path)
 
 class EnvVars:
-    def __init__(self):
-        self.event_name = os.getenv('GITHUB_EVENT_NAME')
+    def __init__(self, event_payload=None, event_name=None, repo_path=None):
+        """Đọc event từ GITHUB_EVENT_PATH, hoặc dùng `event_payload` có sẵn (chế độ server, xem review_server.py)."""
+        self.event_name = event_name or os.getenv('GITHUB_EVENT_NAME')
         self.event_path = os.getenv('GITHUB_EVENT_PATH')
         self.chat_gpt_token = os.getenv('CHATGPT_KEY')
         self.chat_gpt_model = os.getenv('CHATGPT_MODEL')
-        self.repo_path = os.getenv('GITHUB_WORKSPACE')
+        self.repo_path = repo_path or os.getenv('GITHUB_WORKSPACE')
 
-        if not self.event_path:
-            raise ValueError("GITHUB_EVENT_PATH is not set. Make sure this variable is defined.")
+        if event_payload is not None:
+            self.event_payload = event_payload
+        else:
+            if not self.event_path:
+                raise ValueError("GITHUB_EVENT_PATH is not set. Make sure this variable is defined.")
 
-        with open(self.event_path, 'r') as f:
-            self.event_payload = json.load(f)
+            with open(self.event_path, 'r') as f:
+                self.event_payload = json.load(f)
 
         if self.event_name == 'pull_request':
             self.handle_pull_request_event()
@@ -28,8 +32,28 @@ class EnvVars:
         else:
             raise ValueError(f"Unsupported event type: {self.event_name}")
 
-        print(f"DEBUG: CHATGPT_KEY={self.chat_gpt_token}, CHATGPT_MODEL={self.chat_gpt_model}")
-        self.target_extensions = os.getenv('TARGET_EXTENSIONS', 'kt,java,py,js,ts,swift,c,cpp').split(',')
+        if os.getenv('TARGET_EXTENSIONS'):
+            # File nào được review giờ do review rules quyết định (`review: false` theo glob).
+            Log.print_yellow("TARGET_EXTENSIONS is no longer supported, use `review: false` rules in REVIEW_RULES_PATH instead")
+        self.review_concurrency = int(os.getenv('REVIEW_CONCURRENCY') or 4)
+        self.review_post_mode = (os.getenv('REVIEW_POST_MODE') or "comments").lower()
+        self.prompt_token_budget = int(os.getenv('PROMPT_TOKEN_BUDGET') or 8000)
+        self.review_chunk_tokens = int(os.getenv('REVIEW_CHUNK_TOKENS') or 1500)
+        self.review_hunk_max_lines = int(os.getenv('REVIEW_HUNK_MAX_LINES') or 150)
+        self.review_streaming = (os.getenv('REVIEW_STREAMING') or "true").lower() == "true"
+        self.retry_max_seconds = float(os.getenv('RETRY_MAX_SECONDS') or 120)
+        self.report_path = os.getenv('REVIEW_REPORT_PATH') or "ai-review-report.json"
+        self.summary_batch_tokens = int(os.getenv('SUMMARY_BATCH_TOKENS') or 12000)
+        self.review_cache_dir = os.getenv('REVIEW_CACHE_DIR') or os.path.join(self.repo_path or ".", ".ai-review-cache")
+        self.review_cache_max_bytes = int(os.getenv('REVIEW_CACHE_MAX_MB') or 50) * 1024 * 1024
+        self.review_rules_path = os.getenv('REVIEW_RULES_PATH') or os.path.join(self.repo_path or ".", ".ai", "review-rules.yml")
+        self.triage_model = os.getenv('TRIAGE_MODEL') or None
+        self.review_checkpoint = (os.getenv('REVIEW_CHECKPOINT') or "true").lower() == "true"
+        self.review_output = (os.getenv('REVIEW_OUTPUT') or "markdown").lower()
+        self.review_batch = (os.getenv('REVIEW_BATCH') or "false").lower() == "true"
+        self.review_batch_timeout = float(os.getenv('REVIEW_BATCH_TIMEOUT') or 3600)
+        self.review_batch_poll_seconds = float(os.getenv('REVIEW_BATCH_POLL_SECONDS') or 30)
+        self.skip_patterns = [p for p in (os.getenv('SKIP_PATTERNS') or '').split(',') if p.strip()]
 
         self.commit_id = self.head_ref
 
@@ -53,6 +77,7 @@ class EnvVars:
         self.repo = pr['base']['repo']['name']
         self.token = os.getenv('GITHUB_TOKEN')
         self.pull_number = str(pr['number'])
+        self.pr_base_sha = pr['base'].get('sha')
 
         if self.event_payload['action'] in ['opened', 'reopened']:
             self.base_ref = pr['base']['ref']
@@ -68,6 +93,7 @@ class EnvVars:
         self.base_ref = self.event_payload['before']
         self.head_ref = self.event_payload['after']
         self.pull_number = None
+        self.pr_base_sha = None
 
     def check_vars(self):
         required_vars = ["CHATGPT_KEY", "CHATGPT_MODEL", "GITHUB_TOKEN"]
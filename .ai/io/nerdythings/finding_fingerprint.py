@@ -0,0 +1,135 @@
+import hashlib
+import json
+import re
+from typing import List, Optional
+
+FINGERPRINT_PATTERN = re.compile(r"\n*<!-- AI REVIEW FINGERPRINT (\{.*?\}) -->", re.DOTALL)
+SIMHASH_BITS = 64
+# Hai mô tả có simhash lệch tối đa bấy nhiêu bit được coi là cùng một finding được viết lại.
+MAX_SKETCH_DISTANCE = 18
+
+
+def short_hash(text: str, length: int = 16) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:length]
+
+
+def simhash(text: str) -> int:
+    """Simhash 64 bit trên các từ và cặp từ liền nhau: mô tả được viết lại cho ra sketch gần nhau."""
+    words = re.findall(r"\w+", (text or "").lower())
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    weights = [0] * SIMHASH_BITS
+    for feature in features:
+        value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+
+
+def normalize_lines(lines) -> List[str]:
+    """Bỏ khoảng trắng đầu/cuối và dòng trống để thay đổi format không làm đổi fingerprint."""
+    return [line.strip() for line in lines if line.strip()]
+
+
+class FindingFingerprint:
+    """Fingerprint của một finding, lưu ẩn trong body của comment.
+
+    - `key`: hash của path, hunk đã chuẩn hóa (bỏ header `@@` và khoảng trắng) và loại lỗi;
+    - `sketch`: simhash của mô tả, để nhận ra cùng một finding được model viết lại;
+    - `anchor`/`anchor_lines`: hash và số dòng code mà finding trỏ tới (hoặc của hunk nếu
+      finding không có số dòng), dùng để biết finding đã lỗi thời (code đó không còn trong file);
+    - `detail`: hash của severity, vị trí và suggested fix; khác nhau thì comment cần cập nhật.
+    """
+
+    def __init__(self, path: str, key: str, sketch: int, anchor: str = "", anchor_lines: int = 0,
+                 issue_type: str = "", detail: str = ""):
+        self.path = path
+        self.key = key
+        self.sketch = sketch
+        self.anchor = anchor
+        self.anchor_lines = anchor_lines
+        self.issue_type = issue_type
+        self.detail = detail
+
+    @staticmethod
+    def normalize_hunk(hunk_text: str) -> str:
+        return "\n".join(line for line in normalize_lines((hunk_text or "").splitlines()) if not line.startswith("@@"))
+
+    @staticmethod
+    def anchor_of(lines) -> tuple:
+        lines = normalize_lines(lines)
+        return (short_hash("\n".join(lines)), len(lines)) if lines else ("", 0)
+
+    @staticmethod
+    def hunk_new_lines(hunk_text: str) -> List[str]:
+        """Các dòng phía file mới (context và dòng thêm) của hunk đầu tiên trong `hunk_text`.
+
+        Các dòng này liền nhau trong file tại head, nên dùng được làm anchor cho finding
+        không có số dòng.
+        """
+        lines = []
+        in_hunk = False
+        for line in (hunk_text or "").splitlines():
+            if line.startswith("@@"):
+                if in_hunk:
+                    break
+                in_hunk = True
+            elif line.startswith("diff --git "):
+                if in_hunk:
+                    break
+            elif in_hunk and line[:1] in (" ", "+"):
+                lines.append(line[1:])
+        return lines
+
+    @staticmethod
+    def compute(path: str, hunk_text: str, comment, file_lines: Optional[List[str]] = None) -> "FindingFingerprint":
+        """Tính fingerprint của một LineComment; `file_lines` là nội dung file tại head."""
+        issue_type = (comment.issue_type or "").strip().lower()
+        key = short_hash("\0".join([path, FindingFingerprint.normalize_hunk(hunk_text), issue_type]))
+        anchor, anchor_lines = "", 0
+        if file_lines and isinstance(comment.line, int) and comment.line > 0:
+            start = comment.start_line if isinstance(comment.start_line, int) and 0 < comment.start_line <= comment.line else comment.line
+            anchor, anchor_lines = FindingFingerprint.anchor_of(file_lines[start - 1:comment.line])
+        else:
+            # Không có số dòng (hoặc chưa đọc được file): finding gắn với đoạn code của hunk.
+            anchor, anchor_lines = FindingFingerprint.anchor_of(FindingFingerprint.hunk_new_lines(hunk_text))
+        detail = short_hash("\0".join(str(value) for value in (comment.severity, comment.start_line, comment.line,
+                                                                comment.suggested_fix)), 8)
+        return FindingFingerprint(path, key, simhash(comment.description or comment.text), anchor, anchor_lines,
+                                  issue_type, detail)
+
+    def distance(self, other: "FindingFingerprint") -> int:
+        return bin(self.sketch ^ other.sketch).count("1")
+
+    def matches(self, other: "FindingFingerprint") -> bool:
+        """Cùng một finding: mô tả gần giống và cùng hunk, hoặc cùng loại lỗi trên cùng đoạn code."""
+        same_place = self.key == other.key or (
+            self.path == other.path and self.issue_type == other.issue_type
+            and bool(self.anchor) and self.anchor == other.anchor
+        )
+        return same_place and self.distance(other) <= MAX_SKETCH_DISTANCE
+
+    def render(self) -> str:
+        data = {"p": self.path, "k": self.key, "s": format(self.sketch, "016x"), "a": self.anchor,
+                "n": self.anchor_lines, "t": self.issue_type, "d": self.detail}
+        # "--" không được phép xuất hiện trong HTML comment.
+        payload = json.dumps(data, separators=(",", ":"), sort_keys=True).replace("--", "-\\u002d")
+        return f"<!-- AI REVIEW FINGERPRINT {payload} -->"
+
+    def embed(self, text: str) -> str:
+        return f"{FindingFingerprint.strip(text).rstrip()}\n\n{self.render()}"
+
+    @staticmethod
+    def parse(body: str) -> Optional["FindingFingerprint"]:
+        match = FINGERPRINT_PATTERN.search(body or "")
+        if not match:
+            return None
+        try:
+            data = json.loads(match.group(1))
+            return FindingFingerprint(data["p"], data["k"], int(data["s"], 16), data.get("a", ""),
+                                      int(data.get("n", 0)), data.get("t", ""), data.get("d", ""))
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    @staticmethod
+    def strip(body: str) -> str:
+        return FINGERPRINT_PATTERN.sub("", body or "")
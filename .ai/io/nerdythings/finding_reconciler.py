@@ -0,0 +1,95 @@
+from typing import Callable, List, Optional
+from log import Log
+from metrics import Metrics
+from finding_fingerprint import FindingFingerprint, normalize_lines, short_hash
+from repository.repository import RepositoryError
+
+CREATE = "create"
+UPDATE = "update"
+KEEP = "keep"
+ACTION_COUNTERS = {CREATE: "findings_created", UPDATE: "findings_updated", KEEP: "findings_unchanged"}
+
+
+class FindingReconciler:
+    """Đối chiếu findings của lần chạy này với các comment có fingerprint của các lần trước.
+
+    Mỗi finding được phân loại thành CREATE (chưa có comment), UPDATE (đã có
+    comment nhưng severity/vị trí/fix thay đổi) hoặc KEEP (đã có, chỉ khác cách
+    diễn đạt). Sau khi đăng xong, `delete_stale()` xóa các comment cũ không khớp
+    finding nào mà đoạn code nó trỏ tới không còn trong file, để số API write
+    chỉ tỉ lệ với những gì thực sự thay đổi.
+    """
+
+    def __init__(self, comment_index, read_file: Callable[[str], Optional[str]], metrics=None):
+        self.__comment_index = comment_index
+        self.__read_file = read_file
+        self.__metrics = metrics or Metrics()
+        self.__file_lines = {}
+        self.__anchor_windows = {}
+        self.__matched = set()
+        self.__existing = None
+
+    def file_lines(self, path: str) -> Optional[List[str]]:
+        """Các dòng của file tại head (None nếu file không còn), đọc một lần cho mỗi file."""
+        if path not in self.__file_lines:
+            content = self.__read_file(path)
+            self.__file_lines[path] = content.splitlines() if content is not None else None
+        return self.__file_lines[path]
+
+    def fingerprint(self, path: str, hunk_text: str, comment) -> FindingFingerprint:
+        return FindingFingerprint.compute(path, hunk_text, comment, self.file_lines(path))
+
+    def classify(self, fingerprint: FindingFingerprint, text: str) -> tuple:
+        """Trả về (action, ref) cho finding; ref là comment cũ khớp với finding (nếu có)."""
+        if self.__existing is None:
+            # Chỉ comment có từ trước lần chạy này mới có thể bị xóa vì lỗi thời.
+            self.__existing = self.__comment_index.fingerprinted()
+        match = self.__comment_index.match_fingerprint(fingerprint, exclude=self.__matched)
+        if match:
+            ref, existing, _ = match
+            self.__matched.add(ref)
+            action = UPDATE if existing.detail != fingerprint.detail else KEEP
+        elif self.__comment_index.contains_body(text):
+            # Comment đăng trước khi có fingerprint: giữ nguyên như cách dedupe cũ.
+            action, ref = KEEP, None
+        else:
+            action, ref = CREATE, None
+        self.__metrics.increment(ACTION_COUNTERS[action])
+        return action, ref
+
+    def __anchor_present(self, fingerprint: FindingFingerprint) -> bool:
+        if not fingerprint.path:
+            return True
+        lines = self.file_lines(fingerprint.path)
+        if lines is None:
+            return False
+        if not fingerprint.anchor_lines:
+            return True
+        key = (fingerprint.path, fingerprint.anchor_lines)
+        windows = self.__anchor_windows.get(key)
+        if windows is None:
+            normalized = normalize_lines(lines)
+            size = fingerprint.anchor_lines
+            windows = self.__anchor_windows[key] = {
+                short_hash("\n".join(normalized[start:start + size])) for start in range(len(normalized) - size + 1)
+            }
+        return fingerprint.anchor in windows
+
+    def stale(self) -> List[tuple]:
+        """Comment cũ không khớp finding nào và code nó trỏ tới đã bị sửa hoặc xóa."""
+        existing = self.__existing if self.__existing is not None else self.__comment_index.fingerprinted()
+        return [(ref, fingerprint) for ref, fingerprint, _ in existing
+                if ref not in self.__matched and not self.__anchor_present(fingerprint)]
+
+    def delete_stale(self) -> int:
+        deleted = 0
+        for ref, fingerprint in self.stale():
+            try:
+                self.__comment_index.delete_fingerprinted(ref)
+                deleted += 1
+            except RepositoryError as e:
+                Log.print_red(f"Failed to delete stale finding on {fingerprint.path}: {e}")
+        if deleted:
+            Log.print_green(f"Deleted {deleted} stale finding comment(s)")
+        self.__metrics.increment("findings_deleted", deleted)
+        return deleted
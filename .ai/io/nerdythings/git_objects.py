@@ -0,0 +1,113 @@
+import subprocess
+import threading
+from collections import OrderedDict
+from typing import Optional
+from log import Log
+from git_utils import GitUtils
+from diff_index import NULL_SHA
+
+
+class GitObjectReader:
+    """Đọc nội dung file từ object database của git qua một process `git cat-file --batch` dùng lâu dài.
+
+    Không cần checkout (đọc được cả bản base và head) và không spawn một
+    process cho mỗi file. Nội dung đã decode được giữ trong một LRU theo blob
+    SHA, giới hạn bởi `max_bytes`, nên cùng một file chỉ được đọc một lần cho
+    mọi bước (review, summary, đối chiếu comment).
+    """
+
+    def __init__(self, repository_path: str = None, max_bytes: int = 64 * 1024 * 1024):
+        self.repository_path = repository_path or GitUtils.repository_path()
+        self.max_bytes = max_bytes
+        self.reads = 0
+        self.cache_hits = 0
+        self.__process = None
+        self.__cache = OrderedDict()
+        self.__cache_bytes = 0
+        self.__aliases = {}
+        self.__lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __ensure_started(self):
+        if self.__process is None or self.__process.poll() is not None:
+            Log.print_green(["git", "cat-file", "--batch"])
+            self.__process = subprocess.Popen(["git", "cat-file", "--batch"], stdin=subprocess.PIPE,
+                                              stdout=subprocess.PIPE, cwd=self.repository_path)
+
+    def __request(self, spec: str) -> Optional[tuple]:
+        """Gửi một object spec, trả về (sha, type, nội dung) hoặc None nếu không tồn tại."""
+        self.__ensure_started()
+        self.__process.stdin.write(spec.encode("utf-8") + b"\n")
+        self.__process.stdin.flush()
+        header = self.__process.stdout.readline().decode("utf-8").rstrip("\n")
+        if not header:
+            self.__process = None
+            raise RuntimeError(f"git cat-file exited while reading {spec}")
+        parts = header.split(" ")
+        if len(parts) != 3:
+            # "<spec> missing" hoặc "<spec> ambiguous"
+            return None
+        sha, object_type, size = parts
+        data = self.__process.stdout.read(int(size))
+        self.__process.stdout.read(1)
+        return sha, object_type, data
+
+    def __remember(self, sha: str, content: str):
+        size = len(content)
+        if size > self.max_bytes or sha in self.__cache:
+            return
+        self.__cache[sha] = content
+        self.__cache_bytes += size
+        while self.__cache_bytes > self.max_bytes:
+            _, evicted = self.__cache.popitem(last=False)
+            self.__cache_bytes -= len(evicted)
+
+    def read(self, spec: str) -> Optional[str]:
+        """Nội dung (đã decode) của một blob theo SHA hoặc `<rev>:<path>`, None nếu không có."""
+        if not spec or spec == NULL_SHA or "\n" in spec:
+            return None
+        with self.__lock:
+            key = self.__aliases.get(spec, spec)
+            cached = self.__cache.get(key)
+            if cached is not None:
+                self.__cache.move_to_end(key)
+                self.cache_hits += 1
+                return cached
+
+            self.reads += 1
+            result = self.__request(spec)
+            if result is None or result[1] != "blob":
+                return None
+            sha, _, data = result
+            if spec != sha:
+                # `<rev>:<path>` được ánh xạ tới blob SHA, nội dung chỉ lưu một lần theo SHA.
+                self.__aliases[spec] = sha
+            cached = data.decode("utf-8", errors="replace")
+            self.__remember(sha, cached)
+            return cached
+
+    def read_path(self, rev: str, path: str) -> Optional[str]:
+        return self.read(f"{rev}:{path}")
+
+    def read_file(self, diff_index, path: str, base: bool = False) -> Optional[str]:
+        """Nội dung của `path` tại head (hoặc base) của diff, dùng blob SHA từ diff nếu có."""
+        file_diff = diff_index.get(path)
+        blob = (file_diff.old_blob if base else file_diff.new_blob) if file_diff else None
+        if blob and len(blob) == len(NULL_SHA):
+            return self.read(blob)
+        return self.read_path(diff_index.base if base else diff_index.head, path)
+
+    def close(self):
+        with self.__lock:
+            if self.__process is not None:
+                try:
+                    self.__process.stdin.close()
+                    self.__process.wait(timeout=5)
+                except (OSError, subprocess.TimeoutExpired):
+                    self.__process.kill()
+                self.__process = None
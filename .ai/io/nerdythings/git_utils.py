@@ -1,10 +1,38 @@
+import os
 import re
 import subprocess
-from typing import List
+import threading
+from contextlib import contextmanager
+from typing import List, Optional
 from log import Log
+from diff_index import DiffIndex
 
 class GitUtils:
 
+    # Repo mà thread hiện tại làm việc (chế độ server chạy nhiều repo song song); None là thư mục hiện tại.
+    __local = threading.local()
+
+    @staticmethod
+    @contextmanager
+    def repository(path: str):
+        """Chạy các lệnh git và đọc file của thread hiện tại trong repo `path`."""
+        previous = getattr(GitUtils.__local, "path", None)
+        GitUtils.__local.path = path
+        try:
+            yield
+        finally:
+            GitUtils.__local.path = previous
+
+    @staticmethod
+    def repository_path() -> Optional[str]:
+        return getattr(GitUtils.__local, "path", None)
+
+    @staticmethod
+    def workspace_path(path: str) -> str:
+        """Đường dẫn của một file trong repo đang làm việc."""
+        repository = GitUtils.repository_path()
+        return os.path.join(repository, path) if repository else path
+
     @staticmethod
     def split_diff_into_chunks(diff_text):
         """Chia một diff lớn thành danh sách các diff chunk nhỏ hơn."""
@@ -13,13 +41,29 @@ class GitUtils:
     @staticmethod
     def __run_subprocess(command):
         Log.print_green(command)
-        result = subprocess.run(command, stdout=subprocess.PIPE, text=True, encoding="utf-8")
+        result = subprocess.run(command, stdout=subprocess.PIPE, text=True, encoding="utf-8",
+                                cwd=GitUtils.repository_path())
         if result.returncode == 0:
             return result.stdout
         else:
             Log.print_red(command)
             raise Exception(f"Error running {command}: {result.stderr}")
 
+    @staticmethod
+    def __succeeds(command) -> bool:
+        Log.print_green(command)
+        return subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                              cwd=GitUtils.repository_path()).returncode == 0
+
+    @staticmethod
+    def is_ancestor(ancestor: str, head: str) -> bool:
+        """True nếu `ancestor` tồn tại và là tổ tiên của `head` (False sau force-push)."""
+        return GitUtils.__succeeds(["git", "merge-base", "--is-ancestor", ancestor, head])
+
+    @staticmethod
+    def merge_base(base: str, head: str) -> str:
+        return GitUtils.__run_subprocess(["git", "merge-base", base, head]).strip()
+
     @staticmethod
     def is_sha(ref: str) -> bool:
         return re.match(r'^[0-9a-f]{40}$', ref.lower()) is not None
@@ -38,6 +82,25 @@ class GitUtils:
         lines = result.strip().splitlines()
         return lines[0] if lines else ""
 
+    @staticmethod
+    def resolve_refs(base_ref: str, head_ref: str):
+        """Chuẩn hóa base/head thành ref git, chỉ gọi `git remote -v` một lần."""
+        if GitUtils.is_sha(base_ref) and GitUtils.is_sha(head_ref):
+            return base_ref, head_ref
+        remote_name = GitUtils.get_remote_name()
+        base = base_ref if GitUtils.is_sha(base_ref) else f"{remote_name}/{base_ref}"
+        head = head_ref if GitUtils.is_sha(head_ref) else f"{remote_name}/{head_ref}"
+        return base, head
+
+    @staticmethod
+    def get_diff_index(base_ref: str, head_ref: str) -> DiffIndex:
+        """Chạy một lần `git diff` (kèm --numstat) và dựng chỉ mục file -> hunks."""
+        base, head = GitUtils.resolve_refs(base_ref, head_ref)
+        command = ["git", "-c", "core.quotepath=off", "diff", "--numstat", "--patch", "--full-index",
+                   "--no-renames", "--no-color", "--no-ext-diff", base, head]
+        result = GitUtils.__run_subprocess(command)
+        return DiffIndex.parse(result, base, head)
+
     @staticmethod
     def get_diff_files(base_ref: str, head_ref: str) -> List[str]:
         remote_name = GitUtils.get_remote_name()
@@ -56,3 +119,16 @@ class GitUtils:
 
         command = ["git", "diff", base, head, "--", file_path]
         return GitUtils.__run_subprocess(command)
+
+    @staticmethod
+    def get_attributes(paths: List[str], attributes: List[str], batch_size: int = 500) -> dict:
+        """Đọc thuộc tính `.gitattributes` của nhiều file: {path: {attr: value}}."""
+        result = {}
+        for start in range(0, len(paths), batch_size):
+            command = ["git", "check-attr", "-z"] + list(attributes) + ["--"] + paths[start:start + batch_size]
+            fields = GitUtils.__run_subprocess(command).split("\0")
+            for position in range(0, len(fields) - 2, 3):
+                path, attribute, value = fields[position:position + 3]
+                if value != "unspecified":
+                    result.setdefault(path, {})[attribute] = value
+        return result
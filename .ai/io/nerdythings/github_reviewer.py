@@ -1,20 +1,38 @@
 import os
 import re
-import git
+import cProfile
+import pstats
 from git_utils import GitUtils
+from git_objects import GitObjectReader
 from ai.chat_gpt import ChatGPT
 from log import Log
 from ai.ai_bot import AiBot
-from ai.prompts import SUMMARY_PROMPT
 from env_vars import EnvVars
 from repository.github import GitHub
 from repository.repository import RepositoryError
+from review_executor import ReviewExecutor, ReviewJob
+from rate_limiter import RateLimiter
+from review_cache import ReviewCache
+from comment_index import CommentIndex
+from finding_reconciler import FindingReconciler, CREATE, UPDATE, KEEP
+from diff_chunker import DiffChunker
+from change_classifier import ChangeClassifier
+from review_rules import ReviewRules
+from review_body import ReviewBody
+from review_checkpoint import ReviewCheckpoint, CheckpointStore
+from summary_state import SummaryState, SUMMARY_STATE_PATTERN
+from diff_index import NULL_SHA
+from ai.tokens import TokenCounter
+from ai.stream_parser import ReviewStreamParser
+from ai.prompts import NO_RESPONSE
+from metrics import Metrics
+from owner_comment import OwnerCommentRenderer, OWNER_COMMENT_IDENTIFIER, owner_comment_identifier
 import sys
 import json
 
 PR_SUMMARY_COMMENT_IDENTIFIER = "<!-- PR SUMMARY COMMENT -->"
 PR_SUMMARY_FILES_IDENTIFIER = "<!-- PR SUMMARY FILES -->"
-OWNER_COMMENT_IDENTIFIER = "<!-- OWNER COMMENT -->"
+OWNER_COMMENT_MAX_SHARDS = 10
 EXCLUDED_FOLDERS = {".ai/io/nerdythings", ".github/workflows", ".gitignore"}
 
 def main():
@@ -25,34 +43,196 @@ def main():
         Log.print_red("This action only runs on pull request events.")
         return
 
-    github = GitHub(vars.token, vars.owner, vars.repo, vars.pull_number)
-    ai = ChatGPT(vars.chat_gpt_token, vars.chat_gpt_model)
+    metrics = Metrics()
+    github_limiter = RateLimiter("GitHub", max_retry_time=vars.retry_max_seconds)
+    openai_limiter = RateLimiter("OpenAI", rate=5.0, burst=5, max_retry_time=vars.retry_max_seconds)
+    github = GitHub(vars.token, vars.owner, vars.repo, vars.pull_number,
+                    rate_limiter=github_limiter, metrics=metrics)
+    ai = ChatGPT(vars.chat_gpt_token, vars.chat_gpt_model, prompt_token_budget=vars.prompt_token_budget,
+                 rate_limiter=openai_limiter, metrics=metrics)
 
-    changed_files = GitUtils.get_diff_files(head_ref=vars.head_ref, base_ref=vars.base_ref)
-    if not changed_files:
-        Log.print_red("No changes detected.")
-        return
+    try:
+        review_pull_request(vars, ai, github, metrics)
+    finally:
+        metrics.increment("retries_github", github_limiter.retries)
+        metrics.increment("retries_openai", openai_limiter.retries)
+        metrics.write_report(vars.report_path, os.getenv("GITHUB_STEP_SUMMARY"))
+
+def select_review_base(vars, checkpoint):
+    """Chọn base của diff: head đã review trong checkpoint nếu còn là tổ tiên của head hiện tại,
+    nếu không (force-push) thì review lại toàn bộ PR từ merge-base với nhánh base.
+
+    Trả về (base, full_review).
+    """
+    if checkpoint is None or not checkpoint.head:
+        return vars.base_ref, False
+    if checkpoint.head == vars.head_ref or GitUtils.is_ancestor(checkpoint.head, vars.head_ref):
+        Log.print_green(f"Reviewing changes since checkpoint {checkpoint.head[:12]}")
+        return checkpoint.head, False
+
+    Log.print_yellow(f"Checkpoint {checkpoint.head[:12]} is not an ancestor of {vars.head_ref[:12]}, falling back to a full review")
+    return pull_request_base(vars), True
+
+def pull_request_base(vars):
+    """Merge-base của head với nhánh base của PR: diff từ đây là toàn bộ thay đổi của PR."""
+    base = vars.pr_base_sha or vars.base_ref
+    try:
+        return GitUtils.merge_base(base, vars.head_ref)
+    except Exception as e:
+        Log.print_yellow(f"Could not compute merge-base, diffing against {base}: {e}")
+        return base
 
-    changed_files = [
+def filter_changed_files(changed_files):
+    return [
         file for file in changed_files
         if not any(file.startswith(excluded) for excluded in EXCLUDED_FOLDERS)
     ]
 
+def collapsed_files(vars, changed_files, diff_index, review_rules):
+    """File chỉ được liệt kê (không review): generated/vendored/lockfile và file bị rule loại trừ."""
+    skipped_files = ChangeClassifier(extra_patterns=vars.skip_patterns).classify_all(changed_files, diff_index)
+    for file in review_rules.excluded(changed_files):
+        skipped_files.setdefault(file, "excluded by rule")
+    return skipped_files
+
+def owner_comment_scope(vars, base_ref, full_review, diff_index, changed_files, skipped_files, review_rules):
+    """File, diff và file thu gọn dùng để render owner comment.
+
+    Owner comment mô tả toàn bộ PR: khi diff review chỉ là phần thay đổi từ checkpoint
+    (hoặc từ commit `before` của sự kiện synchronize), dựng lại diff từ merge-base của PR
+    để diff incremental không ghi đè comment của cả PR.
+    """
+    # Base là tên nhánh (opened/reopened) hoặc merge-base (full review): diff đã là toàn bộ PR.
+    if full_review or not vars.pr_base_sha or not GitUtils.is_sha(base_ref):
+        return changed_files, diff_index, skipped_files
+    pull_diff = GitUtils.get_diff_index(head_ref=vars.head_ref, base_ref=pull_request_base(vars))
+    pull_files = filter_changed_files(pull_diff.paths())
+    return pull_files, pull_diff, collapsed_files(vars, pull_files, pull_diff, review_rules)
+
+def review_pull_request(vars, ai, github, metrics):
+    # Một process `git cat-file --batch` cho cả lần review: mọi bước đọc file qua nó thay vì working tree.
+    with GitObjectReader() as objects:
+        try:
+            run_review(vars, ai, github, metrics, objects)
+        finally:
+            metrics.increment("blob_reads", objects.reads)
+            metrics.increment("blob_cache_hits", objects.cache_hits)
+
+def run_review(vars, ai, github, metrics, objects):
+    checkpoint_store = CheckpointStore(github) if vars.review_checkpoint else None
+    checkpoint = checkpoint_store.load() if checkpoint_store else None
+    with metrics.span("git diff", "git"):
+        base_ref, full_review = select_review_base(vars, checkpoint)
+        diff_index = GitUtils.get_diff_index(head_ref=vars.head_ref, base_ref=base_ref)
+    metrics.increment("full_review", int(full_review))
+    changed_files = diff_index.paths()
     if not changed_files:
-        Log.print_green("All changed files are excluded from review.")
+        Log.print_red("No changes detected.")
         return
 
-    Log.print_yellow(f"Filtered changed files: {changed_files}")
+    changed_files = filter_changed_files(changed_files)
 
-    file_summaries = update_pr_summary(changed_files, ai, github)
+    if not changed_files:
+        Log.print_green("All changed files are excluded from review.")
+        if checkpoint_store:
+            checkpoint_store.complete(diff_index.head, {})
+        return
 
-    for file in changed_files:
-        process_file(file, ai, github, vars)
+    Log.print_yellow(f"Filtered changed files: {changed_files}")
+    with metrics.span("classify changes", "git"):
+        review_rules = ReviewRules.load(vars.review_rules_path)
+        skipped_files = collapsed_files(vars, changed_files, diff_index, review_rules)
+    review_files = [file for file in changed_files if file not in skipped_files]
+    if checkpoint:
+        completed = set(checkpoint.completed_files(diff_index.base, diff_index.head))
+        if full_review:
+            # Sau force-push: bỏ qua các file có nội dung giống hệt lần review trước.
+            completed.update(file for file in review_files
+                             if checkpoint.reviewed_blob(file, diff_index.get(file).new_blob))
+        if completed:
+            Log.print_yellow(f"Skipping {len(completed & set(review_files))} files already reviewed in a previous run")
+            review_files = [file for file in review_files if file not in completed]
+            metrics.increment("files_resumed", len(completed))
+    metrics.increment("files_reviewed", len(review_files))
+    metrics.increment("files_skipped", len(skipped_files))
+
+    chunker = DiffChunker(TokenCounter(vars.chat_gpt_model), target_tokens=vars.review_chunk_tokens,
+                          max_hunk_lines=vars.review_hunk_max_lines)
+    jobs = build_review_jobs(review_files, diff_index, chunker, objects, review_rules)
+    metrics.increment("review_requests", len(jobs))
+    review_cache = ReviewCache(vars.review_cache_dir, vars.chat_gpt_model, max_bytes=vars.review_cache_max_bytes)
+    structured = vars.review_output == "json"
+
+    interactive_jobs = jobs
+    summarize = None
+    if vars.review_batch:
+        bulk_done = []
+
+        def summarize(file_contents):
+            nonlocal interactive_jobs
+            summaries, interactive_jobs = run_bulk_review(
+                jobs, ai, review_cache, metrics, file_contents, structured=structured,
+                summary_batch_tokens=vars.summary_batch_tokens, timeout=vars.review_batch_timeout,
+                poll_interval=vars.review_batch_poll_seconds)
+            bulk_done.append(True)
+            return summaries
+
+    with metrics.span("update_pr_summary", "summary"):
+        file_summaries = update_pr_summary(changed_files, ai, github, diff_index, objects, vars.summary_batch_tokens,
+                                           skipped_files=skipped_files, summarize=summarize)
+    if vars.review_batch and not bulk_done:
+        summarize({})
+
+    executor = ReviewExecutor(max_workers=vars.review_concurrency)
+    comment_index = CommentIndex(github, identifiers=[owner_comment_identifier(n) for n in range(1, OWNER_COMMENT_MAX_SHARDS + 1)],
+                                 include_review_comments=vars.review_post_mode == "review")
+    executor.start(interactive_jobs, lambda job: process_file(job, ai, review_cache, metrics, streaming=vars.review_streaming,
+                                                  triage_model=vars.triage_model,
+                                                  structured=structured),
+                   # Các chunk của cùng một file chạy liền nhau để dùng chung prompt cache (system + code của file).
+                   group_key=lambda job: job.file if job.file_content else None)
+    # Comment được đăng theo thứ tự file/hunk trong khi các request còn lại vẫn đang chạy.
+    on_files_done = None
+    if checkpoint_store:
+        on_files_done = lambda files: checkpoint_store.mark_files_done(diff_index.base, diff_index.head, files)
+    reconciler = FindingReconciler(comment_index, lambda path: read_file_content(objects, diff_index, path), metrics)
+    with metrics.span("post findings", "posting"):
+        if vars.review_post_mode == "review":
+            post_review_batch(jobs, github, comment_index, diff_index, vars.commit_id, reconciler,
+                              on_files_done=on_files_done)
+        else:
+            post_review_comments(jobs, comment_index, reconciler, on_files_done=on_files_done)
+    executor.wait()
+    with metrics.span("delete stale findings", "posting"):
+        reconciler.delete_stale()
+    review_cache.report()
+    review_cache.prune()
+    metrics.increment("review_cache_hits", review_cache.hits)
+    metrics.increment("review_cache_misses", review_cache.misses)
+    metrics.increment("review_failures", sum(1 for job in jobs if job.error))
+    triage_hunks = metrics.counters.get("triage_hunks", 0)
+    if triage_hunks:
+        metrics.set_value("triage_escalation_rate", round(metrics.counters["triage_escalated_hunks"] / triage_hunks, 3))
+    if metrics.tokens.get("prompt"):
+        metrics.set_value("prompt_cache_hit_rate", round(metrics.tokens["cached_prompt"] / metrics.tokens["prompt"], 3))
 
     #Generate and post the owner comment
-    owner_comment = generate_owner_comment(changed_files, github, vars)
-    if owner_comment:
-      post_or_update_owner_comment(github, owner_comment)
+    with metrics.span("owner comment", "posting"):
+        owner_files, owner_diff, owner_collapsed = owner_comment_scope(
+            vars, base_ref, full_review, diff_index, changed_files, skipped_files, review_rules)
+        owner_comments = generate_owner_comment(owner_files, owner_diff, collapsed=owner_collapsed)
+        metrics.increment("owner_comment_shards", len(owner_comments))
+        if owner_comments:
+            post_or_update_owner_comment(comment_index, owner_comments)
+
+    if checkpoint_store:
+        if any(job.error for job in jobs):
+            # Giữ tiến độ để lần chạy sau chỉ review lại các file bị lỗi.
+            checkpoint_store.mark_files_done(diff_index.base, diff_index.head, [], force=True)
+        else:
+            blobs = {file: (None if diff_index.get(file).new_blob == NULL_SHA else diff_index.get(file).new_blob)
+                     for file in diff_index.paths()}
+            checkpoint_store.complete(diff_index.head, blobs)
 
 
 
@@ -76,52 +256,83 @@ def generate_summary_table(file_summaries):
     return "\n".join([table_header] + table_rows)
 
 
-def update_pr_summary(changed_files, ai, github):
+def update_pr_summary(changed_files, ai, github, diff_index, objects, summary_batch_tokens=12000, skipped_files=None,
+                      summarize=None):
     Log.print_green("Updating PR description...")
 
     pr_data = github.get_pull_request()
     current_body = pr_data.get("body") or ""
 
-    # Extract existing summaries from the PR body
-    existing_summaries = {}
-    summary_table_match = re.search(f"{PR_SUMMARY_COMMENT_IDENTIFIER}.*?\n(.*?)(\n{PR_SUMMARY_FILES_IDENTIFIER}|\n{OWNER_COMMENT_IDENTIFIER}|\n\n)", current_body, re.DOTALL)
-    if summary_table_match:
-        summary_table_markdown = summary_table_match.group(1).strip()
-        # Parse the markdown table to extract existing summaries
-        existing_summaries = parse_summary_table(summary_table_markdown) # Function to parse is created below
-    else:
-        Log.print_yellow("No existing summary table found.")
-
-    file_summaries = existing_summaries.copy()  # Start with existing summaries
+    state = SummaryState.parse(current_body)
+    if state is None:
+        state = SummaryState()
+        # PR body từ phiên bản cũ chưa có state: lấy lại summary từ bảng một lần, không có blob nên sẽ được tính lại.
+        summary_table_match = re.search(f"{PR_SUMMARY_COMMENT_IDENTIFIER}.*?\n(.*?)(\n{PR_SUMMARY_FILES_IDENTIFIER}|\n{OWNER_COMMENT_IDENTIFIER}|\n\n)", current_body, re.DOTALL)
+        if summary_table_match:
+            for file, summary in parse_summary_table(summary_table_match.group(1).strip()).items():
+                state.set(file, summary)
+        else:
+            Log.print_yellow("No existing summary table found.")
 
-    # Generate summaries for new/modified files
+    # Generate summaries only for files whose head blob changed since the last summary
+    file_contents = {}
+    blobs = {}
+    reused = 0
     for file in changed_files:
+        file_diff = diff_index.get(file)
+        if file_diff and file_diff.is_deleted:
+            state.set(file, "File deleted.")
+            continue
+        if skipped_files and file in skipped_files:
+            state.set(file, ChangeClassifier.stats_summary(skipped_files[file], file_diff))
+            continue
+        blob = file_diff.new_blob if file_diff else None
+        if state.summary_for(file, blob) is not None:
+            reused += 1
+            continue
         try:
-            with open(file, 'r', encoding="utf-8", errors="replace") as f:
-                content = f.read()
-                new_summary = ai.ai_request_summary(file_changes={file:content[:1500]}, summary_prompt=SUMMARY_PROMPT)
-                file_summaries[file] = new_summary
-        except FileNotFoundError:
-            Log.print_yellow(f"File not found: {file}")
-            file_summaries[file] = f"File not found: {file}"
+            content = read_file_content(objects, diff_index, file)
+            if content is None:
+                state.set(file, f"File not found: {file}")
+            else:
+                file_contents[file] = content[:1500]
+                blobs[file] = blob
         except Exception as e:
             Log.print_red(f"Error processing file {file}: {e}")
-            file_summaries[file] = f"Error processing file {file}: {e}"
+            state.set(file, f"Error processing file {file}: {e}")
+    if reused:
+        Log.print_green(f"Reusing {reused} summaries of unchanged files")
 
+    if file_contents:
+        if summarize:
+            new_summaries = summarize(file_contents)
+        else:
+            new_summaries = ai.ai_request_summaries(file_contents, max_batch_tokens=summary_batch_tokens)
+        for file in file_contents:
+            if file in new_summaries:
+                summary = new_summaries[file]
+                # Summary lỗi không gắn blob để lần chạy sau tóm tắt lại file đó.
+                state.set(file, summary, None if AiBot.is_error_text(str(summary)) else blobs[file])
+            else:
+                state.set(file, f"Error processing file {file}: no summary returned")
+
+    file_summaries = state.summaries()
     summary_table = generate_summary_table(file_summaries)
-    files_comment = "" #Empty this out since we removed the files storing
-
+    summary_section = f"{PR_SUMMARY_COMMENT_IDENTIFIER}\n## Summary by BAP_Review\n\n{summary_table}\n\n{state.render()}"
 
     if PR_SUMMARY_COMMENT_IDENTIFIER in current_body:
-        updated_body = re.sub(
-            f"{PR_SUMMARY_COMMENT_IDENTIFIER}.*",
-            f"{PR_SUMMARY_COMMENT_IDENTIFIER}\n## Summary by BAP_Review\n\n{summary_table}\n{files_comment}",
-            current_body,
-            flags=re.DOTALL
-        )
+        before, _, after = current_body.partition(PR_SUMMARY_COMMENT_IDENTIFIER)
+        state_match = SUMMARY_STATE_PATTERN.search(after)
+        # Block state đánh dấu cuối phần summary; body cũ không có state thì summary kéo dài tới cuối body.
+        rest = after[state_match.end():] if state_match else ""
+        updated_body = before + summary_section + rest
     else:
-        updated_body = f"{PR_SUMMARY_COMMENT_IDENTIFIER}\n## Summary by BAP_Review\n\n{summary_table}\n{files_comment}\n\n{current_body}"
+        updated_body = f"{summary_section}\n\n{SummaryState.strip(current_body)}"
 
+    updated_body = ReviewCheckpoint.preserve(current_body, updated_body)
+    if updated_body == current_body:
+        Log.print_green("PR description is up to date.")
+        return file_summaries
     try:
         github.update_pull_request(updated_body)
         Log.print_yellow("PR description updated successfully!")
@@ -160,86 +371,335 @@ def parse_summary_table(markdown_table):
 
     return file_summaries
 
-def process_file(file, ai, github, vars):
-    Log.print_green(f"Reviewing file: {file}")
-    try:
-        with open(file, 'r', encoding="utf-8", errors="replace") as f:
-            file_content = f.read()
-    except FileNotFoundError:
+def read_file_content(objects, diff_index, file):
+    """Nội dung file tại head của diff, đọc từ object database (không cần checkout)."""
+    content = objects.read_file(diff_index, file)
+    if content is None:
         Log.print_yellow(f"File not found: {file}")
+    return content
+
+def build_diff_data(chunk, line_numbers, context_line_numbers=None):
+    """`context_line_numbers` là mọi vùng thay đổi của file, dùng khi cắt bớt code của file
+    để các chunk cùng file nhận cùng một context (xem AiBot.build_review_messages)."""
+    diff_chunk = chunk.text
+    return {
+        "code": diff_chunk,
+        "severity": "Warning",
+        "type": "General",
+        "issue_description": "Potential issue",
+        "line_numbers": line_numbers,
+        "context_line_numbers": context_line_numbers,
+        "changed_lines": diff_chunk,
+        "explanation": "",
+        "files": chunk.files,
+    }
+
+def build_review_jobs(changed_files, diff_index, chunker, objects, review_rules=None):
+    """Chia diff theo hunk, gom các hunk nhỏ thành ReviewJob cho từng request."""
+    review_rules = review_rules or ReviewRules()
+    jobs = []
+    chunks = chunker.chunk(diff_index, changed_files, group_key=lambda path: review_rules.resolve(path).key)
+    for chunk_number, chunk in enumerate(chunks):
+        files = chunk.files
+        if len(files) == 1:
+            file_content = read_file_content(objects, diff_index, files[0])
+            if file_content is None:
+                continue
+            line_numbers = chunk.line_numbers()
+            context_line_numbers = ", ".join(f"{hunk.new_start}-{hunk.new_end}"
+                                             for hunk in diff_index.get(files[0]).hunks)
+        else:
+            # Request gộp nhiều file: chỉ gửi diff, không gửi nội dung file.
+            file_content = ""
+            line_numbers = "; ".join(f"{path}: {chunk.line_numbers(path)}" for path in files)
+            context_line_numbers = None
+
+        diff_chunk = chunk.text
+        diff_data = build_diff_data(chunk, line_numbers, context_line_numbers)
+        blob_sha = ",".join(diff_index.get(path).new_blob or "" for path in files)
+        jobs.append(ReviewJob(files[0], chunk_number, file_content, diff_chunk, diff_data, blob_sha=blob_sha, chunk=chunk,
+                              settings=review_rules.resolve(files[0])))
+
+    Log.print_green(f"Packed {sum(len(job.chunk.pieces) for job in jobs)} hunks into {len(jobs)} review requests")
+    return jobs
+
+def triage_job(job, ai, triage_model, metrics):
+    """Tier 1 của cascade: model nhỏ chọn các hunk đáng ngờ.
+
+    Trả về diff_data chỉ gồm các hunk cần review bằng model chính, hoặc None
+    nếu tất cả các hunk đều sạch.
+    """
+    pieces = job.chunk.pieces
+    with metrics.span(f"triage chunk {job.chunk_number}", "triage", model=triage_model, hunks=len(pieces)):
+        suspicious = ai.ai_triage([(piece.path, piece.hunk.text) for piece in pieces], triage_model)
+    metrics.increment("triage_hunks", len(pieces))
+    metrics.increment("triage_escalated_hunks", len(suspicious))
+    Log.print_yellow(f"Triage chunk {job.chunk_number}: {len(suspicious)}/{len(pieces)} hunks escalated")
+    if not suspicious:
+        return None
+    if len(suspicious) == len(pieces):
+        return job.diff_data
+
+    chunk = job.chunk.subset(suspicious)
+    line_numbers = (chunk.line_numbers() if len(chunk.files) == 1
+                    else "; ".join(f"{path}: {chunk.line_numbers(path)}" for path in chunk.files))
+    return build_diff_data(chunk, line_numbers, job.diff_data.get("context_line_numbers"))
+
+def process_file(job, ai, review_cache, metrics, streaming=False, triage_model=None, structured=False):
+    """Gửi một diff chunk cho AI và emit các comment vào job (chạy trong worker thread).
+
+    Ở chế độ streaming, mỗi entry `###` được emit ngay khi hoàn chỉnh để việc
+    đăng comment có thể chạy song song với quá trình sinh response. Khi có
+    `triage_model`, chỉ các hunk bị model nhỏ đánh dấu đáng ngờ mới được gửi
+    tới model chính. Với `structured`, model trả về JSON theo schema (không stream).
+    """
+    Log.print_green(f"Reviewing {', '.join(job.chunk.files)} (chunk {job.chunk_number})")
+    resolve_path = job_path_resolver(job)
+    streamed = []
+
+    def emit_entry(index, entry):
+        if AiBot.is_no_issues_text(entry.strip()):
+            return
+        comment = AiBot.parse_entry(entry, index, file_path=job.file, resolve_path=resolve_path)
+        if comment:
+            job.emit(comment)
+
+    def request_stream(diff_data):
+        parser = ReviewStreamParser()
+        parts = []
+        for delta in ai.ai_request_diffs_stream(code=job.file_content, diffs=diff_data, settings=job.settings):
+            parts.append(delta)
+            for index, entry in parser.feed(delta):
+                emit_entry(index, entry)
+        for index, entry in parser.finish():
+            emit_entry(index, entry)
+        streamed.append(True)
+        return "".join(parts).strip()
+
+    def request():
+        diff_data = job.diff_data
+        if triage_model:
+            diff_data = triage_job(job, ai, triage_model, metrics)
+            if diff_data is None:
+                return NO_RESPONSE
+        with metrics.span(f"ai_request_diffs chunk {job.chunk_number}", "review", files=job.chunk.files,
+                          model=job.settings.model, prompt=job.settings.prompt):
+            if structured:
+                return ai.ai_request_findings(code=job.file_content, diffs=diff_data, settings=job.settings)
+            if streaming:
+                return request_stream(diff_data)
+            return ai.ai_request_diffs(code=job.file_content, diffs=diff_data, settings=job.settings)
+
+    response = review_cache.get_or_compute(
+        job.diff_chunk,
+        job.blob_sha,
+        request,
+        cacheable=lambda text: bool(text) and not AiBot.is_error_text(text),
+        variant=review_variant(job, triage_model, structured)
+    )
+    if streamed:
         return
-
-    file_diffs = GitUtils.get_diff_in_file(head_ref=vars.head_ref, base_ref=vars.base_ref, file_path=file)
-    if not file_diffs:
-        Log.print_red(f"No diffs found for: {file}")
-        return
-
-    individual_diffs = GitUtils.split_diff_into_chunks(file_diffs)
-
-    for diff_chunk in individual_diffs:
-        Log.print_yellow(f"base_ref: {vars.base_ref}, head_ref: {vars.head_ref}, file: {file}")
-        try:
-            repo = git.Repo(vars.repo_path)
-            try:
-                repo.git.rev_parse('--verify', 'main')
-                base_branch = 'main'
-            except git.exc.GitCommandError:
-                base_branch = vars.base_ref
-
-            Log.print_yellow(f"DEBUG: base_ref = {vars.base_ref}, base_branch = {base_branch}")
-            diff = repo.git.diff(base_branch, vars.head_ref, '--', file)
-
-
-            line_numbers = "..."
-            changed_lines = diff
-        except Exception as e:
-            Log.print_red(f"Error while parsing diff chunk: {e}")
-            Log.print_red(f"Exception details: {type(e).__name__}, {e}")
-            line_numbers = "N/A"
-            changed_lines = "N/A"
-
-        diff_data = {
-            "code": diff_chunk,
-            "severity": "Warning",
-            "type": "General",
-            "issue_description": "Potential issue",
-            "line_numbers": line_numbers,
-            "changed_lines": changed_lines,
-            "explanation": "",
-        }
-        Log.print_yellow(f"Diff data being sent to AI: {diff_data}")
-
-        try:
-            response = ai.ai_request_diffs(code=file_content, diffs=diff_data)
-        except Exception as e:
-            Log.print_red(f"Error during AI request: {e}")
+    emit_review_response(job, response, structured)
+
+def job_path_resolver(job):
+    """Tìm file của một finding trong chunk theo đường dẫn được nhắc tới và số dòng."""
+    return lambda entry, line: (job.chunk.locate(line, entry) or job.chunk.pieces[0]).path
+
+def review_variant(job, triage_model=None, structured=False):
+    return job.settings.key + (f"|triage:{triage_model}" if triage_model else "") + ("|json" if structured else "")
+
+def emit_review_response(job, response, structured=False):
+    """Parse response review (Markdown hoặc JSON) và emit các comment vào job."""
+    resolve_path = job_path_resolver(job)
+    if response and structured and not AiBot.is_no_issues_text(response):
+        for comment in AiBot.parse_findings(response, file_path=job.file, resolve_path=resolve_path):
+            job.emit(comment)
+    elif response and not AiBot.is_no_issues_text(response):
+        for comment in AiBot.split_ai_response(response, job.diff_chunk, file_path=job.file, resolve_path=resolve_path):
+            job.emit(comment)
+    else:
+        Log.print_green(f"No critical issues found in chunk {job.chunk_number}, skipping comments.")
+
+def run_bulk_review(jobs, ai, review_cache, metrics, file_contents=None, structured=False, summary_batch_tokens=12000,
+                    timeout=3600.0, poll_interval=30.0):
+    """Chế độ bulk: gửi tất cả request review và summary trong một OpenAI batch.
+
+    Job có kết quả (từ cache hoặc batch) được emit và đóng ngay. Trả về
+    (summaries, remaining_jobs); các job còn lại (batch lỗi/hết giờ) được
+    review lại bằng request thường.
+    """
+    file_contents = file_contents or {}
+    summary_batches = AiBot.pack_summary_batches(file_contents, summary_batch_tokens) if file_contents else []
+    requests = [(f"summary-{number}", ai.summary_batch_request(batch)) for number, batch in enumerate(summary_batches)]
+
+    pending = []
+    for job in jobs:
+        cached = review_cache.get(job.diff_chunk, job.blob_sha, review_variant(job, structured=structured))
+        if cached is not None:
+            emit_review_response(job, cached, structured)
+            job.close()
             continue
+        pending.append(job)
+        requests.append((f"review-{job.chunk_number}",
+                         ai.review_request(job.file_content, job.diff_data, job.settings, structured=structured)))
+    metrics.increment("batch_requests", len(requests))
 
-        if response and not AiBot.is_no_issues_text(response):
-            comments = AiBot.split_ai_response(response, diff_chunk, file_path=file)
-            existing_comments = github.get_comments()
-            existing_comment_bodies = {c['body'] for c in existing_comments}
-            for comment in comments:
-                if comment.text:
-
-                    comment_text = comment.text.strip()
-                    if comment_text not in existing_comment_bodies:
+    results = {}
+    try:
+        with metrics.span("openai batch", "batch", requests=len(requests)):
+            results = ai.run_batch(requests, timeout=timeout, poll_interval=poll_interval)
+    except Exception as e:
+        Log.print_red(f"Batch submission failed, falling back to interactive requests: {e}")
+
+    summaries = {}
+    for number, batch in enumerate(summary_batches):
+        summaries.update(AiBot.parse_summary_batch(results.get(f"summary-{number}"), batch.keys()))
+    missing = {file: content for file, content in file_contents.items() if file not in summaries}
+    if missing:
+        summaries.update(ai.ai_request_summaries(missing, max_batch_tokens=summary_batch_tokens))
+
+    remaining = []
+    for job in pending:
+        response = results.get(f"review-{job.chunk_number}")
+        if response is None:
+            remaining.append(job)
+            continue
+        if not AiBot.is_error_text(response):
+            review_cache.put(job.diff_chunk, job.blob_sha, response, review_variant(job, structured=structured))
+        emit_review_response(job, response, structured)
+        job.close()
+    metrics.increment("batch_fallback_requests", len(remaining))
+    return summaries, remaining
+
+def files_done_after(jobs):
+    """Với mỗi job, danh sách file có job cuối cùng là job đó (file xong khi job này được đăng)."""
+    last_job = {}
+    for number, job in enumerate(jobs):
+        for path in job.chunk.files:
+            last_job[path] = number
+    done = [[] for _ in jobs]
+    for path, number in last_job.items():
+        done[number].append(path)
+    return done
+
+def reviewed_files(jobs):
+    """Các file mà mọi job của nó đều review thành công."""
+    failed = {path for job in jobs if job.error for path in job.chunk.files}
+    return [path for job in jobs for path in job.chunk.files if path not in failed]
+
+def finding_hunk(job, comment):
+    """Hunk chứa finding (dùng cho fingerprint), hoặc cả diff chunk nếu không xác định được."""
+    piece = job.chunk.locate(comment.line, comment.path) if job.chunk else None
+    return piece.hunk.text if piece else job.diff_chunk
+
+def post_review_comments(jobs, comment_index, reconciler, on_files_done=None):
+    """Đăng comment theo đúng thứ tự file/hunk sau khi review xong.
+
+    Mỗi finding được đối chiếu với comment cũ theo fingerprint (xem FindingReconciler):
+    chỉ finding mới được đăng, finding đã có nhưng thay đổi thì được cập nhật.
+    `on_files_done(files)` được gọi khi tất cả comment của các file đó đã được đăng.
+    """
+    done_after = files_done_after(jobs)
+    failed = set()
+    for number, job in enumerate(jobs):
+        for comment in job.iter_comments():
+            if comment.text:
+
+                comment_text = comment.text.strip()
+                path = comment.path or job.file
+                fingerprint = reconciler.fingerprint(path, finding_hunk(job, comment), comment)
+                action, ref = reconciler.classify(fingerprint, comment_text)
+                try:
+                    if action == CREATE:
                         Log.print_yellow(f"Posting general comment:\n{comment_text}")
-                        try:
-                            github.post_comment_general(
-                                text=comment_text
-                            )
-                        except RepositoryError as e:
-                            Log.print_red(f"Failed to post review comment: {e}")
-                        except Exception as e:
-                            Log.print_red(f"Unexpected error: {e}")
+                        comment_index.post(fingerprint.embed(comment_text))
+                    elif action == UPDATE:
+                        Log.print_yellow(f"Updating existing comment for a finding in {path}")
+                        comment_index.update_fingerprinted(ref, fingerprint.embed(comment_text))
                     else:
                         Log.print_yellow(f"Skipping comment: Comment already exists")
-                else:
-                    Log.print_yellow(f"Skipping comment because no content.")
-        else:
-            Log.print_green(f"No critical issues found in diff chunk, skipping comments.")
-            continue
+                except RepositoryError as e:
+                    Log.print_red(f"Failed to post review comment: {e}")
+                except Exception as e:
+                    Log.print_red(f"Unexpected error: {e}")
+            else:
+                Log.print_yellow(f"Skipping comment because no content.")
+        if job.error:
+            failed.update(job.chunk.files)
+        if on_files_done and done_after[number]:
+            on_files_done([path for path in done_after[number] if path not in failed])
+
+
+def post_review_batch(jobs, github, comment_index, diff_index, commit_id, reconciler, on_files_done=None):
+    """Gửi tất cả findings mới trong một pull-request review duy nhất.
+
+    Finding gắn được vào dòng thành inline comment; finding không gắn được vào dòng nào
+    nằm trong body của review, mỗi finding một section kèm fingerprint (xem ReviewBody)
+    để CommentIndex tải lại ở lần chạy sau. Finding đã có comment (khớp fingerprint)
+    được cập nhật tại chỗ nếu thay đổi, không đăng lại.
+    """
+    inline_comments = []
+    general_bodies = []
+    updates = []
+    for job in jobs:
+        for comment in job.iter_comments():
+            comment_text = comment.text.strip() if comment.text else ""
+            if not comment_text:
+                continue
+            path = comment.path or job.file
+            fingerprint = reconciler.fingerprint(path, finding_hunk(job, comment), comment)
+            action, ref = reconciler.classify(fingerprint, comment_text)
+            if action == KEEP:
+                continue
+            body = fingerprint.embed(comment_text)
+            if action == UPDATE:
+                updates.append((ref, body))
+                continue
+
+            file_diff = diff_index.get(path)
+            hunk = file_diff.find_hunk(comment.line) if isinstance(comment.line, int) and file_diff and not file_diff.is_deleted else None
+            if hunk:
+                inline_comment = {"path": file_diff.path, "line": comment.line, "side": "RIGHT", "body": body}
+                if comment.start_line and comment.start_line < comment.line and hunk.contains_new_line(comment.start_line):
+                    # Finding có khoảng dòng thật: anchor comment trên cả khoảng.
+                    inline_comment.update(start_line=comment.start_line, start_side="RIGHT")
+                inline_comments.append(inline_comment)
+            else:
+                general_bodies.append(body)
+
+    for ref, body in updates:
+        try:
+            comment_index.update_fingerprinted(ref, body)
+        except RepositoryError as e:
+            Log.print_red(f"Failed to update finding comment: {e}")
+    if updates:
+        Log.print_green(f"Updated {len(updates)} existing finding comment(s)")
+
+    if not inline_comments and not general_bodies:
+        Log.print_green("No new findings to post.")
+        if on_files_done:
+            on_files_done(reviewed_files(jobs))
+        return
+
+    review_body = ReviewBody.create(len(inline_comments) + len(general_bodies), general_bodies).render()
+    Log.print_yellow(f"Submitting review with {len(inline_comments)} inline comments "
+                     f"and {len(general_bodies)} finding(s) in the review body")
+    try:
+        review = github.create_review(commit_id, review_body, inline_comments)
+        comment_index.add_review(review, [c["body"] for c in inline_comments])
+        Log.print_green("Review submitted successfully!")
+        general_bodies = []
+    except RepositoryError as e:
+        Log.print_red(f"Failed to submit review, falling back to general comments: {e}")
+        general_bodies = [c["body"] for c in inline_comments] + general_bodies
+        Log.print_yellow(f"Posting {len(general_bodies)} finding(s) as general comments")
+    for body in general_bodies:
+        try:
+            comment_index.post(body)
+        except RepositoryError as e:
+            Log.print_red(f"Failed to post review comment: {e}")
+    if on_files_done:
+        on_files_done(reviewed_files(jobs))
 
 
 def parse_ai_suggestions(response):
@@ -253,71 +713,67 @@ def parse_ai_suggestions(response):
             suggestions.append({"text": suggestion_text})
     return suggestions
 
-def generate_owner_comment(changed_files, github, vars):
-    """Generates the owner's comment with dropdowns for each changed file."""
-
-    comment = f"{OWNER_COMMENT_IDENTIFIER}\n## Owner's Review Notes\n"
-    comment += "<details>\n"
-    comment += "  <summary><b>List Change History</b></summary>\n\n"
-
-    for file in changed_files:
-        try:
-            repo = git.Repo(vars.repo_path)
-            try:
-                repo.git.rev_parse('--verify', 'main')
-                base_branch = 'main'
-            except git.exc.GitCommandError:
-                base_branch = vars.base_ref
-
-            diff = repo.git.diff(base_branch, vars.head_ref, '--', file)
-
-            comment += "  <details>\n"
-            comment += f"    <summary><b>{file}</b></summary>\n\n"
-
-            comment += "    <ul>\n"
-            for line in diff.splitlines():
-                comment += f"      <li><code>{line}</code></li>\n"
-            comment += "    </ul>\n\n"
-
-            comment += "    **Impact:** (Summary of impact needs to be manually added here)\n\n" #Manually added because you need domain knowledge to do so
-
-            comment += "  </details>\n\n"
+def generate_owner_comment(changed_files, diff_index, max_shards=OWNER_COMMENT_MAX_SHARDS, collapsed=()):
+    """Generates the owner's comment shards with dropdowns for each changed file."""
+    return OwnerCommentRenderer(max_shards=max_shards).render(changed_files, diff_index, collapsed=collapsed)
+
+def same_comment_body(current, new):
+    """So sánh body đã đăng với body mới, bỏ qua khác biệt xuống dòng/khoảng trắng cuối mà GitHub có thể thêm."""
+    return (current or "").replace("\r\n", "\n").strip() == (new or "").replace("\r\n", "\n").strip()
+
+def post_or_update_owner_comment(comment_index, comments):
+    """Posts new owner comment shards or updates the existing ones in place."""
+    comments = list(comments)
+    for number in range(1, OWNER_COMMENT_MAX_SHARDS + 1):
+        identifier = owner_comment_identifier(number)
+        existing_comment = comment_index.find_by_identifier(identifier)
+        if number > len(comments):
+            cleared = f"{identifier}\n_No further changes._\n"
+            if existing_comment and not same_comment_body(existing_comment.get("body"), cleared):
+                # Shard cũ không còn dùng: thu gọn thay vì để lại nội dung lỗi thời.
+                try:
+                    comment_index.update(existing_comment['id'], cleared)
+                except RepositoryError as e:
+                    Log.print_red(f"Failed to clear owner comment part {number}: {e}")
+            continue
 
-        except Exception as e:
-            Log.print_red(f"Error generating diff for owner comment: {e}")
-            comment += f"  <details>\n"
-            comment += f"    <summary><b>{file}</b> - Error generating diff</summary>\n\n"
-            comment += f"    Error: {e}\n\n"
-            comment += "  </details>\n\n"
-
-    comment += "</details>\n"
-    return comment
-
-def post_or_update_owner_comment(github, comment):
-    """Posts a new comment or updates an existing one."""
-    existing_comments = github.get_comments()
-    owner_comment_exists = False
-
-    for existing_comment in existing_comments:
-        if OWNER_COMMENT_IDENTIFIER in existing_comment['body']:
-            Log.print_yellow("Updating existing owner comment...")
+        comment = comments[number - 1]
+        if existing_comment and same_comment_body(existing_comment.get("body"), comment):
+            # Không PATCH shard không đổi: tiết kiệm API call và không gửi notification thừa.
+            Log.print_green(f"Owner comment ({number}/{len(comments)}) is up to date.")
+        elif existing_comment:
+            Log.print_yellow(f"Updating existing owner comment ({number}/{len(comments)})...")
             try:
-                github.update_comment(existing_comment['id'], comment)
+                comment_index.update(existing_comment['id'], comment)
                 Log.print_green("Owner comment updated successfully!")
             except RepositoryError as e:
                 Log.print_red(f"Failed to update owner comment: {e}")
-            owner_comment_exists = True
-            break
+        else:
+            Log.print_yellow(f"Posting new owner comment ({number}/{len(comments)})...")
+            try:
+                comment_index.post(comment)
+                Log.print_green("Owner comment posted successfully!")
+            except RepositoryError as e:
+                Log.print_red(f"Failed to post owner comment: {e}")
+
 
-    if not owner_comment_exists:
-        Log.print_yellow("Posting new owner comment...")
-        try:
-            github.post_comment_general(comment)
-            Log.print_green("Owner comment posted successfully!")
-        except RepositoryError as e:
-            Log.print_red(f"Failed to post owner comment: {e}")
 
+def run_with_profile(function, profile_path):
+    """Chạy `function` dưới cProfile, lưu stats vào profile_path và in các hàm tốn thời gian nhất."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        function()
+    finally:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(30)
+        Log.print_green(f"Profile written to {profile_path}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    profile_path = os.getenv("REVIEW_PROFILE")
+    if profile_path:
+        run_with_profile(main, profile_path)
+    else:
+        main()
\ No newline at end of file
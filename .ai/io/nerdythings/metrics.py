@@ -0,0 +1,135 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from log import Log
+
+
+class Metrics:
+    """Số liệu của một lần chạy: thời gian theo span, số API call và token.
+
+    `write_report()` ghi báo cáo JSON và thêm bảng Markdown vào
+    `GITHUB_STEP_SUMMARY` để so sánh giữa các lần chạy.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.spans = []
+        self.calls = defaultdict(int)
+        self.tokens = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.__lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, category: str, **attributes):
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            span = {"name": name, "category": category, "seconds": round(elapsed, 4), **attributes}
+            if error:
+                span["error"] = error
+            with self.__lock:
+                self.spans.append(span)
+
+    def count_call(self, provider: str):
+        with self.__lock:
+            self.calls[provider] += 1
+
+    def increment(self, name: str, value: int = 1):
+        with self.__lock:
+            self.counters[name] += value
+
+    def set_value(self, name: str, value):
+        """Ghi một giá trị dẫn xuất (ví dụ tỉ lệ) vào counters của báo cáo."""
+        with self.__lock:
+            self.counters[name] = value
+
+    def record_usage(self, usage):
+        """Cộng dồn `response.usage` (prompt/completion tokens) của OpenAI.
+
+        `prompt_tokens_details.cached_tokens` là phần prompt được provider lấy từ
+        prompt cache, ghi riêng để đo hiệu quả của prefix ổn định.
+        """
+        if not usage:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (details.get("cached_tokens") if isinstance(details, dict)
+                  else getattr(details, "cached_tokens", 0)) or 0
+        with self.__lock:
+            self.tokens["prompt"] += getattr(usage, "prompt_tokens", 0) or 0
+            self.tokens["completion"] += getattr(usage, "completion_tokens", 0) or 0
+            self.tokens["cached_prompt"] += cached
+
+    def __category_stats(self):
+        by_category = defaultdict(list)
+        for span in self.spans:
+            by_category[span["category"]].append(span["seconds"])
+
+        stats = {}
+        for category, values in sorted(by_category.items()):
+            values = sorted(values)
+            stats[category] = {
+                "count": len(values),
+                "total": round(sum(values), 3),
+                "p50": values[len(values) // 2],
+                "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+                "max": values[-1],
+            }
+        return stats
+
+    def report(self) -> dict:
+        with self.__lock:
+            return {
+                "wall_seconds": round(time.time() - self.started, 3),
+                "api_calls": dict(self.calls),
+                "tokens": dict(self.tokens),
+                "counters": dict(self.counters),
+                "stages": self.__category_stats(),
+                "spans": list(self.spans),
+            }
+
+    @staticmethod
+    def to_markdown(report: dict) -> str:
+        lines = [
+            "## BAP_Review run report",
+            "",
+            f"Wall time: **{report['wall_seconds']}s**",
+            "",
+            "| Stage | Count | Total (s) | p50 (s) | p95 (s) | Max (s) |",
+            "|-------|------:|----------:|--------:|--------:|--------:|",
+        ]
+        for category, stats in report["stages"].items():
+            lines.append(f"| {category} | {stats['count']} | {stats['total']} | {stats['p50']} | {stats['p95']} | {stats['max']} |")
+
+        lines += ["", "| Metric | Value |", "|--------|------:|"]
+        for provider, count in sorted(report["api_calls"].items()):
+            lines.append(f"| {provider} API calls | {count} |")
+        for kind, count in sorted(report["tokens"].items()):
+            lines.append(f"| {kind} tokens | {count} |")
+        for name, value in sorted(report["counters"].items()):
+            lines.append(f"| {name} | {value} |")
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, path: str = None, step_summary_path: str = None):
+        report = self.report()
+        if path:
+            try:
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(report, f, indent=2)
+                Log.print_green(f"Run report written to {path}")
+            except OSError as e:
+                Log.print_red(f"Failed to write run report: {e}")
+        if step_summary_path:
+            try:
+                with open(step_summary_path, "a", encoding="utf-8") as f:
+                    f.write(Metrics.to_markdown(report))
+            except OSError as e:
+                Log.print_red(f"Failed to write step summary: {e}")
+        return report
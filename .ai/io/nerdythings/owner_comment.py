@@ -0,0 +1,95 @@
+import html
+from typing import List
+
+OWNER_COMMENT_IDENTIFIER = "<!-- OWNER COMMENT -->"
+OWNER_COMMENT_PART_IDENTIFIER = "<!-- OWNER COMMENT PART {number} -->"
+GITHUB_COMMENT_MAX_CHARS = 65536
+IMPACT_NOTE = "    **Impact:** (Summary of impact needs to be manually added here)\n\n"
+
+
+def owner_comment_identifier(number: int) -> str:
+    """Identifier ẩn của shard thứ `number` (shard 1 giữ identifier cũ để cập nhật tại chỗ)."""
+    if number == 1:
+        return OWNER_COMMENT_IDENTIFIER
+    return OWNER_COMMENT_PART_IDENTIFIER.format(number=number)
+
+
+class OwnerCommentRenderer:
+    """Dựng owner comment từ DiffIndex trong một lần duyệt, giới hạn theo kích thước.
+
+    Mỗi dòng diff được HTML-escape và đếm kích thước ngay khi ghi. Diff của một
+    file vượt quá `max_file_chars` được thu gọn thành một dòng thống kê; toàn
+    bộ comment vượt quá `max_chars` được chia thành nhiều shard đánh số.
+    """
+
+    def __init__(self, max_chars: int = GITHUB_COMMENT_MAX_CHARS - 536, max_file_chars: int = 20000,
+                 max_shards: int = 10):
+        self.max_chars = max_chars
+        self.max_file_chars = min(max_file_chars, max_chars // 2)
+        self.max_shards = max_shards
+
+    @staticmethod
+    def __stat_line(file_diff, reason: str) -> str:
+        if file_diff.binary:
+            return "binary file changed"
+        return f"+{file_diff.added} / -{file_diff.deleted} lines, {len(file_diff.hunks)} hunks ({reason})"
+
+    def render_file(self, path: str, file_diff, collapse: bool = False) -> str:
+        """Khối `<details>` của một file; thu gọn thành dòng thống kê khi quá lớn hoặc `collapse`."""
+        name = html.escape(path)
+        if file_diff is None:
+            return f"  <details>\n    <summary><b>{name}</b> - No diff available</summary>\n\n  </details>\n\n"
+
+        opening = f"  <details>\n    <summary><b>{name}</b></summary>\n\n"
+        closing = "    </ul>\n\n" + IMPACT_NOTE + "  </details>\n\n"
+        parts = [opening, "    <ul>\n"]
+        size = len(opening) + len(closing) + 10
+        collapsed = file_diff.binary or collapse
+
+        lines = [file_diff.header_lines]
+        for hunk in file_diff.hunks:
+            lines.append((hunk.header,))
+            lines.append(hunk.lines)
+        for group in lines:
+            if collapsed:
+                break
+            for line in group:
+                item = f"      <li><code>{html.escape(line)}</code></li>\n"
+                size += len(item)
+                if size > self.max_file_chars:
+                    collapsed = True
+                    break
+                parts.append(item)
+
+        if collapsed:
+            reason = "diff not displayed" if collapse else "diff too large to display"
+            return f"{opening}    {OwnerCommentRenderer.__stat_line(file_diff, reason)}\n\n{IMPACT_NOTE}  </details>\n\n"
+        parts.append(closing)
+        return "".join(parts)
+
+    def __header(self, number: int, total: int) -> str:
+        title = "## Owner's Review Notes" + (f" ({number}/{total})" if total > 1 else "")
+        return (f"{owner_comment_identifier(number)}\n{title}\n"
+                "<details>\n  <summary><b>List Change History</b></summary>\n\n")
+
+    def render(self, changed_files, diff_index, collapsed=()) -> List[str]:
+        """Trả về danh sách các shard comment, mỗi shard không vượt quá `max_chars`."""
+        footer = "</details>\n"
+        reserved = len(self.__header(self.max_shards, self.max_shards)) + len(footer)
+
+        shards = [[]]
+        shard_size = reserved
+        for path in changed_files:
+            block = self.render_file(path, diff_index.get(path), collapse=path in collapsed)
+            if shards[-1] and shard_size + len(block) > self.max_chars:
+                if len(shards) == self.max_shards:
+                    shards[-1].append(f"  ... {len(changed_files)} files changed; remaining files omitted.\n\n")
+                    break
+                shards.append([])
+                shard_size = reserved
+            shards[-1].append(block)
+            shard_size += len(block)
+
+        total = len(shards)
+        return [self.__header(number, total) + "".join(blocks) + footer
+                for number, blocks in enumerate(shards, start=1)]
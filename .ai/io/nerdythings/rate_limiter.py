@@ -0,0 +1,156 @@
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from log import Log
+
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+class RetryableError(Exception):
+    """Lỗi tạm thời (429, 5xx, mất kết nối) có thể thử lại."""
+
+    def __init__(self, message, retry_after: float = None, headers=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.headers = headers or {}
+
+
+class RateLimiter:
+    """Token bucket dùng chung cho các request tới một provider (OpenAI, GitHub).
+
+    Tốc độ được điều chỉnh theo các header rate limit mà provider trả về
+    (`X-RateLimit-Remaining`/`X-RateLimit-Reset`, `x-ratelimit-*-requests`,
+    `Retry-After`), và `call()` thử lại lỗi tạm thời với exponential backoff
+    có jitter, giới hạn bởi tổng thời gian `max_retry_time`.
+    """
+
+    def __init__(self, name: str, rate: float = 10.0, burst: int = 10, max_attempts: int = 6,
+                 max_retry_time: float = 120.0, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.name = name
+        self.rate = rate
+        self.__base_rate = rate
+        self.capacity = float(burst)
+        self.max_attempts = max_attempts
+        self.max_retry_time = max_retry_time
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.__tokens = float(burst)
+        self.__updated = time.monotonic()
+        self.__blocked_until = 0.0
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        """Chờ tới khi bucket còn token (và provider không yêu cầu tạm dừng)."""
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__tokens = min(self.capacity, self.__tokens + (now - self.__updated) * self.rate)
+                self.__updated = now
+                if now >= self.__blocked_until and self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                wait = max(self.__blocked_until - now, (1 - self.__tokens) / self.rate if self.rate > 0 else 1.0)
+            time.sleep(min(wait, self.max_delay))
+
+    def pause(self, seconds: float):
+        with self.__lock:
+            self.__blocked_until = max(self.__blocked_until, time.monotonic() + seconds)
+
+    @staticmethod
+    def parse_duration(value) -> float:
+        """Parse "1s", "6m0s", "20ms" (OpenAI) hoặc số giây."""
+        if value is None:
+            return None
+        value = str(value).strip()
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        parts = DURATION_PATTERN.findall(value)
+        if not parts:
+            return None
+        return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+    @staticmethod
+    def retry_after_seconds(headers) -> float:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        if not value:
+            return None
+        seconds = RateLimiter.parse_duration(value)
+        if seconds is not None:
+            return seconds
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def update_from_headers(self, headers):
+        """Điều chỉnh bucket theo số request còn lại và thời điểm reset do provider báo."""
+        if not headers:
+            return
+        headers = {key.lower(): value for key, value in headers.items()}
+
+        remaining = headers.get("x-ratelimit-remaining", headers.get("x-ratelimit-remaining-requests"))
+        reset_in = None
+        if "x-ratelimit-reset" in headers:  # GitHub: epoch seconds
+            try:
+                reset_in = max(0.0, float(headers["x-ratelimit-reset"]) - time.time())
+            except ValueError:
+                reset_in = None
+        elif "x-ratelimit-reset-requests" in headers:  # OpenAI: duration
+            reset_in = RateLimiter.parse_duration(headers["x-ratelimit-reset-requests"])
+
+        retry_after = RateLimiter.retry_after_seconds(headers)
+        if retry_after:
+            self.pause(retry_after)
+
+        if remaining is None:
+            return
+        try:
+            remaining = int(float(remaining))
+        except ValueError:
+            return
+
+        if remaining <= 0 and reset_in:
+            self.pause(reset_in)
+        elif reset_in:
+            with self.__lock:
+                if remaining < self.capacity * 10:
+                    # Sắp hết quota: chia đều số request còn lại cho tới lúc reset.
+                    self.rate = max(remaining / max(reset_in, 1.0), 0.05)
+                else:
+                    self.rate = self.__base_rate
+                self.__tokens = min(self.__tokens, float(remaining))
+
+    def call(self, request, on_response=None):
+        """Gọi `request()` qua bucket; thử lại khi nó raise RetryableError.
+
+        `on_response(result)` (tùy chọn) trả về headers của kết quả để cập nhật bucket.
+        """
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            self.acquire()
+            try:
+                result = request()
+                if on_response:
+                    self.update_from_headers(on_response(result))
+                return result
+            except RetryableError as e:
+                self.update_from_headers(e.headers)
+                elapsed = time.monotonic() - started
+                delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+                delay = random.uniform(delay / 2, delay)
+                if e.retry_after:
+                    delay = max(delay, e.retry_after)
+                if attempt >= self.max_attempts or elapsed + delay > self.max_retry_time:
+                    Log.print_red(f"{self.name}: giving up after {attempt} attempts: {e}")
+                    raise
+                self.retries += 1
+                Log.print_yellow(f"{self.name}: {e}, retry {attempt}/{self.max_attempts - 1} in {delay:.1f}s")
+                time.sleep(delay)
@@ -1,50 +1,191 @@
+import os
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 from log import Log
 from repository.repository import Repository, RepositoryError
+from rate_limiter import RateLimiter, RetryableError
+from metrics import Metrics
 import re
 
 
 class GitHub(Repository):
 
-    def __init__(self, token: str, repo_owner: str, repo_name: str, pull_number: str = None):
+    def __init__(self, token: str, repo_owner: str, repo_name: str, pull_number: str = None, rate_limiter=None,
+                 metrics=None, session=None):
+        """`session` (tùy chọn) là session dùng chung giữa các lần review (chế độ server), xem `create_session`."""
         self.token = token
         self.repo_owner = repo_owner
         self.repo_name = repo_name
         self.pull_number = pull_number
-        self.__header_accept_json = {"Authorization": f"token {token}",
-                                      "Accept": "application/vnd.github+json"}
-        self.__header_authorization = {"Accept": "application/vnd.github.v3+json"}
-        self.__url_add_comment = f"https://api.github.com/repos/{repo_owner}/{repo_name}/pulls/{pull_number}/comments"
-        self.__url_add_issue = f"https://api.github.com/repos/{repo_owner}/{repo_name}/issues/{pull_number}/comments"
+        self.metrics = metrics or Metrics()
+        api_url = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+        self.__api_url = api_url
+        self.__url_repo = f"{api_url}/repos/{repo_owner}/{repo_name}"
+        self.__url_add_comment = f"{self.__url_repo}/pulls/{pull_number}/comments"
+        self.__url_add_issue = f"{self.__url_repo}/issues/{pull_number}/comments"
+        self.__url_pull_request = f"{self.__url_repo}/pulls/{pull_number}"
+
+        self.__session = session or GitHub.create_session(token)
+
+        # Cache ETag cho các endpoint đọc: url -> (etag, json). Response 304 không tính vào rate limit.
+        self.__etag_cache = {}
+        self.__etag_lock = threading.Lock()
+        self.__rate_limiter = rate_limiter or RateLimiter("GitHub", rate=10.0, burst=10)
+
+    @staticmethod
+    def create_session(token: str):
+        """Một session dùng chung: giữ kết nối keep-alive và header mặc định cho mọi request."""
+        session = requests.Session()
+        session.headers.update({"Authorization": f"token {token}",
+                                "Accept": "application/vnd.github+json"})
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @staticmethod
+    def __is_transient(response) -> bool:
+        if response.status_code == 429 or response.status_code >= 500:
+            return True
+        if response.status_code == 403:
+            return response.headers.get("X-RateLimit-Remaining") == "0" or "secondary rate limit" in response.text.lower()
+        return False
+
+    def __request(self, method, url, **kwargs):
+        """Gửi request qua rate limiter chung, thử lại 429/5xx/secondary rate limit."""
+        def send():
+            self.metrics.count_call("github")
+            try:
+                with self.metrics.span(f"{method} {url.replace(self.__api_url, '')}", "github"):
+                    response = self.__session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                raise RetryableError(f"{method} {url} failed: {e}")
+            if GitHub.__is_transient(response):
+                raise RetryableError(f"{method} {url} returned {response.status_code}",
+                                     retry_after=RateLimiter.retry_after_seconds(response.headers),
+                                     headers=response.headers)
+            return response
+
+        try:
+            return self.__rate_limiter.call(send, on_response=lambda response: response.headers)
+        except RetryableError as e:
+            raise RepositoryError(str(e))
+
+    def __get(self, url, params=None):
+        """GET có điều kiện (If-None-Match), trả về (status_code, json, response)."""
+        cache_key = requests.Request("GET", url, params=params).prepare().url
+        with self.__etag_lock:
+            cached = self.__etag_cache.get(cache_key)
+
+        headers = {"If-None-Match": cached[0]} if cached else None
+        response = self.__request("GET", url, params=params, headers=headers)
+
+        if response.status_code == 304 and cached:
+            return 200, cached[1], response
+        if response.status_code != 200:
+            return response.status_code, None, response
+
+        data = response.json()
+        etag = response.headers.get("ETag")
+        if etag:
+            with self.__etag_lock:
+                self.__etag_cache[cache_key] = (etag, data)
+        return 200, data, response
+
+    def __forget(self, url):
+        """Bỏ các bản cache ETag của `url` (mọi query) sau khi resource đó bị ghi."""
+        with self.__etag_lock:
+            for cache_key in [key for key in self.__etag_cache if key.split("?", 1)[0] == url]:
+                del self.__etag_cache[cache_key]
+
+    def __get_json(self, url, error_message, params=None):
+        status_code, data, response = self.__get(url, params=params)
+        if status_code != 200:
+            raise RepositoryError(f"{error_message} {status_code}: {response.text}")
+        return data
+
+    def __get_paginated(self, url, error_message):
+        """Đọc toàn bộ các trang theo Link header."""
+        items = []
+        params = {"per_page": 100}
+        while url:
+            status_code, data, response = self.__get(url, params=params)
+            if status_code != 200:
+                raise RepositoryError(f"{error_message} {status_code}: {response.text}")
+            items.extend(data)
+            url = response.links.get("next", {}).get("url")
+            params = None  # URL của trang tiếp theo đã chứa sẵn query
+        return items
 
     def update_comment(self, comment_id: str, new_body: str):
         """Cập nhật một comment trên PR bằng API GitHub."""
-        url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/issues/comments/{comment_id}"
-        headers = self.__header_accept_json | self.__header_authorization
+        url = f"{self.__url_repo}/issues/comments/{comment_id}"
         body = {"body": new_body}
 
-        response = requests.patch(url, json=body, headers=headers)
+        response = self.__request("PATCH", url, json=body)
 
         if response.status_code == 200:
             return response.json()
         else:
             raise RepositoryError(f"Error updating comment {response.status_code}: {response.text}")
 
+    def update_review_comment(self, comment_id: str, new_body: str):
+        """Cập nhật một review comment (comment gắn vào dòng)."""
+        url = f"{self.__url_repo}/pulls/comments/{comment_id}"
+        response = self.__request("PATCH", url, json={"body": new_body})
+        if response.status_code == 200:
+            return response.json()
+        raise RepositoryError(f"Error updating review comment {response.status_code}: {response.text}")
+
+    def delete_comment(self, comment_id: str):
+        """Xóa một comment chung trên PR."""
+        response = self.__request("DELETE", f"{self.__url_repo}/issues/comments/{comment_id}")
+        if response.status_code not in (204, 404):
+            raise RepositoryError(f"Error deleting comment {response.status_code}: {response.text}")
+
+    def delete_review_comment(self, comment_id: str):
+        """Xóa một review comment (comment gắn vào dòng)."""
+        response = self.__request("DELETE", f"{self.__url_repo}/pulls/comments/{comment_id}")
+        if response.status_code not in (204, 404):
+            raise RepositoryError(f"Error deleting review comment {response.status_code}: {response.text}")
+
     def get_comments(self):
         """Lấy tất cả các comment trên PR."""
-        headers = self.__header_accept_json | self.__header_authorization
-        response = requests.get(self.__url_add_issue, headers=headers)
+        return self.__get_paginated(self.__url_add_issue, "Error fetching comments")
 
-        if response.status_code == 200:
+    def get_review_comments(self):
+        """Lấy tất cả các review comment (comment gắn vào dòng) trên PR."""
+        return self.__get_paginated(self.__url_add_comment, "Error fetching review comments")
+
+    def get_reviews(self):
+        """Lấy tất cả các review (kèm body) trên PR."""
+        return self.__get_paginated(f"{self.__url_pull_request}/reviews", "Error fetching reviews")
+
+    def create_review(self, commit_id: str, body: str, comments):
+        """Gửi một review duy nhất chứa tất cả inline comment (path/line/side)."""
+        url = f"{self.__url_pull_request}/reviews"
+        data = {"commit_id": commit_id, "body": body, "event": "COMMENT", "comments": comments}
+
+        response = self.__request("POST", url, json=data)
+        if response.status_code in [200, 201]:
             return response.json()
         else:
-            raise RepositoryError(f"Error fetching comments {response.status_code}: {response.text}")
+            raise RepositoryError(f"Error creating review {response.status_code}: {response.text}")
+
+    def update_review(self, review_id: str, body: str):
+        """Cập nhật body của một review đã gửi."""
+        url = f"{self.__url_pull_request}/reviews/{review_id}"
+        response = self.__request("PUT", url, json={"body": body})
+        self.__forget(f"{self.__url_pull_request}/reviews")
+        if response.status_code == 200:
+            return response.json()
+        raise RepositoryError(f"Error updating review {response.status_code}: {response.text}")
 
     def post_comment_general(self, text):
-        headers = self.__header_accept_json | self.__header_authorization
         body = {"body": text}
 
-        response = requests.post(self.__url_add_issue, json=body, headers=headers)
+        response = self.__request("POST", self.__url_add_issue, json=body)
         if response.status_code in [200, 201]:
             return response.json()
         else:
@@ -52,63 +193,44 @@ class GitHub(Repository):
 
     def get_latest_commit_id(self) -> str:
         # Lấy danh sách tất cả các PR mở
-        url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/pulls?state=open"
-        headers = self.__header_accept_json | self.__header_authorization
+        pull_requests = self.__get_paginated(f"{self.__url_repo}/pulls?state=open", "Error fetching pull requests")
+        if not pull_requests:
+            raise RepositoryError("No open pull requests found.")
 
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            pull_requests = response.json()
-            if not pull_requests:
-                raise RepositoryError("No open pull requests found.")
-
-            # Tìm PR có nhánh head trùng với pull request đang làm việc
-            matching_pr = next(
-                (pr for pr in pull_requests if pr["number"] == int(self.pull_number)),
-                None
-            )
-
-            if not matching_pr:
-                raise RepositoryError(f"No matching open PR found for branch {self.pull_number}.")
-
-            print(f"Pull requests fetched: {[pr['number'] for pr in pull_requests]}")
-            print(f"Checking for PR number: {self.pull_number} (type: {type(self.pull_number)})")
-
-            commits_url = matching_pr["commits_url"]
-            commits_response = requests.get(commits_url, headers=headers)
-            if commits_response.status_code == 200:
-                commits = commits_response.json()
-                if commits:
-                    return commits[-1]["sha"]
-                else:
-                    raise RepositoryError("No commits found in this pull request.")
-            else:
-                raise RepositoryError(
-                    f"Error fetching commits {commits_response.status_code}: {commits_response.text}")
+        # Tìm PR có nhánh head trùng với pull request đang làm việc
+        matching_pr = next(
+            (pr for pr in pull_requests if pr["number"] == int(self.pull_number)),
+            None
+        )
 
+        if not matching_pr:
+            raise RepositoryError(f"No matching open PR found for branch {self.pull_number}.")
+
+        print(f"Pull requests fetched: {[pr['number'] for pr in pull_requests]}")
+        print(f"Checking for PR number: {self.pull_number} (type: {type(self.pull_number)})")
+
+        commits = self.__get_paginated(matching_pr["commits_url"], "Error fetching commits")
+        if commits:
+            return commits[-1]["sha"]
         else:
-            raise RepositoryError(f"Error fetching pull requests {response.status_code}: {response.text}")
+            raise RepositoryError("No commits found in this pull request.")
 
     def get_pull_request(self):
-        url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/pulls/{self.pull_number}"
-        headers = self.__header_accept_json | self.__header_authorization
-        response = requests.get(url, headers=headers)
-        return response.json()
+        return self.__get_json(self.__url_pull_request, "Error fetching pull request")
 
     def update_pull_request(self, new_body):
-        url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/pulls/{self.pull_number}"
-        headers = self.__header_accept_json | self.__header_authorization
         data = {"body": new_body}
-        response = requests.patch(url, json=data, headers=headers)
-        return response.json()
+        response = self.__request("PATCH", self.__url_pull_request, json=data)
+        # Lần get_pull_request sau có thể nhận 304 với body cũ nếu còn giữ ETag trước khi ghi.
+        self.__forget(self.__url_pull_request)
+        if response.status_code == 200:
+            return response.json()
+        raise RepositoryError(f"Error updating pull request {response.status_code}: {response.text}")
 
     def _get_pull_request_diff(self):
         """Lấy diff của pull request từ GitHub API."""
-        url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/pulls/{self.pull_number}"
-        headers = {
-            "Authorization": f"token {self.token}",
-            "Accept": "application/vnd.github.v3.diff"
-        }
-        response = requests.get(url, headers=headers)
+        headers = {"Accept": "application/vnd.github.v3.diff"}
+        response = self.__request("GET", self.__url_pull_request, headers=headers)
 
         if response.status_code == 200:
             return response.text
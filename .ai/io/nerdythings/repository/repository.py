@@ -24,4 +24,12 @@ class Repository(ABC):
 
     @abstractmethod
     def update_pull_request(self, new_body: str) -> dict:
-        pass
\ No newline at end of file
+        pass
+
+    @abstractmethod
+    def get_review_comments(self) -> List[dict]:
+        pass
+
+    @abstractmethod
+    def create_review(self, commit_id: str, body: str, comments: List[dict]) -> dict:
+        pass
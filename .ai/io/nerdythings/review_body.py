@@ -0,0 +1,59 @@
+from typing import List, Optional
+from finding_fingerprint import FINGERPRINT_PATTERN, short_hash
+
+FINDINGS_MARKER = "<!-- AI REVIEW FINDINGS -->"
+SECTION_SEPARATOR = "\n\n---\n\n"
+
+
+class ReviewBody:
+    """Body của pull-request review chứa các finding không gắn được vào dòng nào.
+
+    Mỗi finding là một section kết thúc bằng marker fingerprint của nó, đặt sau
+    FINDINGS_MARKER. Section được tham chiếu bằng hash nội dung (không đổi khi
+    section khác bị sửa hoặc xóa), nên từng finding có thể được cập nhật hoặc
+    gỡ khỏi body bằng cách ghi lại cả body của review.
+    """
+
+    def __init__(self, header: str, sections: List[str]):
+        self.header = header
+        self.sections = list(sections)
+
+    @staticmethod
+    def create(total: int, sections: List[str]) -> "ReviewBody":
+        return ReviewBody(f"## BAP_Review found {total} issue(s)", sections)
+
+    @staticmethod
+    def parse(body: str) -> Optional["ReviewBody"]:
+        """None nếu body không do phiên bản này tạo ra (không có FINDINGS_MARKER)."""
+        header, marker, rest = (body or "").replace("\r\n", "\n").partition(FINDINGS_MARKER)
+        if not marker:
+            return None
+        sections = []
+        start = 0
+        for match in FINGERPRINT_PATTERN.finditer(rest):
+            section = rest[start:match.end()].strip()
+            if section.startswith("---"):
+                section = section[3:].strip()
+            sections.append(section)
+            start = match.end()
+        return ReviewBody(header.strip(), sections)
+
+    @staticmethod
+    def section_id(section: str) -> str:
+        return short_hash(section.strip())
+
+    def replace(self, section_id: str, text: Optional[str]) -> bool:
+        """Thay section bằng `text` (None để xóa); False nếu không còn section đó."""
+        for number, section in enumerate(self.sections):
+            if ReviewBody.section_id(section) == section_id:
+                if text is None:
+                    del self.sections[number]
+                else:
+                    self.sections[number] = text.strip()
+                return True
+        return False
+
+    def render(self) -> str:
+        if not self.sections:
+            return f"{self.header}\n{FINDINGS_MARKER}\n"
+        return f"{self.header}\n{FINDINGS_MARKER}\n\n{SECTION_SEPARATOR.join(self.sections)}\n"
@@ -0,0 +1,262 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Optional
+from log import Log
+from ai.prompts import CHAT_GPT_ASK_LONG, PROBLEMS, NO_RESPONSE, REVIEW_DIFFS_SECTION, REVIEW_LINES_SECTION, \
+    REVIEW_CODE_SECTION, REVIEW_MULTI_FILE_NOTE, REVIEW_FOCUS_SECTION, PROMPT_VARIANTS, TRIAGE_PROMPT, TRIAGE_HUNK, \
+    CHAT_GPT_ASK_STRUCTURED
+from ai.finding import FINDINGS_SCHEMA
+
+# Mọi đoạn prompt có thể được gửi khi review: sửa bất kỳ đoạn nào cũng làm cache cũ mất hiệu lực.
+REVIEW_PROMPT_PARTS = (CHAT_GPT_ASK_LONG, PROBLEMS, NO_RESPONSE, REVIEW_DIFFS_SECTION, REVIEW_LINES_SECTION,
+                       REVIEW_CODE_SECTION, REVIEW_MULTI_FILE_NOTE, REVIEW_FOCUS_SECTION, TRIAGE_PROMPT, TRIAGE_HUNK,
+                       CHAT_GPT_ASK_STRUCTURED, json.dumps(PROMPT_VARIANTS, sort_keys=True),
+                       json.dumps(FINDINGS_SCHEMA, sort_keys=True))
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@(.*)$")
+# Block `Lines:` của review dạng Markdown và số dòng đầu mỗi dòng trong đó ("42: ...", "path:42: ...", "Line 42-45").
+LINES_BLOCK = re.compile(r"(Lines:\**\s*```[^\n]*\n)([\s\S]*?)(```)")
+LINE_NUMBER = re.compile(r"^(\s*(?:[^\s:`]+:)?(?:lines?\s*)?)(\d+)(?:-(\d+))?", re.IGNORECASE | re.MULTILINE)
+
+
+class ReviewCache:
+    """Cache kết quả review theo nội dung hunk, blob SHA, prompt và model.
+
+    Kết quả được lưu thành file JSON trong `directory` (có thể persist bằng
+    Actions cache) và bị loại bỏ theo LRU khi vượt quá `max_bytes`. Trong
+    cùng một lần chạy, các hunk giống hệt nhau (kể cả ở file khác) dùng lại
+    một kết quả duy nhất.
+    """
+
+    def __init__(self, directory: str, model: str, max_bytes: int = 50 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.__model = model or ""
+        self.__prompt_hash = self.__sha256("\0".join(REVIEW_PROMPT_PARTS))
+        self.__memory = {}
+        self.__in_flight = {}
+        self.__lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def __sha256(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def hunk_offset(diff_chunk: str) -> Optional[int]:
+        """Dòng bắt đầu (file mới) của hunk đầu tiên trong chunk."""
+        for line in diff_chunk.splitlines():
+            match = HUNK_HEADER.match(line)
+            if match:
+                return int(match.group(3))
+        return None
+
+    @staticmethod
+    def normalize_hunk(diff_chunk: str) -> str:
+        """Bỏ header file của diff (trước `@@` đầu tiên), khoảng trắng cuối dòng và vị trí tuyệt đối của hunk.
+
+        Số dòng trong header `@@` được tính tương đối so với hunk đầu tiên, nên cùng một
+        chunk ở offset khác (hoặc file khác) có cùng key và chỉ lệch nhau một khoảng cố định.
+        """
+        lines = []
+        in_file_header = True
+        base = None
+        chunk_lines = diff_chunk.splitlines()
+        # Kết quả của chunk nhiều file ghi path của từng finding, nên path phải nằm trong key.
+        multi_file = sum(1 for line in chunk_lines if line.startswith("diff --git ")) > 1
+        for line in chunk_lines:
+            if line.startswith("diff --git "):
+                in_file_header = True
+                if multi_file:
+                    lines.append(line.rstrip())
+                continue
+            match = HUNK_HEADER.match(line)
+            if match:
+                in_file_header = False
+                old_start, old_count, new_start, new_count, context = match.groups()
+                if base is None:
+                    base = (int(old_start), int(new_start))
+                lines.append(f"@@ -{int(old_start) - base[0]},{old_count or 1} "
+                             f"+{int(new_start) - base[1]},{new_count or 1} @@{context.rstrip()}")
+                continue
+            if not in_file_header:
+                lines.append(line.rstrip())
+        return "\n".join(lines).strip()
+
+    @staticmethod
+    def shift_line_numbers(response: str, delta: int) -> str:
+        """Dời số dòng trong kết quả review (JSON findings hoặc block `Lines:`) đi `delta` dòng."""
+        if not delta or not response:
+            return response
+        try:
+            data = json.loads(response)
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and isinstance(data.get("findings"), list):
+            for finding in data["findings"]:
+                if not isinstance(finding, dict):
+                    continue
+                for field in ("start_line", "end_line"):
+                    if isinstance(finding.get(field), int) and finding[field] > 0:
+                        finding[field] += delta
+            return json.dumps(data)
+
+        def shift_block(match):
+            body = LINE_NUMBER.sub(
+                lambda line: line.group(1) + str(int(line.group(2)) + delta)
+                + (f"-{int(line.group(3)) + delta}" if line.group(3) else ""),
+                match.group(2))
+            return match.group(1) + body + match.group(3)
+
+        return LINES_BLOCK.sub(shift_block, response)
+
+    def __keys(self, diff_chunk: str, blob_sha: str, variant: str = ""):
+        hunk_hash = self.__sha256(ReviewCache.normalize_hunk(diff_chunk))
+        base = f"{hunk_hash}:{self.__prompt_hash}:{self.__model}"
+        if variant:
+            base += f":{variant}"
+        return self.__sha256(f"{base}:{blob_sha or ''}"), self.__sha256(base)
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def __read(self, key: str) -> Optional[str]:
+        path = self.__path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)  # cập nhật mtime cho LRU
+            return entry.get("response")
+        except (OSError, ValueError):
+            return None
+
+    def __write(self, key: str, response: str):
+        path = self.__path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"model": self.__model, "response": response}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            Log.print_red(f"Failed to write review cache entry: {e}")
+
+    def __recall(self, keys, offset) -> Optional[str]:
+        """Kết quả trong bộ nhớ của run (gọi khi giữ lock), dời số dòng nếu hunk nằm ở offset khác."""
+        for candidate in keys:
+            if candidate in self.__memory:
+                response, cached_offset = self.__memory[candidate]
+                self.hits += 1
+                if offset is None or cached_offset is None:
+                    return response
+                return ReviewCache.shift_line_numbers(response, offset - cached_offset)
+        return None
+
+    def __remember(self, keys, response: str, offset):
+        for candidate in keys:
+            self.__memory[candidate] = (response, offset)
+
+    def get_or_compute(self, diff_chunk: str, blob_sha: str, compute, cacheable=lambda response: bool(response),
+                       variant: str = "") -> str:
+        """Trả về kết quả review từ cache, hoặc gọi `compute()` khi cache miss.
+
+        `variant` tách cache giữa các cấu hình review khác nhau (model, prompt variant).
+        """
+        key, run_key = self.__keys(diff_chunk, blob_sha, variant)
+        offset = ReviewCache.hunk_offset(diff_chunk)
+
+        while True:
+            with self.__lock:
+                cached = self.__recall((key, run_key), offset)
+                if cached is not None:
+                    return cached
+
+                pending = self.__in_flight.get(run_key)
+                if pending is None:
+                    pending = threading.Event()
+                    self.__in_flight[run_key] = pending
+                    break
+            # Một hunk giống hệt đang được review ở thread khác, chờ kết quả của nó.
+            pending.wait()
+
+        try:
+            response = self.__read(key)
+            if response is not None:
+                with self.__lock:
+                    self.hits += 1
+                    self.__remember((key, run_key), response, offset)
+                return response
+
+            with self.__lock:
+                self.misses += 1
+            response = compute()
+            if cacheable(response):
+                self.__write(key, response)
+                with self.__lock:
+                    self.__remember((key, run_key), response, offset)
+            return response
+        finally:
+            with self.__lock:
+                self.__in_flight.pop(run_key, None)
+            pending.set()
+
+    def get(self, diff_chunk: str, blob_sha: str, variant: str = "") -> Optional[str]:
+        """Tra cache không tính toán (dùng cho chế độ batch); trả về None khi miss."""
+        key, run_key = self.__keys(diff_chunk, blob_sha, variant)
+        offset = ReviewCache.hunk_offset(diff_chunk)
+        with self.__lock:
+            cached = self.__recall((key, run_key), offset)
+            if cached is not None:
+                return cached
+
+        # Entry trên đĩa gắn với blob SHA nên hunk luôn ở đúng offset đã review.
+        response = self.__read(key)
+        with self.__lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.__remember((key, run_key), response, offset)
+        return response
+
+    def put(self, diff_chunk: str, blob_sha: str, response: str, variant: str = ""):
+        key, run_key = self.__keys(diff_chunk, blob_sha, variant)
+        self.__write(key, response)
+        with self.__lock:
+            self.__remember((key, run_key), response, ReviewCache.hunk_offset(diff_chunk))
+
+    def prune(self):
+        """Xóa các entry ít được dùng nhất cho tới khi tổng dung lượng <= max_bytes."""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                continue
+
+        if removed:
+            Log.print_yellow(f"Review cache: evicted {removed} entries")
+
+    def report(self):
+        Log.print_green(f"Review cache: {self.hits} hits, {self.misses} misses")
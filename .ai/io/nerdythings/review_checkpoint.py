@@ -0,0 +1,123 @@
+import json
+import re
+import time
+from typing import Dict, List, Optional
+from log import Log
+from repository.repository import RepositoryError
+
+CHECKPOINT_PATTERN = re.compile(r"\n*<!-- AI REVIEW CHECKPOINT (\{.*?\}) -->", re.DOTALL)
+BLOB_PREFIX_LENGTH = 12
+
+
+class ReviewCheckpoint:
+    """Trạng thái review lưu ẩn trong PR body.
+
+    `head` là head SHA đã được review xong, `blobs` là blob SHA của từng file
+    tại thời điểm review. `progress` ghi lại lần chạy đang dở (head/base và các
+    file đã đăng xong) để lần chạy sau tiếp tục thay vì review lại từ đầu.
+    """
+
+    def __init__(self, head: str = None, blobs: Dict[str, str] = None, progress: dict = None):
+        self.head = head
+        self.blobs = dict(blobs or {})
+        self.progress = progress
+
+    @staticmethod
+    def parse(body: str) -> Optional["ReviewCheckpoint"]:
+        match = CHECKPOINT_PATTERN.search(body or "")
+        if not match:
+            return None
+        try:
+            data = json.loads(match.group(1))
+        except json.JSONDecodeError:
+            Log.print_yellow("Ignoring malformed review checkpoint")
+            return None
+        return ReviewCheckpoint(data.get("head"), data.get("blobs"), data.get("progress"))
+
+    def render(self) -> str:
+        data = {"head": self.head, "blobs": self.blobs}
+        if self.progress:
+            data["progress"] = self.progress
+        # "--" không được phép xuất hiện trong HTML comment.
+        payload = json.dumps(data, separators=(",", ":"), sort_keys=True).replace("--", "-\\u002d")
+        return f"<!-- AI REVIEW CHECKPOINT {payload} -->"
+
+    @staticmethod
+    def strip(body: str) -> str:
+        return CHECKPOINT_PATTERN.sub("", body or "")
+
+    @staticmethod
+    def embed(body: str, block: str) -> str:
+        """Thay block checkpoint trong body (block luôn nằm ở cuối body)."""
+        return f"{ReviewCheckpoint.strip(body).rstrip()}\n\n{block}"
+
+    @staticmethod
+    def preserve(old_body: str, new_body: str) -> str:
+        """Giữ lại block checkpoint của `old_body` khi body được viết lại (ví dụ khi cập nhật summary)."""
+        match = CHECKPOINT_PATTERN.search(old_body or "")
+        if not match or CHECKPOINT_PATTERN.search(new_body or ""):
+            return new_body
+        return ReviewCheckpoint.embed(new_body, match.group(0).strip())
+
+    def reviewed_blob(self, path: str, blob: str) -> bool:
+        """True nếu file đã được review với đúng nội dung `blob` (so khớp theo prefix đã lưu)."""
+        stored = self.blobs.get(path)
+        return bool(stored and blob and blob.startswith(stored))
+
+    def completed_files(self, base: str, head: str) -> List[str]:
+        """Các file đã được đăng xong trong lần chạy dở với cùng base/head."""
+        progress = self.progress or {}
+        if progress.get("base") == base and progress.get("head") == head:
+            return list(progress.get("files") or [])
+        return []
+
+
+class CheckpointStore:
+    """Đọc/ghi ReviewCheckpoint trong PR body, giới hạn số lần ghi khi báo tiến độ."""
+
+    def __init__(self, github, save_interval: float = 30.0):
+        self.__github = github
+        self.save_interval = save_interval
+        self.checkpoint = ReviewCheckpoint()
+        self.__last_saved = time.monotonic()
+
+    def load(self) -> Optional[ReviewCheckpoint]:
+        try:
+            body = self.__github.get_pull_request().get("body") or ""
+        except RepositoryError as e:
+            Log.print_red(f"Failed to load review checkpoint: {e}")
+            return None
+        checkpoint = ReviewCheckpoint.parse(body)
+        if checkpoint:
+            self.checkpoint = checkpoint
+        return checkpoint
+
+    def save(self):
+        try:
+            body = self.__github.get_pull_request().get("body") or ""
+            self.__github.update_pull_request(ReviewCheckpoint.embed(body, self.checkpoint.render()))
+            self.__last_saved = time.monotonic()
+        except RepositoryError as e:
+            Log.print_red(f"Failed to save review checkpoint: {e}")
+
+    def mark_files_done(self, base: str, head: str, files, force: bool = False):
+        """Ghi nhận các file đã đăng xong; chỉ ghi PR body khi `force` hoặc đã qua `save_interval`."""
+        progress = self.checkpoint.progress
+        if not progress or progress.get("base") != base or progress.get("head") != head:
+            progress = self.checkpoint.progress = {"base": base, "head": head, "files": []}
+        done = set(progress["files"])
+        progress["files"].extend(file for file in dict.fromkeys(files) if file not in done)
+        if force or time.monotonic() - self.__last_saved >= self.save_interval:
+            self.save()
+
+    def complete(self, head: str, blobs: Dict[str, str]):
+        """Đánh dấu head đã được review đầy đủ và xóa tiến độ dở dang."""
+        self.checkpoint.head = head
+        for path, blob in blobs.items():
+            if blob:
+                # Prefix ngắn để block không làm PR body vượt giới hạn kích thước.
+                self.checkpoint.blobs[path] = blob[:BLOB_PREFIX_LENGTH]
+            else:
+                self.checkpoint.blobs.pop(path, None)
+        self.checkpoint.progress = None
+        self.save()
@@ -0,0 +1,121 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from log import Log
+
+
+class ReviewJob:
+    """Một request review cho một diff chunk của một file."""
+
+    def __init__(self, file: str, chunk_number: int, file_content: str, diff_chunk: str, diff_data: dict,
+                 blob_sha: str = None, chunk=None, settings=None):
+        self.file = file
+        self.settings = settings
+        self.blob_sha = blob_sha
+        self.chunk = chunk
+        self.chunk_number = chunk_number
+        self.file_content = file_content
+        self.diff_chunk = diff_chunk
+        self.diff_data = diff_data
+        self.comments = []
+        self.error = None
+        self.elapsed = 0.0
+        self.__queue = queue.Queue()
+        self.__closed = False
+        self.__drained = False
+
+    def emit(self, comment):
+        """Ghi nhận một comment; comment có thể được đăng ngay trong khi job vẫn đang chạy."""
+        self.comments.append(comment)
+        self.__queue.put(comment)
+
+    def close(self):
+        if not self.__closed:
+            self.__closed = True
+            self.__queue.put(None)
+
+    def iter_comments(self):
+        """Trả về các comment theo thứ tự được emit, chờ tới khi job kết thúc."""
+        if self.__drained:
+            yield from list(self.comments)
+            return
+        while True:
+            comment = self.__queue.get()
+            if comment is None:
+                self.__drained = True
+                return
+            yield comment
+
+
+class ReviewExecutor:
+    """Chạy các request review song song với giới hạn concurrency.
+
+    Job được trả về theo đúng thứ tự đầu vào (file/hunk), lỗi của một job
+    được lưu vào `job.error` và không hủy các job khác.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max(1, max_workers)
+
+    def run(self, jobs, handler):
+        self.start(jobs, handler)
+        return self.wait()
+
+    def start(self, jobs, handler, group_key=None):
+        """Bắt đầu review ở background; kết quả được đọc qua `job.iter_comments()`.
+
+        Các job liền nhau có cùng `group_key(job)` (khác None) chạy nối tiếp trên
+        cùng một worker, để request sau dùng lại prompt cache của request trước.
+        """
+        self.__jobs = jobs
+        self.__started = time.perf_counter()
+        self.__pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        for group in self.__group(jobs, group_key):
+            self.__pool.submit(self.__run_group, group, handler)
+
+    @staticmethod
+    def __group(jobs, group_key):
+        groups = []
+        previous = None
+        for job in jobs:
+            key = group_key(job) if group_key else None
+            if key is not None and groups and key == previous:
+                groups[-1].append(job)
+            else:
+                groups.append([job])
+            previous = key
+        return groups
+
+    def wait(self):
+        jobs = self.__jobs
+        self.__pool.shutdown(wait=True)
+
+        wall_time = time.perf_counter() - self.__started
+        request_time = sum(job.elapsed for job in jobs)
+        failed = sum(1 for job in jobs if job.error)
+        speedup = request_time / wall_time if wall_time > 0 else 1.0
+        Log.print_green(
+            f"Reviewed {len(jobs)} chunks with {self.max_workers} workers: "
+            f"wall {wall_time:.2f}s, sum of requests {request_time:.2f}s, "
+            f"speedup x{speedup:.1f}, failed {failed}"
+        )
+        return jobs
+
+    @staticmethod
+    def __run_group(jobs, handler):
+        for job in jobs:
+            ReviewExecutor.__run_job(job, handler)
+
+    @staticmethod
+    def __run_job(job, handler):
+        started = time.perf_counter()
+        try:
+            handler(job)
+        except Exception as e:
+            job.error = e
+            Log.print_red(f"Review failed for {job.file} (chunk {job.chunk_number}): {e}")
+        finally:
+            job.elapsed = time.perf_counter() - started
+            job.close()
+            Log.print_yellow(f"Review request {job.file} (chunk {job.chunk_number}) took {job.elapsed:.2f}s")
@@ -0,0 +1,138 @@
+import os
+import re
+from typing import Dict, List
+import yaml
+from log import Log
+
+DEFAULT_MAX_TOKENS = 4096
+RULE_FIELDS = ("review", "model", "prompt", "max_tokens", "context_budget")
+
+
+class ReviewSettings:
+    """Cấu hình review đã áp dụng cho một file: model, prompt variant và các giới hạn token."""
+
+    def __init__(self, review: bool = True, model: str = None, prompt: str = "default",
+                 max_tokens: int = DEFAULT_MAX_TOKENS, context_budget: int = None, rules: List[str] = None):
+        self.review = review
+        self.model = model
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.context_budget = context_budget
+        self.rules = rules or []
+
+    @property
+    def key(self) -> str:
+        """Khóa dùng để gom hunk vào cùng request và tách cache giữa các cấu hình ("" với cấu hình mặc định)."""
+        if not self.model and self.prompt == "default" and not self.context_budget \
+                and self.max_tokens == DEFAULT_MAX_TOKENS:
+            return ""
+        return f"{self.model or ''}|{self.prompt}|{self.context_budget or ''}|{self.max_tokens}"
+
+    def apply(self, values: dict, name: str) -> "ReviewSettings":
+        merged = {field: getattr(self, field) for field in RULE_FIELDS}
+        merged.update({field: values[field] for field in RULE_FIELDS if field in values})
+        return ReviewSettings(rules=self.rules + [name], **merged)
+
+
+class ReviewRule:
+    """Một rule trong `.ai/review-rules.yml`, khớp đường dẫn theo glob đã compile sẵn."""
+
+    def __init__(self, name: str, patterns: List[str], values: dict):
+        self.name = name
+        self.patterns = patterns
+        self.values = values
+        self.__regexes = [ReviewRule.compile_glob(pattern) for pattern in patterns]
+
+    @staticmethod
+    def compile_glob(pattern: str):
+        """`**` khớp nhiều cấp thư mục, `*`/`?` không vượt qua `/`; pattern không có `/` khớp tên file."""
+        pattern = pattern.strip()
+        anchored = "/" in pattern.rstrip("/")
+        pattern = pattern.lstrip("/")
+        regex = []
+        position = 0
+        while position < len(pattern):
+            if pattern.startswith("**/", position):
+                regex.append("(?:.*/)?")
+                position += 3
+            elif pattern.startswith("**", position):
+                regex.append(".*")
+                position += 2
+            elif pattern[position] == "*":
+                regex.append("[^/]*")
+                position += 1
+            elif pattern[position] == "?":
+                regex.append("[^/]")
+                position += 1
+            else:
+                regex.append(re.escape(pattern[position]))
+                position += 1
+        prefix = "" if anchored else "(?:.*/)?"
+        return re.compile(f"^{prefix}{''.join(regex)}$")
+
+    def matches(self, path: str) -> bool:
+        return any(regex.match(path) for regex in self.__regexes)
+
+
+class ReviewRules:
+    """Các rule định tuyến theo đường dẫn, áp dụng lần lượt (rule sau ghi đè rule trước).
+
+    Ví dụ:
+        defaults:
+          max_tokens: 4096
+        rules:
+          - paths: ["app/**/*.tsx"]
+            model: gpt-4o-mini
+            prompt: ui
+          - paths: ["lib/**"]
+            prompt: security
+          - paths: ["**/*.md"]
+            review: false
+    """
+
+    def __init__(self, rules: List[ReviewRule] = None, defaults: dict = None):
+        self.rules = rules or []
+        self.defaults = ReviewSettings().apply(defaults or {}, "defaults") if defaults else ReviewSettings()
+        self.__resolved: Dict[str, ReviewSettings] = {}
+
+    @staticmethod
+    def load(path: str) -> "ReviewRules":
+        if not path or not os.path.exists(path):
+            return ReviewRules()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                config = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError) as e:
+            Log.print_red(f"Failed to load review rules from {path}: {e}")
+            return ReviewRules()
+
+        rules = []
+        for number, entry in enumerate(config.get("rules") or [], start=1):
+            patterns = entry.get("paths") or []
+            if isinstance(patterns, str):
+                patterns = [patterns]
+            if not patterns:
+                Log.print_yellow(f"Review rule #{number} has no paths, ignored")
+                continue
+            unknown = set(entry) - set(RULE_FIELDS) - {"paths", "name"}
+            if unknown:
+                Log.print_yellow(f"Review rule #{number}: unknown keys {sorted(unknown)}")
+            rules.append(ReviewRule(entry.get("name") or f"#{number}", patterns, entry))
+
+        Log.print_green(f"Loaded {len(rules)} review rules from {path}")
+        return ReviewRules(rules, config.get("defaults"))
+
+    def resolve(self, path: str) -> ReviewSettings:
+        """Trả về cấu hình cho file `path` (mỗi file chỉ được tính một lần)."""
+        settings = self.__resolved.get(path)
+        if settings is None:
+            settings = self.defaults
+            for rule in self.rules:
+                if rule.matches(path):
+                    settings = settings.apply(rule.values, rule.name)
+            self.__resolved[path] = settings
+        return settings
+
+    def excluded(self, paths) -> List[str]:
+        return [path for path in paths if not self.resolve(path).review]
+
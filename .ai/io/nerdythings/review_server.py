@@ -0,0 +1,383 @@
+import argparse
+import base64
+import copy
+import hashlib
+import hmac
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from log import Log
+from env_vars import EnvVars
+from git_utils import GitUtils
+from metrics import Metrics
+from rate_limiter import RateLimiter
+from ai.chat_gpt import ChatGPT
+from repository.github import GitHub
+from github_reviewer import review_pull_request
+
+REVIEWED_ACTIONS = ("opened", "synchronize", "reopened")
+REPO_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+class ServerConfig:
+    def __init__(self):
+        self.host = os.getenv('REVIEW_SERVER_HOST') or "0.0.0.0"
+        self.port = int(os.getenv('REVIEW_SERVER_PORT') or 8080)
+        self.workers = max(1, int(os.getenv('REVIEW_SERVER_WORKERS') or 2))
+        self.data_dir = os.path.abspath(os.getenv('REVIEW_SERVER_DIR') or ".ai-review-server")
+        self.coalesce_seconds = float(os.getenv('REVIEW_SERVER_COALESCE_SECONDS') or 5)
+        self.webhook_secret = os.getenv('WEBHOOK_SECRET') or None
+        # Repo luôn được clone từ host này, không bao giờ từ URL trong payload webhook.
+        self.git_server_url = (os.getenv('GITHUB_SERVER_URL') or "https://github.com").rstrip("/")
+        self.github_token = os.getenv('GITHUB_TOKEN')
+        self.chat_gpt_token = os.getenv('CHATGPT_KEY')
+        self.retry_max_seconds = float(os.getenv('RETRY_MAX_SECONDS') or 120)
+
+
+class PullRequestQueue:
+    """Hàng đợi review theo PR.
+
+    Các event của cùng một PR tới trong vòng `coalesce_seconds` được gộp thành
+    một lần review, và hai review của cùng một PR không bao giờ chạy song song:
+    event tới khi PR đang được review sẽ chờ (và tiếp tục được gộp) tới khi
+    lần review đó kết thúc.
+    """
+
+    def __init__(self, coalesce_seconds: float = 5.0):
+        self.coalesce_seconds = coalesce_seconds
+        self.coalesced = 0
+        self.__pending = OrderedDict()
+        self.__running = set()
+        self.__closed = False
+        self.__condition = threading.Condition()
+
+    @staticmethod
+    def key(payload) -> tuple:
+        pr = payload["pull_request"]
+        repo = pr["base"]["repo"]
+        return repo["owner"]["login"], repo["name"], pr["number"]
+
+    @staticmethod
+    def coalesce(previous: dict, payload: dict) -> dict:
+        """Gộp hai event của cùng PR: head mới nhất, base của event cũ để diff phủ mọi push."""
+        merged = copy.deepcopy(payload)
+        if previous.get("action") in ("opened", "reopened"):
+            merged["action"] = previous["action"]
+        elif previous.get("action") == "synchronize" and payload.get("action") == "synchronize":
+            merged["before"] = previous.get("before") or payload.get("before")
+        return merged
+
+    def put(self, payload: dict) -> tuple:
+        key = PullRequestQueue.key(payload)
+        with self.__condition:
+            previous = self.__pending.pop(key, None)
+            if previous:
+                payload = PullRequestQueue.coalesce(previous[0], payload)
+                self.coalesced += 1
+            self.__pending[key] = (payload, time.monotonic() + self.coalesce_seconds)
+            self.__condition.notify_all()
+        return key
+
+    def take(self) -> Optional[tuple]:
+        """Chờ PR tiếp theo sẵn sàng, trả về (key, payload); None khi queue đã đóng và không còn việc."""
+        with self.__condition:
+            while True:
+                now = time.monotonic()
+                wait = None
+                for key, (payload, ready_at) in self.__pending.items():
+                    if key in self.__running:
+                        continue
+                    # Khi đã đóng (ví dụ chế độ replay), không chờ hết thời gian gộp.
+                    if ready_at <= now or self.__closed:
+                        del self.__pending[key]
+                        self.__running.add(key)
+                        return key, payload
+                    wait = ready_at - now if wait is None else min(wait, ready_at - now)
+                if self.__closed and not self.__pending:
+                    return None
+                self.__condition.wait(wait)
+
+    def done(self, key):
+        with self.__condition:
+            self.__running.discard(key)
+            self.__condition.notify_all()
+
+    def close(self):
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+
+    def stats(self) -> dict:
+        with self.__condition:
+            return {"pending": len(self.__pending), "running": len(self.__running), "coalesced": self.coalesced}
+
+
+class GitMirrors:
+    """Bare mirror cho mỗi repo và một worktree cho mỗi PR, dùng lại giữa các lần review.
+
+    Mỗi lần review chỉ cần `git fetch` phần thay đổi và checkout lại worktree
+    của PR thay vì clone toàn bộ repo.
+    """
+
+    def __init__(self, root: str, server_url: str, token: str = None):
+        self.root = root
+        self.server_url = server_url.rstrip("/")
+        self.__token = token
+        self.__locks = {}
+        self.__locks_lock = threading.Lock()
+
+    def __repo_lock(self, owner: str, repo: str) -> threading.Lock:
+        with self.__locks_lock:
+            return self.__locks.setdefault((owner, repo), threading.Lock())
+
+    def clone_url(self, owner: str, repo: str) -> str:
+        return f"{self.server_url}/{owner}/{repo}.git"
+
+    def __environment(self) -> dict:
+        """Env cho git: token đi qua GIT_CONFIG_* (không nằm trên command line) và chỉ gửi tới `server_url`."""
+        env = dict(os.environ)
+        if self.__token:
+            credentials = base64.b64encode(f"x-access-token:{self.__token}".encode("utf-8")).decode("ascii")
+            index = int(env.get("GIT_CONFIG_COUNT") or 0)
+            env.update({
+                "GIT_CONFIG_COUNT": str(index + 1),
+                f"GIT_CONFIG_KEY_{index}": f"http.{self.server_url}/.extraHeader",
+                f"GIT_CONFIG_VALUE_{index}": f"Authorization: Basic {credentials}",
+            })
+        return env
+
+    def __git(self, *args, git_dir: str = None, cwd: str = None, check: bool = True) -> bool:
+        command = ["git"]
+        if git_dir:
+            command += ["--git-dir", git_dir]
+        command += list(args)
+        result = subprocess.run(command, cwd=cwd, env=self.__environment(), stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, text=True)
+        if check and result.returncode != 0:
+            raise RuntimeError(f"git {' '.join(args)} failed: {result.stderr.strip()}")
+        return result.returncode == 0
+
+    def checkout(self, owner: str, repo: str, number, head_sha: str, other_shas=()) -> str:
+        """Cập nhật mirror, checkout `head_sha` vào worktree của PR và trả về đường dẫn worktree."""
+        for part in (owner, repo):
+            if not REPO_NAME_PATTERN.match(part) or part in (".", ".."):
+                raise ValueError(f"Invalid repository name {owner}/{repo}")
+        clone_url = self.clone_url(owner, repo)
+        mirror = os.path.join(self.root, "mirrors", owner, f"{repo}.git")
+        worktree = os.path.join(self.root, "worktrees", owner, repo, f"pr-{number}")
+        with self.__repo_lock(owner, repo):
+            if not os.path.isdir(mirror):
+                os.makedirs(mirror)
+                self.__git("init", "--bare", "--quiet", mirror)
+                self.__git("remote", "add", "origin", clone_url, git_dir=mirror)
+                # Nhánh nằm dưới refs/remotes/origin/* như trong một checkout thường (xem GitUtils.resolve_refs).
+                self.__git("config", "remote.origin.fetch", "+refs/heads/*:refs/remotes/origin/*", git_dir=mirror)
+            else:
+                self.__git("remote", "set-url", "origin", clone_url, git_dir=mirror)
+            self.__git("fetch", "--quiet", "--prune", "origin", git_dir=mirror)
+
+            wanted = [sha for sha in (head_sha, *other_shas) if sha]
+            if not all(self.__has_commit(mirror, sha) for sha in wanted):
+                # Head của PR từ fork không nằm trên nhánh nào của repo gốc.
+                self.__git("fetch", "--quiet", "origin", f"+refs/pull/{number}/head:refs/pull/{number}/head",
+                           git_dir=mirror, check=False)
+            if not self.__has_commit(mirror, head_sha):
+                raise RuntimeError(f"Commit {head_sha} not found in {clone_url}")
+
+            if os.path.isdir(worktree):
+                self.__git("checkout", "--quiet", "--detach", "--force", head_sha, cwd=worktree)
+                self.__git("clean", "--quiet", "-fdx", cwd=worktree)
+            else:
+                os.makedirs(os.path.dirname(worktree), exist_ok=True)
+                self.__git("worktree", "add", "--quiet", "--detach", "--force", worktree, head_sha, git_dir=mirror)
+        return worktree
+
+    def __has_commit(self, mirror: str, sha: str) -> bool:
+        return self.__git("cat-file", "-e", f"{sha}^{{commit}}", git_dir=mirror, check=False)
+
+
+class ReviewServer:
+    """Chế độ server: nhận webhook `pull_request`, xếp hàng và review bằng một pool worker cố định.
+
+    OpenAI client, GitHub session và rate limiter được tạo một lần và dùng chung
+    cho mọi lần review (giữ kết nối keep-alive, giới hạn rate chung cho mọi
+    repo); mỗi lần review có Metrics và báo cáo riêng.
+    """
+
+    def __init__(self, config: ServerConfig = None):
+        self.config = config or ServerConfig()
+        self.queue = PullRequestQueue(self.config.coalesce_seconds)
+        self.mirrors = GitMirrors(self.config.data_dir, self.config.git_server_url, self.config.github_token)
+        self.github_limiter = RateLimiter("GitHub", max_retry_time=self.config.retry_max_seconds)
+        self.openai_limiter = RateLimiter("OpenAI", rate=5.0, burst=5, max_retry_time=self.config.retry_max_seconds)
+        self.github_session = GitHub.create_session(self.config.github_token)
+        self.openai_client = ChatGPT.create_client(self.config.chat_gpt_token)
+        self.results = []
+        self.__results_lock = threading.Lock()
+        self.__workers = []
+
+    def start_workers(self):
+        for number in range(self.config.workers):
+            worker = threading.Thread(target=self.__work, name=f"review-worker-{number}", daemon=True)
+            worker.start()
+            self.__workers.append(worker)
+        Log.print_green(f"Started {self.config.workers} review workers")
+
+    def stop(self):
+        """Đóng queue và chờ các review đang chờ/đang chạy kết thúc."""
+        self.queue.close()
+        for worker in self.__workers:
+            worker.join()
+
+    def verify_signature(self, body: bytes, signature: str) -> bool:
+        if not self.config.webhook_secret:
+            # Không có secret thì không xác thực được người gửi: từ chối mọi webhook.
+            return False
+        expected = "sha256=" + hmac.new(self.config.webhook_secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature or "")
+
+    def handle_webhook(self, event: str, body: bytes, signature: str = None) -> tuple:
+        """Xử lý một webhook, trả về (HTTP status, message)."""
+        if not self.verify_signature(body, signature):
+            return 401, "invalid signature"
+        if event == "ping":
+            return 200, "pong"
+        if event != "pull_request":
+            return 200, f"ignored event {event}"
+        try:
+            payload = json.loads(body)
+        except (ValueError, UnicodeDecodeError):
+            return 400, "invalid JSON payload"
+        return self.submit(payload)
+
+    def submit(self, payload: dict) -> tuple:
+        action = payload.get("action")
+        if action not in REVIEWED_ACTIONS or "pull_request" not in payload:
+            return 200, f"ignored action {action}"
+        owner, repo, number = self.queue.put(payload)
+        Log.print_green(f"Queued review for {owner}/{repo}#{number} ({action})")
+        return 202, "queued"
+
+    def __work(self):
+        while True:
+            item = self.queue.take()
+            if item is None:
+                return
+            key, payload = item
+            started = time.perf_counter()
+            error = None
+            try:
+                self.review(payload)
+            except Exception as e:
+                error = str(e)
+                Log.print_red(f"Review of {'/'.join(map(str, key[:2]))}#{key[2]} failed: {e}")
+            finally:
+                self.queue.done(key)
+            seconds = round(time.perf_counter() - started, 3)
+            with self.__results_lock:
+                self.results.append({"pull_request": "/".join(map(str, key[:2])) + f"#{key[2]}",
+                                     "head": payload["pull_request"]["head"]["sha"], "seconds": seconds, "error": error})
+
+    def review(self, payload: dict):
+        pr = payload["pull_request"]
+        repo = pr["base"]["repo"]
+        owner, name, number = repo["owner"]["login"], repo["name"], pr["number"]
+        metrics = Metrics()
+        with metrics.span("checkout", "git"):
+            worktree = self.mirrors.checkout(owner, name, number, pr["head"]["sha"],
+                                             (payload.get("before"), pr["base"].get("sha")))
+
+        with GitUtils.repository(worktree):
+            vars = EnvVars(event_payload=payload, event_name="pull_request", repo_path=worktree)
+            # Cache review dùng chung giữa các PR của một repo, không nằm trong worktree (bị `git clean`).
+            vars.review_cache_dir = os.getenv('REVIEW_CACHE_DIR') or os.path.join(self.config.data_dir, "cache", owner, name)
+            vars.report_path = os.path.join(self.config.data_dir, "reports",
+                                            f"{owner}-{name}-{number}-{pr['head']['sha'][:12]}.json")
+            os.makedirs(os.path.dirname(vars.report_path), exist_ok=True)
+
+            github = GitHub(vars.token, vars.owner, vars.repo, vars.pull_number, rate_limiter=self.github_limiter,
+                            metrics=metrics, session=self.github_session)
+            ai = ChatGPT(vars.chat_gpt_token, vars.chat_gpt_model, prompt_token_budget=vars.prompt_token_budget,
+                         rate_limiter=self.openai_limiter, metrics=metrics, client=self.openai_client)
+            try:
+                review_pull_request(vars, ai, github, metrics)
+            finally:
+                metrics.write_report(vars.report_path)
+
+    def serve(self):
+        if not self.config.webhook_secret:
+            raise RuntimeError("WEBHOOK_SECRET must be set to serve webhooks")
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                status, message = server.handle_webhook(self.headers.get("X-GitHub-Event"), body,
+                                                        self.headers.get("X-Hub-Signature-256"))
+                self.__respond(status, {"message": message})
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/healthz":
+                    self.__respond(200, server.queue.stats())
+                else:
+                    self.__respond(404, {"message": "not found"})
+
+            def __respond(self, status, data):
+                payload = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        http_server = ThreadingHTTPServer((self.config.host, self.config.port), Handler)
+        self.start_workers()
+        Log.print_green(f"Listening for webhooks on {self.config.host}:{self.config.port}")
+        try:
+            http_server.serve_forever()
+        except KeyboardInterrupt:
+            Log.print_yellow("Shutting down, waiting for queued reviews...")
+        finally:
+            http_server.server_close()
+            self.stop()
+
+    def replay(self, payload_paths) -> int:
+        """Review các payload đã ghi lại (gộp như khi nhận qua webhook) rồi thoát; trả về số review lỗi."""
+        self.start_workers()
+        for path in payload_paths:
+            with open(path, "r", encoding="utf-8") as f:
+                status, message = self.submit(json.load(f))
+            Log.print_yellow(f"{path}: {status} {message}")
+        self.stop()
+        print(json.dumps({"results": self.results, **self.queue.stats()}, indent=2))
+        return sum(1 for result in self.results if result["error"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Webhook server mode for the AI PR reviewer.")
+    parser.add_argument("--replay", nargs="+", metavar="PAYLOAD",
+                        help="review recorded pull_request payloads and exit instead of serving")
+    args = parser.parse_args(argv)
+
+    server = ReviewServer()
+    if args.replay:
+        return 1 if server.replay(args.replay) else 0
+    if not server.config.webhook_secret:
+        Log.print_red("WEBHOOK_SECRET is not set, refusing to start: anyone reaching the server could trigger reviews.")
+        return 1
+    server.serve()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
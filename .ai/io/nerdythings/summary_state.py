@@ -0,0 +1,60 @@
+import json
+import re
+from typing import Dict, Optional
+from log import Log
+
+SUMMARY_STATE_PATTERN = re.compile(r"\n*<!-- AI REVIEW SUMMARY STATE (\{.*?\}) -->", re.DOTALL)
+BLOB_PREFIX_LENGTH = 12
+
+
+class SummaryState:
+    """Summary của từng file lưu ẩn trong PR body, kèm blob SHA mà summary được tạo từ đó.
+
+    `files` ánh xạ path -> {"b": prefix blob SHA, "s": summary}. File có blob ở
+    head trùng với blob đã lưu thì dùng lại summary, chỉ file có nội dung mới
+    mới cần gọi AI. Bảng summary trong PR body được render lại từ state này.
+    Entry không có blob (file bị xóa, file bị bỏ qua, lỗi) luôn được tính lại.
+    """
+
+    def __init__(self, files: Dict[str, dict] = None):
+        self.files = dict(files or {})
+
+    @staticmethod
+    def parse(body: str) -> Optional["SummaryState"]:
+        match = SUMMARY_STATE_PATTERN.search(body or "")
+        if not match:
+            return None
+        try:
+            data = json.loads(match.group(1))
+            return SummaryState(data.get("files"))
+        except (json.JSONDecodeError, AttributeError):
+            Log.print_yellow("Ignoring malformed summary state")
+            return None
+
+    def render(self) -> str:
+        # Giữ thứ tự file để bảng summary không bị đảo thứ tự giữa các lần chạy.
+        payload = json.dumps({"files": self.files}, separators=(",", ":"))
+        # "--" không được phép xuất hiện trong HTML comment.
+        payload = payload.replace("--", "-\\u002d")
+        return f"<!-- AI REVIEW SUMMARY STATE {payload} -->"
+
+    @staticmethod
+    def strip(body: str) -> str:
+        return SUMMARY_STATE_PATTERN.sub("", body or "")
+
+    def summary_for(self, path: str, blob: str) -> Optional[str]:
+        """Summary đã lưu nếu nó được tạo từ đúng nội dung `blob`, ngược lại None."""
+        entry = self.files.get(path) or {}
+        stored = entry.get("b")
+        if stored and blob and blob.startswith(stored):
+            return entry.get("s")
+        return None
+
+    def set(self, path: str, summary: str, blob: str = None):
+        entry = {"s": summary}
+        if blob:
+            entry["b"] = blob[:BLOB_PREFIX_LENGTH]
+        self.files[path] = entry
+
+    def summaries(self) -> Dict[str, str]:
+        return {path: entry.get("s", "") for path, entry in self.files.items()}
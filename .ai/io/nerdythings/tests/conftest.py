@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REVIEWER_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, os.path.join(REVIEWER_DIR, "benchmark"))
+sys.path.insert(0, REVIEWER_DIR)
+
+from diff_index import DiffIndex
+from fake_servers import FakeGitHub
+
+OWNER = "acme"
+REPO = "widgets"
+PULL_NUMBER = 7
+
+
+class CharTokenCounter:
+    """Ước lượng ~4 ký tự/token, không cần tokenizer (tiktoken tải encoding qua mạng)."""
+
+    def count(self, text: str) -> int:
+        return len(text) // 4
+
+
+def make_diff(path: str, hunks, old_blob: str = "1" * 40, new_blob: str = "2" * 40) -> str:
+    """Output giống `git diff --numstat --patch --full-index` cho một file; `hunks` là list (header, lines)."""
+    added = sum(1 for _, lines in hunks for line in lines if line.startswith("+"))
+    deleted = sum(1 for _, lines in hunks for line in lines if line.startswith("-"))
+    patch = [f"diff --git a/{path} b/{path}", f"index {old_blob}..{new_blob} 100644", f"--- a/{path}", f"+++ b/{path}"]
+    for header, lines in hunks:
+        patch.append(header)
+        patch.extend(lines)
+    return f"{added}\t{deleted}\t{path}\n" + "\n".join(patch) + "\n"
+
+
+def make_diff_index(*diffs, base: str = "base", head: str = "head") -> DiffIndex:
+    stats = "".join(diff.split("\n", 1)[0] + "\n" for diff in diffs)
+    patches = "".join(diff.split("\n", 1)[1] for diff in diffs)
+    return DiffIndex.parse(stats + patches, base, head)
+
+
+@pytest.fixture
+def fake_github():
+    server = FakeGitHub(OWNER, REPO, PULL_NUMBER).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def github(fake_github, monkeypatch):
+    from repository.github import GitHub
+    from rate_limiter import RateLimiter
+
+    monkeypatch.setenv("GITHUB_API_URL", fake_github.url)
+    return GitHub("test-token", OWNER, REPO, PULL_NUMBER, rate_limiter=RateLimiter("GitHub", rate=1000.0, burst=1000))
@@ -0,0 +1,84 @@
+import openai
+import pytest
+
+from ai.chat_gpt import ChatGPT
+from diff_chunker import DiffChunker
+from fake_servers import FakeOpenAI
+from github_reviewer import build_diff_data, run_bulk_review
+from metrics import Metrics
+from rate_limiter import RateLimiter
+from review_cache import ReviewCache
+from review_executor import ReviewJob
+from review_rules import ReviewRules
+from conftest import CharTokenCounter, make_diff, make_diff_index
+
+FILES = {
+    "src/first.py": ("@@ -5,2 +5,3 @@", [" a = 1", "+b = 2", " c = 3"]),
+    "lib/second.py": ("@@ -30,2 +30,3 @@", [" x = 1", "+y = 2", " z = 3"]),
+}
+
+CONTENTS = {"src/first.py": "a = 1\nb = 2\n", "lib/second.py": "x = 1\ny = 2\n"}
+
+
+@pytest.fixture
+def fake_openai():
+    server = FakeOpenAI(finding_rate=1.0).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def ai(fake_openai):
+    client = openai.OpenAI(api_key="test-key", base_url=f"{fake_openai.url}/v1", max_retries=0)
+    return ChatGPT("test-key", "gpt-4o-mini", rate_limiter=RateLimiter("OpenAI", rate=1000.0, burst=1000),
+                   client=client)
+
+
+def review_jobs():
+    diff_index = make_diff_index(*(make_diff(path, [hunk]) for path, hunk in FILES.items()))
+    jobs = []
+    chunks = DiffChunker(CharTokenCounter()).chunk(diff_index, list(FILES))
+    for chunk_number, chunk in enumerate(chunks):
+        [path] = chunk.files
+        content = "\n".join(f"line {number}" for number in range(1, 40))
+        jobs.append(ReviewJob(path, chunk_number, content, chunk.text, build_diff_data(chunk, chunk.line_numbers()),
+                              blob_sha=diff_index.get(path).new_blob, chunk=chunk,
+                              settings=ReviewRules().resolve(path)))
+    return jobs
+
+
+def comment_lines(job):
+    return [comment.line for comment in job.iter_comments()]
+
+
+def test_batch_results_are_matched_to_their_jobs_and_cached(fake_openai, ai, tmp_path):
+    jobs = review_jobs()
+    summaries, remaining = run_bulk_review(jobs, ai, ReviewCache(str(tmp_path), "gpt-4o-mini"), Metrics(),
+                                           file_contents=CONTENTS, poll_interval=0)
+
+    assert remaining == []
+    assert len(fake_openai.batches) == 1
+    # FakeOpenAI báo lỗi ở dòng đầu hunk + 3: mỗi job nhận đúng kết quả của request của nó.
+    assert [comment_lines(job) for job in jobs] == [[8], [33]]
+    assert summaries == {path: f"Updates computations in {path}." for path in CONTENTS}
+
+    # Lần chạy sau: cả hai kết quả lấy từ cache, không gửi batch mới.
+    jobs = review_jobs()
+    run_bulk_review(jobs, ai, ReviewCache(str(tmp_path), "gpt-4o-mini"), Metrics(), poll_interval=0)
+    assert len(fake_openai.batches) == 1
+    assert [comment_lines(job) for job in jobs] == [[8], [33]]
+
+
+def test_failed_batch_falls_back_to_interactive_requests(fake_openai, ai, tmp_path):
+    jobs = review_jobs()
+    metrics = Metrics()
+
+    # Hết giờ ngay lần poll đầu: batch bị hủy, mọi job được trả lại để review bằng request thường.
+    summaries, remaining = run_bulk_review(jobs, ai, ReviewCache(str(tmp_path), "gpt-4o-mini"), metrics,
+                                           file_contents=CONTENTS, timeout=-1, poll_interval=0)
+
+    assert remaining == jobs
+    assert fake_openai.batches["batch-1"]["status"] == "cancelled"
+    assert metrics.counters["batch_fallback_requests"] == 2
+    # Summary thiếu được lấy bằng request thường.
+    assert summaries == {path: f"Updates computations in {path}." for path in CONTENTS}
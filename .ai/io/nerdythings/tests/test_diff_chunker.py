@@ -0,0 +1,95 @@
+from diff_chunker import DiffChunker
+from diff_index import DiffHunk, DiffIndex, NULL_SHA
+from conftest import CharTokenCounter, make_diff, make_diff_index
+
+GIT_DIFF = """2\t1\tsrc/app.py
+1\t0\tsrc/new.py
+0\t3\tsrc/old.py
+-\t-\tassets/logo.png
+diff --git a/src/app.py b/src/app.py
+index 1111111111111111111111111111111111111111..2222222222222222222222222222222222222222 100644
+--- a/src/app.py
++++ b/src/app.py
+@@ -10,3 +10,4 @@ def main():
+ a = 1
+-b = 2
++b = 3
++c = 4
+ return a
+diff --git a/src/new.py b/src/new.py
+new file mode 100644
+index 0000000000000000000000000000000000000000..3333333333333333333333333333333333333333
+--- /dev/null
++++ b/src/new.py
+@@ -0,0 +1 @@
++print("new")
+diff --git a/src/old.py b/src/old.py
+deleted file mode 100644
+index 4444444444444444444444444444444444444444..0000000000000000000000000000000000000000
+--- a/src/old.py
++++ /dev/null
+@@ -1,3 +0,0 @@
+-x = 1
+-y = 2
+-z = 3
+diff --git a/assets/logo.png b/assets/logo.png
+index 5555555555555555555555555555555555555555..6666666666666666666666666666666666666666 100644
+Binary files a/assets/logo.png and b/assets/logo.png differ
+"""
+
+
+def test_diff_index_parses_files_hunks_and_blobs():
+    index = DiffIndex.parse(GIT_DIFF, "base", "head")
+
+    assert index.paths() == ["src/app.py", "src/new.py", "src/old.py", "assets/logo.png"]
+    app = index.get("src/app.py")
+    assert (app.added, app.deleted) == (2, 1)
+    assert (app.old_blob, app.new_blob) == ("1" * 40, "2" * 40)
+    [hunk] = app.hunks
+    assert (hunk.old_start, hunk.old_count, hunk.new_start, hunk.new_count) == (10, 3, 10, 4)
+    assert hunk.added_lines() == [(11, "b = 3"), (12, "c = 4")]
+    assert app.find_hunk(13) is hunk and app.find_hunk(14) is None
+
+    assert index.get("src/new.py").is_new
+    assert index.get("src/new.py").hunks[0].new_count == 1
+    assert index.get("src/old.py").is_deleted
+    assert index.get("src/old.py").new_blob == NULL_SHA
+    logo = index.get("assets/logo.png")
+    assert logo.binary and logo.hunks == []
+    assert index.diff_text("src/app.py").startswith("diff --git a/src/app.py b/src/app.py\n")
+
+
+def test_split_hunk_keeps_line_numbers_consistent():
+    hunk = DiffHunk("@@ -1,6 +1,7 @@", 1, 6, 1, 7)
+    hunk.lines = [" a", "-b", "+B", "+C", " d", " e", "-f", "+F", " g"]
+
+    pieces = DiffChunker(CharTokenCounter(), max_hunk_lines=4).split_hunk(hunk)
+
+    assert [piece.lines for piece in pieces] == [hunk.lines[0:4], hunk.lines[4:8], hunk.lines[8:]]
+    assert [piece.header for piece in pieces] == ["@@ -1,2 +1,3 @@", "@@ -3,3 +4,3 @@", "@@ -6,1 +7,1 @@"]
+    assert sum(piece.new_count for piece in pieces) == hunk.new_count
+
+
+def test_chunk_packs_small_hunks_and_splits_by_directory_and_budget():
+    small = [" context", "+added"]
+    diff_index = make_diff_index(
+        make_diff("pkg/a.py", [("@@ -1,1 +1,2 @@", small), ("@@ -20,1 +21,2 @@", small)]),
+        make_diff("pkg/b.py", [("@@ -1,1 +1,2 @@", small)]),
+        make_diff("other/c.py", [("@@ -1,1 +1,2 @@", small)]),
+        make_diff("pkg/gone.py", [("@@ -1,1 +0,0 @@", ["-removed"])], new_blob=NULL_SHA),
+    )
+    files = ["pkg/a.py", "pkg/b.py", "other/c.py", "pkg/gone.py"]
+
+    chunks = DiffChunker(CharTokenCounter(), target_tokens=1000).chunk(diff_index, files)
+    assert [chunk.files for chunk in chunks] == [["pkg/a.py", "pkg/b.py"], ["other/c.py"]]
+    assert chunks[0].line_numbers("pkg/a.py") == "1-2, 21-22"
+    assert chunks[0].locate(21, "pkg/a.py").hunk.new_start == 21
+    assert chunks[0].locate(1, "see pkg/b.py").path == "pkg/b.py"
+
+    # Ngân sách token chỉ đủ cho một hunk mỗi request.
+    chunks = DiffChunker(CharTokenCounter(), target_tokens=5).chunk(diff_index, files)
+    assert [len(chunk.pieces) for chunk in chunks] == [1, 1, 1, 1]
+
+    # group_key khác nhau thì không gom chung, kể cả cùng thư mục.
+    chunks = DiffChunker(CharTokenCounter()).chunk(diff_index, files, group_key=lambda path: path)
+    assert [chunk.files for chunk in chunks] == [["pkg/a.py"], ["pkg/b.py"], ["other/c.py"]]
@@ -0,0 +1,37 @@
+import openai
+
+from ai.ai_bot import AiBot
+from ai.prompts import REVIEW_MULTI_FILE_NOTE
+from fake_servers import FakeOpenAI
+
+DIFF = "diff --git a/src/app.py b/src/app.py\n--- a/src/app.py\n+++ b/src/app.py\n@@ -8,3 +10,5 @@\n a\n+b\n"
+
+
+def review(messages):
+    server = FakeOpenAI(finding_rate=1.0).start()
+    try:
+        client = openai.OpenAI(api_key="test-key", base_url=f"{server.url}/v1", max_retries=0)
+        response = client.chat.completions.create(model="gpt-4o-mini", messages=messages)
+        return response.choices[0].message.content
+    finally:
+        server.stop()
+
+
+def test_fake_review_follows_the_prompt_format():
+    system = AiBot.review_instructions()
+    text = review([{"role": "system", "content": system}, {"role": "user", "content": DIFF}])
+
+    [comment] = AiBot.split_ai_response(text, DIFF, file_path="src/app.py")
+    assert comment.line == 13
+    assert comment.severity == "Warning"
+    assert comment.issue_type == "Performance"
+    assert comment.suggested_fix == "+value = compute_cached(...)"
+
+
+def test_fake_multi_file_review_names_the_file():
+    text = review([{"role": "user", "content": DIFF + REVIEW_MULTI_FILE_NOTE}])
+
+    resolved = []
+    AiBot.split_ai_response(text, DIFF, resolve_path=lambda entry, line: resolved.append(line) or "src/app.py")
+    assert "src/app.py:13: value = compute_fast(...)" in text
+    assert resolved == [13]
@@ -0,0 +1,65 @@
+from ai.line_comment import LineComment
+from comment_index import CommentIndex
+from finding_reconciler import FindingReconciler, CREATE, UPDATE, KEEP
+
+PATH = "app/service.py"
+HUNK = "@@ -1,3 +1,4 @@\n def load(path):\n+    data = open(path).read()\n     return parse(data)\n"
+FILE = "def load(path):\n    data = open(path).read()\n    return parse(data)\n"
+EDITED_FILE = "def load(path):\n    with open(path) as f:\n        return parse(f.read())\n"
+
+
+def finding(line=2, severity="Error", description="File handle is never closed.", issue_type="Resource Leak"):
+    return LineComment(line=line, path=PATH, text=f"[ERROR] - [{severity}] - [{issue_type}] - {description}",
+                       issue_type=issue_type, severity=severity, description=description)
+
+
+def new_run(github, files):
+    index = CommentIndex(github)
+    return index, FindingReconciler(index, files.get)
+
+
+def post(index, reconciler, comment):
+    fingerprint = reconciler.fingerprint(PATH, HUNK, comment)
+    action, ref = reconciler.classify(fingerprint, comment.text)
+    if action == CREATE:
+        index.post(fingerprint.embed(comment.text))
+    elif action == UPDATE:
+        index.update_fingerprinted(ref, fingerprint.embed(comment.text))
+    return action
+
+
+def test_create_keep_update_and_delete(fake_github, github):
+    index, reconciler = new_run(github, {PATH: FILE})
+    assert post(index, reconciler, finding()) == CREATE
+    assert reconciler.delete_stale() == 0
+    assert len(fake_github.issue_comments) == 1
+
+    # Cùng finding được viết lại gần giống: giữ nguyên comment.
+    index, reconciler = new_run(github, {PATH: FILE})
+    assert post(index, reconciler, finding(description="The file handle is never closed.")) == KEEP
+    assert reconciler.delete_stale() == 0
+
+    # Severity đổi: sửa comment tại chỗ.
+    index, reconciler = new_run(github, {PATH: FILE})
+    assert post(index, reconciler, finding(severity="Critical")) == UPDATE
+    assert len(fake_github.issue_comments) == 1
+    assert "[Critical]" in fake_github.issue_comments[0]["body"]
+
+    # Code của finding đã bị sửa và model không còn báo lỗi: comment lỗi thời bị xóa.
+    index, reconciler = new_run(github, {PATH: EDITED_FILE})
+    assert reconciler.delete_stale() == 1
+    assert fake_github.issue_comments == []
+
+
+def test_finding_without_line_is_anchored_on_its_hunk(fake_github, github):
+    index, reconciler = new_run(github, {PATH: FILE})
+    assert post(index, reconciler, finding(line=None)) == CREATE
+    assert reconciler.stale() == []
+
+    # Hunk vẫn còn nguyên trong file: không xóa.
+    index, reconciler = new_run(github, {PATH: FILE})
+    assert reconciler.delete_stale() == 0
+
+    index, reconciler = new_run(github, {PATH: EDITED_FILE})
+    assert reconciler.delete_stale() == 1
+    assert fake_github.issue_comments == []
@@ -0,0 +1,73 @@
+import subprocess
+from types import SimpleNamespace
+
+from comment_index import CommentIndex
+from git_utils import GitUtils
+from github_reviewer import OWNER_COMMENT_MAX_SHARDS, owner_comment_scope, post_or_update_owner_comment
+from owner_comment import owner_comment_identifier
+from review_rules import ReviewRules
+
+PATCH_COMMENT = "PATCH /repos/acme/widgets/issues/comments/:id"
+POST_COMMENT = "POST /repos/acme/widgets/issues/:id/comments"
+
+
+def new_index(github):
+    return CommentIndex(github, identifiers=[owner_comment_identifier(n) for n in range(1, OWNER_COMMENT_MAX_SHARDS + 1)])
+
+
+def shards(*texts):
+    return [f"{owner_comment_identifier(number)}\n{text}\n" for number, text in enumerate(texts, start=1)]
+
+
+def test_unchanged_shards_are_not_updated(fake_github, github):
+    post_or_update_owner_comment(new_index(github), shards("files a", "files b"))
+    assert fake_github.calls[POST_COMMENT] == 2
+
+    post_or_update_owner_comment(new_index(github), shards("files a", "files b"))
+    assert fake_github.calls[POST_COMMENT] == 2
+    assert fake_github.calls[PATCH_COMMENT] == 0
+
+
+def test_changed_and_removed_shards_are_updated_once(fake_github, github):
+    post_or_update_owner_comment(new_index(github), shards("files a", "files b"))
+
+    post_or_update_owner_comment(new_index(github), shards("files a2"))
+    assert fake_github.calls[PATCH_COMMENT] == 2
+    assert "_No further changes._" in fake_github.issue_comments[1]["body"]
+
+    post_or_update_owner_comment(new_index(github), shards("files a2"))
+    assert fake_github.calls[PATCH_COMMENT] == 2
+
+
+def git(repo, *args):
+    return subprocess.run(["git", "-C", str(repo), *args], check=True, capture_output=True, text=True).stdout.strip()
+
+
+def commit_file(repo, path, text):
+    (repo / path).write_text(text)
+    git(repo, "add", path)
+    git(repo, "commit", "-q", "-m", f"edit {path}")
+    return git(repo, "rev-parse", "HEAD")
+
+
+def test_incremental_run_renders_owner_comment_from_whole_pull_request(tmp_path, monkeypatch):
+    git(tmp_path, "init", "-q")
+    git(tmp_path, "config", "user.email", "test@example.com")
+    git(tmp_path, "config", "user.name", "test")
+    pr_base = commit_file(tmp_path, "README.md", "base\n")
+    before = commit_file(tmp_path, "first.py", "print(1)\n")
+    after = commit_file(tmp_path, "second.py", "print(2)\n")
+    monkeypatch.chdir(tmp_path)
+
+    vars = SimpleNamespace(pr_base_sha=pr_base, base_ref=before, head_ref=after, skip_patterns=[])
+    diff_index = GitUtils.get_diff_index(base_ref=before, head_ref=after)
+    assert diff_index.paths() == ["second.py"]
+
+    files, owner_diff, collapsed = owner_comment_scope(
+        vars, before, False, diff_index, ["second.py"], {}, ReviewRules())
+    assert sorted(files) == ["first.py", "second.py"]
+    assert owner_diff.get("first.py") is not None
+    assert collapsed == {}
+
+    # Diff đã là toàn bộ PR (full review): không chạy lại git diff.
+    assert owner_comment_scope(vars, pr_base, True, diff_index, ["second.py"], {}, ReviewRules())[1] is diff_index
@@ -0,0 +1,53 @@
+import threading
+
+from review_server import PullRequestQueue
+
+
+def event(action, number=7, before=None, after=None):
+    payload = {"action": action, "pull_request": {"number": number, "base": {"repo": {
+        "owner": {"login": "acme"}, "name": "widgets"}}}}
+    if before:
+        payload.update(before=before, after=after)
+    return payload
+
+
+def test_events_of_the_same_pull_request_are_coalesced():
+    queue = PullRequestQueue(coalesce_seconds=0)
+    queue.put(event("synchronize", before="a", after="b"))
+    queue.put(event("synchronize", before="b", after="c"))
+    queue.put(event("synchronize", number=8, before="x", after="y"))
+
+    key, payload = queue.take()
+    assert key == ("acme", "widgets", 7)
+    # Diff phủ cả hai push: base của event đầu, head của event cuối.
+    assert (payload["before"], payload["after"]) == ("a", "c")
+    assert queue.take()[0] == ("acme", "widgets", 8)
+    assert queue.stats() == {"pending": 0, "running": 2, "coalesced": 1}
+
+
+def test_opened_action_survives_coalescing():
+    merged = PullRequestQueue.coalesce(event("opened"), event("synchronize", before="a", after="b"))
+    assert merged["action"] == "opened"
+    assert merged["after"] == "b"
+
+
+def test_pull_request_is_not_reviewed_twice_in_parallel():
+    queue = PullRequestQueue(coalesce_seconds=0)
+    queue.put(event("opened"))
+    key, _ = queue.take()
+
+    # Event tới khi PR đang được review chỉ được lấy ra sau `done`.
+    queue.put(event("synchronize", before="a", after="b"))
+    taken = []
+    worker = threading.Thread(target=lambda: taken.append(queue.take()))
+    worker.start()
+    worker.join(0.2)
+    assert worker.is_alive() and taken == []
+
+    queue.done(key)
+    worker.join(5)
+    assert taken[0][1]["after"] == "b"
+
+    queue.done(key)
+    queue.close()
+    assert queue.take() is None
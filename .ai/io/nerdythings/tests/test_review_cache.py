@@ -0,0 +1,73 @@
+import os
+
+from review_cache import ReviewCache
+
+HUNK = "@@ -10,2 +10,3 @@ def main():\n a = 1\n+b = 2\n c = 3\n"
+MOVED_HUNK = "diff --git a/x.py b/x.py\n--- a/x.py\n+++ b/x.py\n@@ -40,2 +40,3 @@ def main():  \n a = 1\n+b = 2  \n c = 3\n"
+RESPONSE = "###\n**[ERROR] - [Error] - [Bug] - Wrong value**\n\n**Lines:**\n```\n11: b = 2\n```\n"
+
+
+def counting(response):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return response
+    return compute, calls
+
+
+def test_normalized_hunk_ignores_file_header_position_and_trailing_whitespace():
+    assert ReviewCache.normalize_hunk(HUNK) == ReviewCache.normalize_hunk(MOVED_HUNK)
+    assert ReviewCache.hunk_offset(MOVED_HUNK) == 40
+    assert ReviewCache.shift_line_numbers(RESPONSE, 30).count("41: b = 2") == 1
+    assert ReviewCache.shift_line_numbers('{"findings": [{"start_line": 11, "end_line": 12}]}', 5) == \
+        '{"findings": [{"start_line": 16, "end_line": 17}]}'
+
+
+def test_same_hunk_at_another_offset_reuses_result_with_shifted_lines(tmp_path):
+    cache = ReviewCache(str(tmp_path), "model")
+    compute, calls = counting(RESPONSE)
+
+    assert cache.get_or_compute(HUNK, "blob-a", compute) == RESPONSE
+    assert "41: b = 2" in cache.get_or_compute(MOVED_HUNK, "blob-b", compute)
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_keys_separate_blob_variant_and_model_on_disk(tmp_path):
+    compute, calls = counting(RESPONSE)
+    ReviewCache(str(tmp_path), "model").get_or_compute(HUNK, "blob-a", compute)
+
+    # Run mới: chỉ entry trên đĩa với đúng blob, model và variant mới được dùng lại.
+    assert ReviewCache(str(tmp_path), "model").get(HUNK, "blob-a") == RESPONSE
+    assert ReviewCache(str(tmp_path), "model").get(HUNK, "blob-b") is None
+    assert ReviewCache(str(tmp_path), "model").get(HUNK, "blob-a", variant="security") is None
+    assert ReviewCache(str(tmp_path), "other-model").get(HUNK, "blob-a") is None
+
+    # Kết quả không cacheable (lỗi) không được ghi.
+    cache = ReviewCache(str(tmp_path), "model")
+    cache.get_or_compute(HUNK, "blob-c", lambda: "Error: timeout", cacheable=lambda response: False)
+    assert ReviewCache(str(tmp_path), "model").get(HUNK, "blob-c") is None
+    assert len(calls) == 1
+
+
+def cache_files(directory):
+    return {os.path.join(root, name) for root, _, names in os.walk(directory) for name in names}
+
+
+def test_prune_evicts_least_recently_used_entries(tmp_path):
+    cache = ReviewCache(str(tmp_path), "model")
+    hunks = [HUNK.replace("b = 2", f"b = {number}") for number in range(3)]
+    paths = []
+    for number, hunk in enumerate(hunks):
+        cache.put(hunk, "blob", RESPONSE)
+        [path] = cache_files(tmp_path) - set(paths)
+        os.utime(path, (1000 + number, 1000 + number))
+        paths.append(path)
+
+    # Entry cũ nhất được đọc lại ở run sau nên trở thành mới nhất.
+    assert ReviewCache(str(tmp_path), "model").get(hunks[0], "blob") == RESPONSE
+    cache.max_bytes = 2 * os.path.getsize(paths[0])
+    cache.prune()
+
+    assert [os.path.exists(path) for path in paths] == [True, False, True]
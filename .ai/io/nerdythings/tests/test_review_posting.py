@@ -0,0 +1,109 @@
+from ai.ai_bot import AiBot
+from comment_index import CommentIndex
+from diff_chunker import DiffChunker
+from finding_reconciler import FindingReconciler
+from review_executor import ReviewJob
+from github_reviewer import post_review_batch
+from conftest import CharTokenCounter, make_diff, make_diff_index
+
+# Response đúng theo "Output Format" của CHAT_GPT_ASK_LONG.
+PROMPT_FORMAT_RESPONSE = """###
+**[ERROR] - [Warning] - [Security] - SQL query is built from user input**
+
+**Lines:**
+```
+42: query = "SELECT * FROM users WHERE id=" + user_id
+```
+
+**:interrobang: Explanation:**
+The value is concatenated into the query, which allows SQL injection.
+
+** :white_check_mark: Suggested Fix (if applicable):**
+```diff
++query = "SELECT * FROM users WHERE id=%s"
+```
+"""
+
+FILE_LINES = [f"line {number}" for number in range(1, 60)]
+FILE_LINES[41] = 'query = "SELECT * FROM users WHERE id=" + user_id'
+
+
+POST_REVIEW = "POST /repos/acme/widgets/pulls/:id/reviews"
+PUT_REVIEW = "PUT /repos/acme/widgets/pulls/:id/reviews/:id"
+
+
+def review_job(diff_index, path, response=PROMPT_FORMAT_RESPONSE):
+    chunk = DiffChunker(CharTokenCounter()).chunk(diff_index, [path])[0]
+    job = ReviewJob(path, 0, "\n".join(FILE_LINES), chunk.text, {}, chunk=chunk)
+    for comment in AiBot.split_ai_response(response, chunk.text, file_path=path):
+        job.emit(comment)
+    job.close()
+    return job
+
+
+def test_parse_prompt_format():
+    comments = AiBot.split_ai_response(PROMPT_FORMAT_RESPONSE, "", file_path="app/db.py")
+
+    assert len(comments) == 1
+    comment = comments[0]
+    assert comment.line == 42
+    assert comment.severity == "Warning"
+    assert comment.issue_type == "Security"
+    assert comment.description == "SQL query is built from user input"
+    assert comment.suggested_fix == '+query = "SELECT * FROM users WHERE id=%s"'
+
+
+def test_prompt_format_finding_is_posted_inline(fake_github, github):
+    path = "app/db.py"
+    diff_index = make_diff_index(make_diff(path, [
+        ("@@ -40,3 +40,4 @@", [" line 40", " line 41", '+query = "SELECT * FROM users WHERE id=" + user_id', " line 43"]),
+    ]))
+    comment_index = CommentIndex(github, include_review_comments=True)
+    reconciler = FindingReconciler(comment_index, lambda _: "\n".join(FILE_LINES))
+
+    post_review_batch([review_job(diff_index, path)], github, comment_index, diff_index, "head", reconciler)
+
+    assert fake_github.calls[POST_REVIEW] == 1
+    assert fake_github.issue_comments == []
+    [inline] = fake_github.review_comments
+    assert inline["path"] == path
+    assert inline["line"] == 42
+
+
+def test_unanchored_finding_goes_into_the_review_body(fake_github, github):
+    path = "app/db.py"
+    # Dòng 42 không nằm trong hunk nào: finding không gắn được vào dòng.
+    diff_index = make_diff_index(make_diff(path, [("@@ -10,2 +10,3 @@", [" line 10", "+line 11", " line 12"])]))
+    file_lines = list(FILE_LINES)
+
+    def run(response=PROMPT_FORMAT_RESPONSE):
+        comment_index = CommentIndex(github, include_review_comments=True)
+        reconciler = FindingReconciler(comment_index, lambda _: "\n".join(file_lines))
+        jobs = [review_job(diff_index, path, response)] if response else []
+        post_review_batch(jobs, github, comment_index, diff_index, "head", reconciler)
+        reconciler.delete_stale()
+
+    run()
+    assert fake_github.calls[POST_REVIEW] == 1
+    assert fake_github.issue_comments == [] and fake_github.review_comments == []
+    [review] = fake_github.reviews
+    assert "SQL query is built from user input" in review["body"]
+    assert "AI REVIEW FINGERPRINT" in review["body"]
+
+    # Lần chạy sau nhận ra finding trong body của review: không gửi lại.
+    run()
+    assert fake_github.calls[POST_REVIEW] == 1
+    assert fake_github.calls[PUT_REVIEW] == 0
+
+    # Severity đổi: sửa section đó trong body của review.
+    run(PROMPT_FORMAT_RESPONSE.replace("[Warning]", "[Critical]"))
+    assert fake_github.calls[POST_REVIEW] == 1
+    assert fake_github.calls[PUT_REVIEW] == 1
+    assert "[Critical]" in fake_github.reviews[0]["body"]
+
+    # Code của finding đã bị sửa: finding được gỡ khỏi body.
+    file_lines[41] = "query = build_query(user_id)"
+    run(response=None)
+    assert fake_github.calls[PUT_REVIEW] == 2
+    assert "SQL query" not in fake_github.reviews[0]["body"]
+    assert "AI REVIEW FINGERPRINT" not in fake_github.reviews[0]["body"]
@@ -0,0 +1,51 @@
+from ai.ai_bot import AiBot
+from ai.stream_parser import ReviewStreamParser
+
+FINDING = """**[ERROR] - [{severity}] - [Logic] - {description}**
+
+**Lines:**
+```
+{line}: value = compute()
+```
+
+**:interrobang: Explanation:**
+Explanation of {description}.
+"""
+
+RESPONSE = "###\n" + FINDING.format(severity="Warning", description="first issue", line=12) \
+           + "###\n" + FINDING.format(severity="Critical", description="second issue", line=30)
+
+
+def feed_in_pieces(parser, text, size):
+    """Trả về (entries nhận được trước khi stream kết thúc, tất cả entries)."""
+    streamed = []
+    for offset in range(0, len(text), size):
+        streamed.extend(parser.feed(text[offset:offset + size]))
+    return streamed, streamed + parser.finish()
+
+
+def test_entries_are_emitted_before_the_stream_ends():
+    streamed, entries = feed_in_pieces(ReviewStreamParser(), RESPONSE, 7)
+
+    # Finding đầu tiên hoàn chỉnh ngay khi dấu `###` thứ hai tới.
+    assert [entry for _, entry in streamed if entry.strip()] == [RESPONSE.split("###")[1]]
+    comments = [AiBot.parse_entry(entry, index, file_path="a.py") for index, entry in entries]
+    comments = [comment for comment in comments if comment]
+    assert [(comment.line, comment.severity) for comment in comments] == [(12, "Warning"), (30, "Critical")]
+
+
+def test_separator_split_across_chunks():
+    parser = ReviewStreamParser()
+    first_end = RESPONSE.index("###", 3)
+
+    assert parser.feed(RESPONSE[:first_end + 1]) == [(0, "")]  # chỉ mới có "#" của dấu thứ hai
+    assert parser.feed(RESPONSE[first_end + 1:first_end + 2]) == []
+    assert parser.feed(RESPONSE[first_end + 2:]) == [(1, RESPONSE[3:first_end])]
+    assert parser.finish() == [(2, RESPONSE[first_end + 3:])]
+
+
+def test_every_piece_size_gives_the_same_entries():
+    expected = RESPONSE.split("###")
+    for size in range(1, 12):
+        _, entries = feed_in_pieces(ReviewStreamParser(), RESPONSE, size)
+        assert [entry for _, entry in entries] == expected